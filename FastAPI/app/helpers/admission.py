@@ -0,0 +1,136 @@
+"""
+This module provides admission control for the route groups backed by the
+threadpool and the database.
+
+Each group (employees, projects, tasks, batch) admits at most `concurrency` requests
+at a time. Requests beyond that wait in a bounded queue, in arrival order, for
+at most `queue_timeout` seconds. When the queue is full or the wait times out,
+the request is rejected right away with a 503 and a `Retry-After` header, so
+an overload sheds the excess load instead of making every request slow.
+
+The limits are read from the environment, per group with a fallback to the
+global value: e.g. `ADMISSION_TASKS_CONCURRENCY`, then `ADMISSION_CONCURRENCY`.
+"""
+
+import asyncio
+import os
+from collections import deque
+
+from fastapi import HTTPException, status
+
+# Seconds clients are told to wait before retrying a rejected request
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+
+def _setting(group: str, name: str, default: str):
+    value = os.getenv(f"ADMISSION_{group.upper()}_{name}")
+    return value if value is not None else os.getenv(f"ADMISSION_{name}", default)
+
+
+class AdmissionLimiter:
+    """
+    Concurrency limiter used as a route dependency.
+
+    The slot is taken before the route runs and released once it returns.
+    All the bookkeeping happens on the event loop, so no lock is needed.
+
+    Methods:
+        __call__()
+            Dependency waiting for a slot, or rejecting the request with a 503.
+
+        stats()
+            Returns the limits, current load and counters of the limiter.
+    """
+    def __init__(self, group: str):
+        self.group = group
+        self.concurrency = int(_setting(group, "CONCURRENCY", "12"))
+        self.max_queue = int(_setting(group, "QUEUE", "50"))
+        self.queue_timeout = float(_setting(group, "QUEUE_TIMEOUT", "1"))
+        self._active = 0
+        self._waiters = deque()
+        self._stats = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "max_queue_depth": 0,
+        }
+
+    async def __call__(self):
+        await self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self):
+        if self._active < self.concurrency and not self._waiters:
+            self._active += 1
+            self._stats["admitted"] += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._stats["rejected_queue_full"] += 1
+            self._reject("Server busy, retry later")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._stats["queued"] += 1
+        self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._waiters))
+        try:
+            await asyncio.wait([waiter], timeout=self.queue_timeout)
+        except BaseException:
+            # The client went away: free the slot or the place in the queue
+            if waiter.done():
+                self._release()
+            else:
+                self._leave(waiter)
+            raise
+        if not waiter.done():
+            self._leave(waiter)
+            self._stats["rejected_timeout"] += 1
+            self._reject("Server busy, timed out waiting for a slot")
+        self._stats["admitted"] += 1
+
+    def _leave(self, waiter):
+        waiter.cancel()
+        self._waiters.remove(waiter)
+
+    def _release(self):
+        # Hand the slot over to the oldest waiter, if any
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    @staticmethod
+    def _reject(detail: str):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER)},
+        )
+
+    def stats(self):
+        """
+        Returns the limits, current load and counters of the limiter.
+
+        :return: The configured limits, the requests running (`active`) and
+                 waiting (`queue_depth`), and the admitted, queued and
+                 rejected totals.
+        """
+        return dict(
+            self._stats,
+            concurrency=self.concurrency,
+            max_queue=self.max_queue,
+            queue_timeout=self.queue_timeout,
+            active=self._active,
+            queue_depth=len(self._waiters),
+        )
+
+
+# One limiter per route group
+admission_limiters = {
+    group: AdmissionLimiter(group) for group in ("employees", "projects", "tasks", "batch")
+}
@@ -0,0 +1,65 @@
+"""
+This module provides the base class of the services that run a loop in a
+background thread started and stopped with the application.
+"""
+
+import threading
+from abc import ABC, abstractmethod
+
+
+class BackgroundThread(ABC):
+    """
+    Daemon thread running `_work()` until `stop()` is called.
+
+    Subclasses must implement `_work()`, or they cannot be created. It loops
+    while `_stopping` is not set, sleeping with `_wakeup.wait(...)` so that
+    `wake()` and `stop()` interrupt the pause right away.
+
+    Methods:
+        start()
+            Starts the thread.
+
+        stop(timeout: float)
+            Asks the loop to stop and waits for the thread.
+
+        wake()
+            Interrupts the current pause of the loop.
+    """
+    thread_name = "background"
+
+    def __init__(self):
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the thread.
+        """
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._work, name=self.thread_name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Asks the loop to stop and waits for the thread.
+
+        :param timeout: Maximum time to wait for the thread, in seconds.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wake(self):
+        """
+        Interrupts the current pause of the loop.
+        """
+        self._wakeup.set()
+
+    @abstractmethod
+    def _work(self):
+        """
+        Runs the loop of the thread, until `_stopping` is set.
+        """
@@ -0,0 +1,81 @@
+"""
+This module provides helpers to fetch several rows by ID in a single round trip.
+
+Clients send the IDs as a comma-separated list (e.g. `?ids=1,2,3`). The rows are
+loaded with `WHERE id IN (...)` queries, split in chunks so large lists stay under
+the database parameter limits, and returned in the order they were requested.
+"""
+
+from fastapi import HTTPException, status
+from peewee import chunked
+
+# Maximum number of IDs accepted in one request
+MAX_IDS = 1000
+
+# Maximum number of IDs sent in a single IN (...) clause
+CHUNK_SIZE = 500
+
+
+def parse_ids(ids: str):
+    """
+    Parses a comma-separated list of IDs, dropping duplicates but keeping the order.
+
+    :param ids: The raw value of the `ids` query parameter.
+    :return: The list of unique IDs, in request order.
+    :raises HTTPException: 400 if an ID is not an integer or there are too many IDs.
+    """
+    try:
+        parsed = [int(value) for value in ids.split(",") if value.strip()]
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ids must be a comma-separated list of integers",
+        ) from exc
+
+    unique_ids = list(dict.fromkeys(parsed))
+    if len(unique_ids) > MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A maximum of {MAX_IDS} ids can be requested at once",
+        )
+    return unique_ids
+
+
+def get_by_ids(model, ids, query=None):
+    """
+    Fetches the rows of `model` matching the given IDs.
+
+    :param model: The Peewee model to query.
+    :param ids: The IDs to fetch, in the order they should be returned.
+    :param query: Optional base select query (defaults to `model.select()`).
+    :return: A dict with the found rows in request order (`results`) and the
+             IDs that do not exist (`not_found`).
+    """
+    if query is None:
+        query = model.select()
+
+    rows = {}
+    for chunk in chunked(ids, CHUNK_SIZE):
+        for row in query.where(model.id.in_(chunk)):
+            rows[row.id] = row
+
+    return {
+        "results": [rows[row_id] for row_id in ids if row_id in rows],
+        "not_found": [row_id for row_id in ids if row_id not in rows],
+    }
+
+
+def merge_found(ids, found: list):
+    """
+    Combines the results of `get_by_ids` run on several shards.
+
+    :param ids: The IDs requested, in the order they should be returned.
+    :param found: The `get_by_ids` results of each shard.
+    :return: A dict with the found rows in request order (`results`) and the
+             IDs found in none of the shards (`not_found`).
+    """
+    rows = {row.id: row for result in found for row in result["results"]}
+    return {
+        "results": [rows[row_id] for row_id in ids if row_id in rows],
+        "not_found": [row_id for row_id in ids if row_id not in rows],
+    }
@@ -0,0 +1,43 @@
+"""
+This module provides fast bulk inserts for the CSV imports and the seeding tool.
+
+Rows are written with a single prepared INSERT run through `executemany`.
+Building the statement once per batch avoids the cost of the query builder
+rendering one placeholder per value, which dominates `insert_many` on large
+batches.
+"""
+
+
+def insert_values(model, fields: list, values):
+    """
+    Inserts rows whose values are already in their database representation.
+
+    :param model: The Peewee model of the table.
+    :param fields: The fields being written, in the order of the values.
+    :param values: An iterable of tuples, one per row.
+    """
+    # pylint: disable=protected-access
+    database = model._meta.database  # The current shard, for the sharded models
+    open_quote, close_quote = database.quote
+    columns = ", ".join(f"{open_quote}{field.column_name}{close_quote}" for field in fields)
+    placeholders = ", ".join([database.param] * len(fields))
+    table = f"{open_quote}{model._meta.table_name}{close_quote}"
+    database.cursor().executemany(
+        f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", values
+    )
+
+
+def insert_rows(model, rows: list):
+    """
+    Inserts many rows given as dicts, converting each value with its field.
+
+    :param model: The Peewee model of the table.
+    :param rows: The rows to insert, as dicts sharing the same keys.
+    """
+    names = list(rows[0])
+    fields = [getattr(model, name) for name in names]
+    insert_values(
+        model,
+        fields,
+        [tuple(field.db_value(row[name]) for field, name in zip(fields, names)) for row in rows],
+    )
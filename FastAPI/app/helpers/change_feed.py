@@ -0,0 +1,196 @@
+"""
+This module provides the in-process publish/subscribe used by the change feeds
+(`GET /tasks/changes`, `GET /projects/changes`).
+
+Services publish an event after each committed write; inside `deferred()`
+the events wait for the end of the enclosing transaction. Every topic keeps the
+last events in a bounded replay buffer, so a client that reconnects with the
+`Last-Event-ID` header receives what it missed. Each subscriber has a bounded
+queue: a consumer too slow to keep up is disconnected instead of making the
+server buffer without limit, and it resumes from its last event on reconnect.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Number of events kept per topic for clients resuming with Last-Event-ID
+REPLAY_SIZE = int(os.getenv("CHANGE_FEED_REPLAY_SIZE", "1000"))
+
+# Number of events a subscriber may have pending before it is disconnected
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("CHANGE_FEED_QUEUE_SIZE", "100"))
+
+# Seconds between keep-alive comments on idle streams
+KEEPALIVE_INTERVAL = 15
+
+
+class _Subscription:
+    """
+    A client connected to a topic, fed from any thread through its event loop.
+    """
+    def __init__(self, loop, project_id):
+        self.loop = loop
+        self.project_id = project_id
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def wants(self, event: dict):
+        """
+        Tells whether the event matches the project filter of the subscriber.
+        """
+        return self.project_id is None or self.project_id in event["project_ids"]
+
+    def offer(self, event: dict):
+        """
+        Queues an event without blocking; must run on the subscriber's loop.
+        """
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            # Make room for the marker that ends the stream
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class ChangeFeed:
+    """
+    Publish/subscribe hub with a bounded replay buffer per topic.
+
+    Event IDs start from the current time in milliseconds, so they keep
+    increasing across restarts and a stale `Last-Event-ID` is detected.
+
+    Methods:
+        publish(topic: str, action: str, data: dict, project_ids: list)
+            Sends an event to the subscribers of a topic.
+
+        deferred()
+            Holds the events published in a block until it completes.
+
+        stream(request, topic: str, last_event_id: str, project_id: int)
+            Async generator producing the Server-Sent Events of a client.
+    """
+    def __init__(self, replay_size: int = REPLAY_SIZE):
+        self._lock = threading.Lock()
+        self._next_id = int(time.time() * 1000)
+        self._replay_size = replay_size
+        self._buffers = {}
+        self._subscribers = {}
+        # Events held by `deferred` for the current context
+        self._pending = ContextVar("change_feed_pending", default=None)
+
+    def publish(self, topic: str, action: str, data: dict, project_ids: list):
+        """
+        Sends an event to the subscribers of a topic. Safe to call from any thread.
+
+        :param topic: The topic of the event ("tasks" or "projects").
+        :param action: What happened ("created", "updated", "deleted"...).
+        :param data: The JSON serializable payload of the event.
+        :param project_ids: The projects the event relates to, used by the filters.
+        """
+        pending = self._pending.get()
+        if pending is not None:
+            pending.append((topic, action, data, project_ids))
+            return
+        with self._lock:
+            self._next_id += 1
+            event = {
+                "id": self._next_id,
+                "action": action,
+                "data": data,
+                "project_ids": set(project_ids),
+            }
+            buffer = self._buffers.setdefault(topic, deque(maxlen=self._replay_size))
+            buffer.append(event)
+            subscribers = list(self._subscribers.get(topic, ()))
+
+        for subscriber in subscribers:
+            if subscriber.wants(event):
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, event)
+
+    @contextmanager
+    def deferred(self):
+        """
+        Holds the events published in the block, in the current context, and
+        sends them once it completes. They are dropped if the block raises, so
+        subscribers never see the writes of a rolled back transaction.
+        """
+        pending = []
+        token = self._pending.set(pending)
+        try:
+            yield
+        finally:
+            self._pending.reset(token)
+        for event in pending:
+            self.publish(*event)
+
+    def _subscribe(self, topic: str, last_event_id, project_id):
+        subscriber = _Subscription(asyncio.get_running_loop(), project_id)
+        with self._lock:
+            self._subscribers.setdefault(topic, set()).add(subscriber)
+            buffer = list(self._buffers.get(topic, ()))
+
+        if last_event_id is None:
+            return subscriber, [], False
+        oldest = buffer[0]["id"] if buffer else self._next_id + 1
+        # The client missed events that are no longer buffered: it has to
+        # reload everything, so there is no point in replaying the buffer
+        if last_event_id < oldest - 1 or last_event_id > self._next_id:
+            return subscriber, [], True
+        missed = [event for event in buffer if event["id"] > last_event_id]
+        return subscriber, [event for event in missed if subscriber.wants(event)], False
+
+    def _unsubscribe(self, topic: str, subscriber: _Subscription):
+        with self._lock:
+            self._subscribers.get(topic, set()).discard(subscriber)
+
+    async def stream(self, request, topic: str, last_event_id=None, project_id=None):
+        """
+        Produces the Server-Sent Events of a client until it disconnects.
+
+        A "reset" event tells the client that events were lost (its resume
+        point is no longer buffered) and that it must reload its data.
+
+        :param request: The Starlette request, used to detect disconnections.
+        :param topic: The topic to follow.
+        :param last_event_id: The value of the `Last-Event-ID` header, if any.
+        :param project_id: Only send the events of this project, if given.
+        """
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = 0
+        subscriber, missed, reset = self._subscribe(topic, last_event_id, project_id)
+        try:
+            yield "retry: 3000\n\n"
+            if reset:
+                yield self._format({"id": self._next_id, "action": "reset", "data": {}})
+            for event in missed:
+                yield self._format(event)
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    # Too slow: drop the client, it will resume from its last event
+                    break
+                yield self._format(event)
+        finally:
+            self._unsubscribe(topic, subscriber)
+
+    @staticmethod
+    def _format(event: dict):
+        data = json.dumps(event["data"], default=str)
+        return f"id: {event['id']}\nevent: {event['action']}\ndata: {data}\n\n"
+
+
+change_feed = ChangeFeed()
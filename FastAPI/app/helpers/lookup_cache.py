@@ -0,0 +1,100 @@
+"""
+This module provides a bounded cache of the row IDs found by a lookup on
+another unique key, e.g. the employee ID of an email address.
+
+The cache only saves the lookup by that key: callers read the row by its ID
+(a primary key point query) and check it still has the key, since another
+process may have changed or deleted it. The services drop the entry of a row
+they change or delete, and the least recently used entries are evicted once
+the cache is full. Misses are not cached, so a new row needs no invalidation.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class LookupCache:
+    """
+    Thread-safe map of lookup keys to row IDs, evicting the least recently used.
+
+    Methods:
+        get(key)
+            Returns the ID cached for a key, or None.
+
+        put(key, row_id)
+            Caches the ID found for a key.
+
+        invalidate(row_id)
+            Drops the entry of a row.
+
+        stats()
+            Returns the size of the cache and its hits, misses and invalidations.
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._ids = OrderedDict()
+        # Key of each cached row, to drop it by ID
+        self._keys = {}
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, key):
+        """
+        Returns the ID cached for a key.
+
+        :param key: The lookup key.
+        :return: The row ID, or None when the key is not cached.
+        """
+        with self._lock:
+            row_id = self._ids.get(key)
+            if row_id is None:
+                self._stats["misses"] += 1
+                return None
+            self._ids.move_to_end(key)
+            self._stats["hits"] += 1
+            return row_id
+
+    def put(self, key, row_id: int):
+        """
+        Caches the ID found for a key.
+
+        :param key: The lookup key.
+        :param row_id: The ID of the row having that key.
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._drop(row_id)
+            previous = self._ids.pop(key, None)
+            if previous is not None:
+                del self._keys[previous]
+            self._ids[key] = row_id
+            self._keys[row_id] = key
+            while len(self._ids) > self.max_size:
+                _, evicted = self._ids.popitem(last=False)
+                del self._keys[evicted]
+
+    def invalidate(self, row_id: int):
+        """
+        Drops the entry of a row, after it changed or was deleted.
+
+        :param row_id: The ID of the row.
+        """
+        with self._lock:
+            if self._drop(row_id):
+                self._stats["invalidations"] += 1
+
+    def _drop(self, row_id: int):
+        key = self._keys.pop(row_id, None)
+        if key is None:
+            return False
+        del self._ids[key]
+        return True
+
+    def stats(self):
+        """
+        Returns the number of cached entries and the hits, misses and
+        invalidations since startup.
+        """
+        with self._lock:
+            return dict(self._stats, size=len(self._ids))
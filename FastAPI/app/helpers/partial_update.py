@@ -0,0 +1,47 @@
+"""
+This module provides the helper behind the partial (PATCH) updates.
+
+Only the fields sent by the client are considered, and among them only the
+ones whose stored value actually changes end up in the UPDATE statement. When
+nothing differs, no write is issued at all.
+"""
+
+from fastapi import HTTPException
+
+
+def changed_fields(row, changes: dict):
+    """
+    Compares the requested changes with the stored row.
+
+    Values are compared as they would be written to the database, so e.g. a
+    `False` status matches the stored "False" string.
+
+    :param row: The Peewee model instance currently stored.
+    :param changes: The fields sent by the client (`model_dump(exclude_unset=True)`).
+    :return: The fields whose value differs from the stored one.
+    :raises HTTPException: 400 if a field is explicitly set to null.
+    """
+    model = type(row)
+    diff = {}
+    for name, value in changes.items():
+        if value is None:
+            raise HTTPException(status_code=400, detail=f"{name} cannot be null")
+        field = getattr(model, name)
+        if field.db_value(value) != field.db_value(row.__data__.get(name)):
+            diff[name] = value
+    return diff
+
+
+def apply_changes(row, diff: dict):
+    """
+    Writes only the changed columns of a row.
+
+    :param row: The Peewee model instance to update.
+    :param diff: The changed fields, as returned by `changed_fields`.
+    """
+    model = type(row)
+    model.update(**diff).where(model.id == row.id).execute()
+    # Keep the instance as it would be read back from the database
+    for name, value in diff.items():
+        field = getattr(model, name)
+        row.__data__[name] = field.python_value(field.db_value(value))
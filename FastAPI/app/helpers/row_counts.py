@@ -0,0 +1,175 @@
+"""
+This module keeps the number of rows of each list, so the list routes can
+report their total (`?count=exact`) without running `SELECT COUNT(*)` over
+millions of rows.
+
+Each counted list has a row in the 'row_counts' table of the database holding
+its rows: the main database for the employees, every shard for its own
+projects, tasks and archived tasks. The services adjust it in the transaction
+of every write that adds rows to the list or removes some (creates, deletes,
+imports, deleting a project, which hides its tasks, and the moves between the
+tasks and the archive), so it stays exact.
+
+The tools writing rows directly (seeding, rebalancing) recount at the end. A
+counter missing from a database is counted at startup, and until then the
+total of that database is counted with the registered query.
+
+    @row_counts.register("tasks")
+    def _count_tasks():
+        return TaskService.active_tasks()
+
+    row_counts.adjust("tasks", 1)  # In the transaction of the insert
+"""
+
+from database import database, shard_database, use_shard, RowCountModel
+from helpers.sharding import fan_out
+from helpers.statement_cache import Param, statements
+
+# Values accepted by the `count` query parameter of the list routes
+COUNT_PATTERN = "^(exact|estimate|none)$"
+
+
+class RowCounter:
+    """
+    Registry of the counted lists and their counters.
+
+    Methods:
+        register(name: str, sharded: bool)
+            Decorator registering the function that builds the query of a list.
+
+        query(name: str)
+            Builds the query of a list, in the current shard.
+
+        adjust(name: str, delta: int)
+            Adds rows to the counter of a list, in the current transaction.
+
+        total(name: str)
+            Returns the number of rows of a list.
+
+        recount(names: list)
+            Counts the rows of the lists again and stores the counts.
+
+        init()
+            Counts the lists whose counter is missing.
+    """
+    def __init__(self):
+        # Query builder and whether the rows are in the shards, by list name
+        self._lists = {}
+
+    def register(self, name: str, sharded: bool = True):
+        """
+        Registers the function building the query of the rows of a list.
+
+        :param name: The name of the list, and of its counter.
+        :param sharded: Whether the rows live in the shards (or in the main database).
+        :return: A decorator that registers the function.
+        """
+        def decorator(build):
+            self._lists[name] = (build, sharded)
+            return build
+        return decorator
+
+    def query(self, name: str):
+        """
+        Builds the query of the rows of a list, in the current shard.
+
+        :param name: The name of the list.
+        :return: The select query.
+        """
+        return self._lists[name][0]()
+
+    def _databases(self, name: str):
+        return None if self._lists[name][1] else [database]
+
+    def adjust(self, name: str, delta: int):
+        """
+        Adds `delta` (possibly negative) rows to the counter of a list.
+
+        Run it in the transaction of the write, in the shard of the rows.
+
+        :param name: The name of the list.
+        :param delta: The number of rows added, or removed when negative.
+        """
+        if not delta:
+            return
+        if self._lists[name][1]:
+            statements.execute("row_counts.adjust", counter=name, delta=delta)
+            return
+        with use_shard(database):
+            statements.execute("row_counts.adjust", counter=name, delta=delta)
+
+    def total(self, name: str):
+        """
+        Returns the number of rows of a list, summed over the shards.
+
+        :param name: The name of the list.
+        :return: The number of rows.
+        """
+        def shard_total(_shard):
+            counter = statements.first("row_counts.get", counter=name)
+            return counter.count if counter is not None else self.query(name).count()
+
+        return sum(fan_out(shard_total, self._databases(name)))
+
+    def recount(self, names: list = None):
+        """
+        Counts the rows of lists and stores the counts in their counters.
+
+        :param names: The lists to count (defaults to all of them).
+        """
+        for name in names or list(self._lists):
+            fan_out(lambda _, name=name: self._store(name), self._databases(name))
+
+    def _store(self, name: str):
+        with shard_database.atomic():
+            RowCountModel.insert(
+                name=name, count=self.query(name).count()
+            ).on_conflict_replace().execute()
+
+    def init(self):
+        """
+        Counts the lists whose counter is missing from a database, e.g. on
+        the first start after the counters were introduced.
+        """
+        def init_counter(name: str):
+            if RowCountModel.get_or_none(RowCountModel.name == name) is None:
+                self._store(name)
+
+        for name in self._lists:
+            fan_out(lambda _, name=name: init_counter(name), self._databases(name))
+
+
+row_counts = RowCounter()
+
+
+def add_total_count(response, count: str, exact, estimate=None):
+    """
+    Adds the total of a list to a response, as the `X-Total-Count` header;
+    `X-Total-Count-Type` tells whether it is exact or an estimate.
+
+    :param response: The response of the route.
+    :param count: "exact", "estimate" or "none" (no header).
+    :param exact: The function returning the exact total.
+    :param estimate: The function returning an estimate, when it is cheaper
+                     than the exact total.
+    """
+    if count == "none":
+        return
+    if count == "estimate" and estimate is not None:
+        total, kind = estimate(), "estimate"
+    else:
+        total, kind = exact(), "exact"
+    response.headers["X-Total-Count"] = str(total)
+    response.headers["X-Total-Count-Type"] = kind
+
+
+@statements.register("row_counts.get", RowCountModel)
+def _get_counter():
+    return RowCountModel.select().where(RowCountModel.name == Param("counter")).limit(1)
+
+
+@statements.register("row_counts.adjust", RowCountModel)
+def _adjust_counter():
+    return RowCountModel.update(count=RowCountModel.count + Param("delta")).where(
+        RowCountModel.name == Param("counter")
+    )
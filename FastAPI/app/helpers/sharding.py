@@ -0,0 +1,260 @@
+"""
+This module routes the projects, and the tasks with them, to their shard.
+
+When SHARDS lists several databases, every project lives in the shard picked
+by a jump consistent hash of its ID, together with its tasks and archived
+tasks. The employees stay in the main database (the global shard).
+
+- Writes run on the shard of their project (`on_project_shard`).
+- Reads that are not keyed by a project (all the projects, a task by ID,
+  the search) run on every shard concurrently (`fan_out`) and their results
+  are merged by ID or by score (`merge_sorted`).
+- The IDs of the sharded tables come from the 'sequences' table of the main
+  database (`id_allocator`), in blocks, so they stay unique across shards.
+
+Without SHARDS, there is a single shard, the main database, and every helper
+runs its work inline.
+
+Inside `all_shards_atomic` (the batch endpoint), the fan-outs also run inline,
+on the connections holding the transaction, so they see its own writes.
+"""
+
+# Pylint does not see through peewee's @database_required on the query methods
+# pylint: disable=no-value-for-parameter
+
+import heapq
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from database import database, is_sharded, shard_databases, use_shard, SequenceModel
+
+# Threads running the queries of the fan-out reads
+SHARD_FANOUT_WORKERS = int(os.getenv("SHARD_FANOUT_WORKERS", "8"))
+
+# IDs reserved per round trip to the 'sequences' table
+SHARD_ID_BLOCK_SIZE = int(os.getenv("SHARD_ID_BLOCK_SIZE", "100"))
+
+# Threads are only started by the first fan-out
+_fan_out_pool = ThreadPoolExecutor(SHARD_FANOUT_WORKERS, thread_name_prefix="shard")
+
+# Set while the current context holds a transaction on every shard
+_in_transaction = ContextVar("in_shard_transaction", default=False)
+
+
+def jump_hash(key: int, buckets: int):
+    """
+    Jump consistent hash (Lamping & Veach): maps a key to one of `buckets`
+    buckets, and only moves 1/n of the keys when a bucket is added.
+
+    :param key: The key to place, a non-negative integer.
+    :param buckets: The number of buckets.
+    :return: The bucket of the key, between 0 and `buckets - 1`.
+    """
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for(project_id: int, shards: list = None):
+    """
+    Returns the shard holding a project and its tasks.
+
+    :param project_id: The ID of the project.
+    :param shards: The shards to choose from (defaults to the configured ones).
+    :return: The shard database.
+    """
+    shards = shard_databases if shards is None else shards
+    return shards[jump_hash(project_id, len(shards))]
+
+
+def on_project_shard(project_id: int):
+    """
+    Runs the queries of the sharded models of the block on the shard of a project.
+
+    :param project_id: The ID of the project.
+    """
+    return use_shard(shard_for(project_id))
+
+
+def group_by_shard(ids: list, key=None):
+    """
+    Splits items by the shard of their project.
+
+    :param ids: The items to split, project IDs by default.
+    :param key: Optional function returning the project ID of an item.
+    :return: A dict of the items of each shard, in their original order.
+    """
+    groups = {}
+    for item in ids:
+        groups.setdefault(shard_for(key(item) if key else item), []).append(item)
+    return groups
+
+
+def _run_on(shard, func):
+    with use_shard(shard):
+        return func(shard)
+
+
+def fan_out(func, shards: list = None):
+    """
+    Runs `func(shard)` on every shard concurrently, each call inside `use_shard`.
+
+    :param func: The function to run; it receives the shard it runs on.
+    :param shards: The shards to run on (defaults to all of them).
+    :return: The results, in the order of the shards.
+    :raises Exception: The first error raised by one of the calls.
+    """
+    shards = shard_databases if shards is None else list(shards)
+    if not is_sharded() or len(shards) == 1 or _in_transaction.get():
+        return [_run_on(shard, func) for shard in shards]
+    futures = [_fan_out_pool.submit(_run_on, shard, func) for shard in shards]
+    return [future.result() for future in futures]
+
+
+def first_found(func):
+    """
+    Runs `func(shard)` on every shard and returns the first result found.
+
+    :param func: The lookup to run; it returns None when nothing is found.
+    :return: The shard and the result found there, or (None, None).
+    """
+    for shard, result in zip(shard_databases, fan_out(func)):
+        if result is not None:
+            return shard, result
+    return None, None
+
+
+@contextmanager
+def all_shards_atomic():
+    """
+    Runs the block in one transaction on the main database and on every shard.
+
+    Everything is rolled back if the block raises. Without SHARDS this is a
+    single database transaction; with SHARDS the transactions are committed
+    one after the other, shards first, so a failure during the commit itself
+    (a lost connection) can still leave the shards committed and the main
+    database rolled back.
+    """
+    token = _in_transaction.set(True)
+    try:
+        with ExitStack() as stack:
+            for db in dict.fromkeys([database, *shard_databases]):
+                stack.enter_context(db.atomic())
+            yield
+    finally:
+        _in_transaction.reset(token)
+
+
+def merge_sorted(results: list, key, reverse: bool = False, offset: int = 0, limit: int = None):
+    """
+    Merges the sorted results of several shards into one sorted list.
+
+    :param results: One sorted list per shard.
+    :param key: The function returning the sort key of a row.
+    :param reverse: Whether the lists are sorted in descending order.
+    :param offset: The number of merged rows to skip.
+    :param limit: The maximum number of rows to return (all by default).
+    :return: The merged rows.
+    """
+    merged = heapq.merge(*results, key=key, reverse=reverse)
+    stop = None if limit is None else offset + limit
+    return list(itertools.islice(merged, offset, stop))
+
+
+class IdAllocator:
+    """
+    Hands out the IDs of the sharded tables from the 'sequences' table.
+
+    IDs are reserved in blocks of `block_size`, so most rows need no round
+    trip to the main database. IDs stay unique across shards and processes,
+    but the blocks of concurrent processes interleave.
+
+    Methods:
+        next_id(name: str)
+            Returns the next ID of a sequence, or None when not sharded.
+
+        reserved(counts: dict)
+            Hands out the IDs of the block from ranges reserved up front.
+
+        reserve(name: str, count: int)
+            Reserves a range of consecutive IDs.
+    """
+    def __init__(self, block_size: int):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._blocks = {}
+        # Ranges reserved by `reserved` for the current context
+        self._reserved = ContextVar("reserved_ids", default=None)
+
+    def next_id(self, name: str):
+        """
+        Returns the next ID of a sequence.
+
+        :param name: The name of the sequence ("projects" or "tasks").
+        :return: The ID, or None when not sharded, where the database assigns it.
+        """
+        if not is_sharded():
+            return None
+        reserved = self._reserved.get()
+        if reserved and name in reserved:
+            return next(reserved[name])
+        with self._lock:
+            current, end = self._blocks.get(name, (0, 0))
+            if current >= end:
+                current = self.reserve(name, self.block_size)
+                end = current + self.block_size
+            self._blocks[name] = (current + 1, end)
+            return current
+
+    @contextmanager
+    def reserved(self, counts: dict):
+        """
+        Hands out the IDs of the block from ranges reserved up front, each in
+        its own committed transaction.
+
+        Used around the transactions that may roll back: a block reserved
+        inside one would be rolled back too and handed out again.
+
+        :param counts: The number of IDs the block needs, by sequence name.
+        """
+        ranges = {}
+        if is_sharded():
+            for name, count in counts.items():
+                if count:
+                    first = self.reserve(name, count)
+                    ranges[name] = iter(range(first, first + count))
+        token = self._reserved.set(ranges)
+        try:
+            yield
+        finally:
+            self._reserved.reset(token)
+
+    @staticmethod
+    def reserve(name: str, count: int):
+        """
+        Reserves a range of consecutive IDs.
+
+        :param name: The name of the sequence ("projects" or "tasks").
+        :param count: The number of IDs to reserve.
+        :return: The first ID of the range.
+        """
+        with database.atomic():
+            SequenceModel.update(next_id=SequenceModel.next_id + count).where(
+                SequenceModel.name == name
+            ).execute()
+            next_id = (
+                SequenceModel.select(SequenceModel.next_id)
+                .where(SequenceModel.name == name)
+                .scalar()
+            )
+        return next_id - count
+
+
+id_allocator = IdAllocator(SHARD_ID_BLOCK_SIZE)
@@ -0,0 +1,119 @@
+"""
+This module provides request coalescing ("single-flight") for the read routes.
+
+When identical reads arrive while one of them is still running, only the first
+one (the leader) queries the database and renders the JSON body; the others
+wait for it and reply with the same bytes. Nothing is cached once the leader
+is done, so a read never returns data older than a read already in flight.
+
+A follower waits at most `timeout` seconds for the leader, then runs the read
+itself, so a stuck query cannot hold every identical request hostage.
+"""
+
+import os
+import threading
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+# Default number of seconds a follower waits for the leader
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "5"))
+
+# Seconds a follower waits for the leader of a full list read, which is slower
+SINGLE_FLIGHT_LIST_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_LIST_TIMEOUT", "15"))
+
+
+class _Call:
+    """
+    A read in flight, shared by the requests coalesced into it.
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call at a time per key and shares its outcome.
+
+    Methods:
+        do(key, func, timeout: float)
+            Runs `func` or joins the identical call already running.
+
+        stats()
+            Returns the number of calls, executions, coalesced calls and timeouts.
+    """
+    def __init__(self, timeout: float = SINGLE_FLIGHT_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0, "timeouts": 0}
+
+    def do(self, key, func, timeout: float = None):
+        """
+        Runs `func`, or waits for the call already running with the same key.
+
+        :param key: Hashable identifier of the read (e.g. ("projects", 3)).
+        :param func: The function doing the read.
+        :param timeout: Seconds to wait for the leader before running `func`
+                        independently (defaults to the instance timeout).
+        :return: The result of `func`, shared by all coalesced callers.
+        :raises Exception: Whatever `func` raised, re-raised in every caller.
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["executions"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if leader:
+            try:
+                call.result = func()
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                call.error = exc
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        elif not call.done.wait(self.timeout if timeout is None else timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+                self._stats["executions"] += 1
+            return func()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        """
+        Returns the counters of the instance.
+
+        :return: A dict with the number of calls, executions (reads that hit
+                 the database), coalesced calls and follower timeouts.
+        """
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+
+read_flight = SingleFlight()
+
+
+def coalesced_json(key, func, timeout: float = None):
+    """
+    Runs a read through the single-flight layer and renders it once as JSON.
+
+    :param key: Hashable identifier of the read.
+    :param func: The service method doing the read.
+    :param timeout: Seconds a follower waits for the leader.
+    :return: A JSON response whose body is shared by the coalesced requests.
+    """
+    body = read_flight.do(key, lambda: JSONResponse(jsonable_encoder(func())).body, timeout)
+    return Response(content=body, media_type="application/json")
@@ -0,0 +1,194 @@
+"""
+This module implements the fast startup mode, enabled with FAST_STARTUP=1 on
+instances started on demand (autoscaling), so the first requests they serve
+are as fast as the following ones.
+
+During the lifespan, before the first request is accepted, it:
+- loads the OpenAPI document from the OPENAPI_CACHE file when it was written
+  for the same application code, or generates it and writes the file for the
+  next start (FastAPI otherwise generates it on the first `/docs` visit);
+- opens the database connections, on the main database and every shard, of
+  the threadpool workers that run the first requests. The workers exit after
+  10 seconds without work, so this helps the traffic sent as soon as the
+  instance is ready;
+- runs the validators and serializers of the request bodies once.
+
+The duration of each step is reported by `GET /metrics` (`startup`), and
+scripts/bench_startup.py measures the import time and the time to the first
+response of a cold start, with and without this mode.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+import anyio.to_thread
+import fastapi
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import APIRoute
+from database import database, shard_databases
+from models.batch import Batch
+from models.employee import Employee, EmployeeUpdate
+from models.job import Job
+from models.project import Project, ProjectUpdate
+from models.task import Task, TaskStatus, TaskUpdate
+
+# Whether the lifespan runs the warm-up steps
+FAST_STARTUP = os.getenv("FAST_STARTUP", "0") == "1"
+
+# File keeping the OpenAPI document between starts
+OPENAPI_CACHE = os.getenv(
+    "OPENAPI_CACHE", os.path.join(tempfile.gettempdir(), "openapi-cache.json")
+)
+
+# Threadpool workers given a database connection before the first request
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "8"))
+
+# Seconds the workers wait for each other while warming up
+WARMUP_TIMEOUT = 5
+
+# Directory of the application modules, whose sources key the OpenAPI cache
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A valid body for each request model, validated once during the warm-up
+SAMPLE_BODIES = {
+    Employee: {"name": "Warm-up", "email": "warmup@example.com", "phone": "0", "post": "Dev"},
+    EmployeeUpdate: {"post": "Dev"},
+    Project: {"name": "Warm-up", "description": "Warm-up",
+              "init_date": "2024-01-01", "finish_date": "2024-12-31"},
+    ProjectUpdate: {"name": "Warm-up"},
+    Task: {"project_id": 1, "employee_id": 1, "title": "Warm-up", "description": "Warm-up",
+           "deadline": "2024-06-30", "status": False},
+    TaskUpdate: {"status": True},
+    TaskStatus: {"status": True},
+    Job: {"kind": "tasks.update_status", "params": {"task_ids": [1], "status": True}},
+    Batch: {"operations": [{"op": "projects.get", "id": 1}]},
+}
+
+# Duration of the startup steps, reported by GET /metrics
+startup_stats = {"fast_startup": FAST_STARTUP}
+
+
+def _timed(step: str, started: float):
+    startup_stats[f"{step}_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def code_fingerprint():
+    """
+    Hashes the sources of the loaded application modules and the FastAPI
+    version, which the OpenAPI document depends on.
+
+    :return: The hex digest.
+    """
+    digest = hashlib.sha256(fastapi.__version__.encode())
+    files = sorted(
+        module.__file__
+        for module in list(sys.modules.values())
+        if getattr(module, "__file__", None) and module.__file__.startswith(APP_DIR)
+    )
+    for path in files:
+        digest.update(path[len(APP_DIR):].encode())
+        with open(path, "rb") as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+
+def load_openapi(app):
+    """
+    Installs the cached OpenAPI document, or generates it and updates the cache.
+
+    :param app: The FastAPI application.
+    """
+    started = time.perf_counter()
+    fingerprint = code_fingerprint()
+    try:
+        with open(OPENAPI_CACHE, encoding="utf-8") as cache:
+            cached = json.load(cache)
+    except (OSError, ValueError):
+        cached = {}
+    if cached.get("fingerprint") == fingerprint:
+        # app.openapi() returns the installed document from now on
+        app.openapi_schema = cached["openapi"]
+        startup_stats["openapi"] = "cached"
+    else:
+        document = app.openapi()
+        startup_stats["openapi"] = "generated"
+        try:
+            # Written aside then renamed, so a concurrent start never reads half a file
+            partial = f"{OPENAPI_CACHE}.{os.getpid()}"
+            with open(partial, "w", encoding="utf-8") as cache:
+                json.dump({"fingerprint": fingerprint, "openapi": document}, cache)
+            os.replace(partial, OPENAPI_CACHE)
+        except OSError:
+            startup_stats["openapi"] = "generated, cache not writable"
+    _timed("openapi", started)
+
+
+def _open_connections(barrier: threading.Barrier):
+    for db in dict.fromkeys([database, *shard_databases]):
+        db.connect(reuse_if_open=True)
+        db.execute_sql("SELECT 1")
+    # Hold the worker until the others are busy too, so each warm-up runs
+    # on a different thread
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+
+
+async def warm_connections(count: int = WARMUP_CONNECTIONS):
+    """
+    Opens the database connections of `count` threadpool workers.
+
+    :param count: The number of workers to prepare (0 skips the step).
+    """
+    started = time.perf_counter()
+    # More than the threadpool size would wait for workers that never come
+    count = min(count, anyio.to_thread.current_default_thread_limiter().total_tokens)
+    if count <= 0:
+        startup_stats["connections"] = 0
+        return
+    barrier = threading.Barrier(count, timeout=WARMUP_TIMEOUT)
+    await asyncio.gather(
+        *(anyio.to_thread.run_sync(_open_connections, barrier) for _ in range(count))
+    )
+    startup_stats["connections"] = count
+    _timed("connections", started)
+
+
+def warm_models(app):
+    """
+    Validates and serializes a sample body for every route taking one.
+
+    :param app: The FastAPI application.
+    """
+    started = time.perf_counter()
+    for route in app.routes:
+        body_field = getattr(route, "body_field", None) if isinstance(route, APIRoute) else None
+        if body_field is None or body_field.type_ not in SAMPLE_BODIES:
+            continue
+        value, errors = body_field.validate(SAMPLE_BODIES[body_field.type_], loc=("body",))
+        if errors:
+            raise ValueError(f"Invalid warm-up body for {route.path}: {errors}")
+        jsonable_encoder(value)
+    jsonable_encoder({"date": date.today()})
+    _timed("models", started)
+
+
+async def warm_up(app):
+    """
+    Runs the warm-up steps of the fast startup mode.
+
+    :param app: The FastAPI application.
+    """
+    started = time.perf_counter()
+    load_openapi(app)
+    await warm_connections()
+    warm_models(app)
+    _timed("warm_up", started)
@@ -0,0 +1,186 @@
+"""
+This module keeps the SQL of the hot statements compiled: a row by ID, a page
+of rows, an update by ID and a delete by ID.
+
+On those routes, building the peewee expression tree and generating its SQL
+costs about as much CPU as running the statement. A statement registered here
+is built once with named placeholders (`Param`) and compiled once per
+database; each call then only binds its parameters and runs the SQL. The rows
+are read through the cursor wrapper of the original query, so callers get the
+same model instances as from the query builder.
+
+    @statements.register("tasks.delete", TaskModel)
+    def _delete_task():
+        return TaskModel.delete().where(TaskModel.id == Param("id"))
+
+    statements.execute("tasks.delete", id=task_id)
+"""
+
+import threading
+
+from peewee import Value
+from database import ShardDatabase
+
+
+class _Slot:
+    """
+    Parameter of a compiled statement, filled on each call.
+    """
+    # pylint: disable=too-few-public-methods
+    __slots__ = ("name", "field")
+
+    def __init__(self, name: str, field):
+        self.name = name
+        self.field = field
+
+    def bind(self, params: dict):
+        """
+        Returns the value of the parameter for the database.
+
+        :param params: The values given to the statement, by name.
+        """
+        value = params[self.name]
+        return value if self.field is None else self.field.db_value(value)
+
+
+class Param(Value):
+    """
+    Named placeholder in the query of a registered statement.
+
+    :param name: The keyword argument giving its value on each call.
+    :param field: The field converting the value for the database (e.g. a
+                  date or a boolean stored as text); the value is sent as is
+                  without it.
+    """
+    def __init__(self, name: str, field=None):
+        super().__init__(_Slot(name, field), converter=False)
+
+
+class StatementCache:
+    """
+    Registry of precompiled, parameterized statements.
+
+    Methods:
+        register(name: str, model)
+            Decorator registering the function that builds a statement.
+
+        select(name: str, **params)
+            Runs a SELECT statement and returns its rows.
+
+        first(name: str, **params)
+            Runs a SELECT statement and returns its first row, or None.
+
+        execute(name: str, **params)
+            Runs an UPDATE or DELETE statement and returns the rows affected.
+
+        sql(name: str, **params)
+            Returns the SQL and parameters of a call, without running it.
+
+        stats()
+            Returns the calls served from a compiled statement and the compilations.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._builders = {}
+        # (query, sql, parameters) by statement name and database
+        self._compiled = {}
+        self._stats = {}
+
+    def register(self, name: str, model):
+        """
+        Registers the function building a statement, called on its first use
+        against each database.
+
+        :param name: The name the statement is run with.
+        :param model: The model the statement runs on, which tells the database.
+        :return: A decorator that registers the function.
+        """
+        def decorator(build):
+            self._builders[name] = (model, build)
+            self._stats[name] = {"hits": 0, "compiles": 0}
+            return build
+        return decorator
+
+    def _statement(self, name: str):
+        model, build = self._builders[name]
+        db = model._meta.database  # pylint: disable=protected-access
+        if isinstance(db, ShardDatabase):
+            db = db.current()
+        statement = self._compiled.get((name, db))
+        if statement is not None:
+            with self._lock:
+                self._stats[name]["hits"] += 1
+            return db, statement
+
+        query = build()
+        sql, params = query.sql()
+        with self._lock:
+            statement = self._compiled.setdefault((name, db), (query, sql, params))
+            self._stats[name]["compiles"] += 1
+        return db, statement
+
+    def _bind(self, name: str, params: dict):
+        db, (query, sql, template) = self._statement(name)
+        values = [
+            value.bind(params) if isinstance(value, _Slot) else value for value in template
+        ]
+        return db, query, sql, values
+
+    def _run(self, name: str, params: dict):
+        db, query, sql, values = self._bind(name, params)
+        return db, query, db.execute_sql(sql, values)
+
+    def select(self, name: str, /, **params):
+        """
+        Runs a SELECT statement.
+
+        :param name: The name of the statement.
+        :param params: The values of its placeholders.
+        :return: The rows, as the query builder would return them.
+        """
+        _, query, cursor = self._run(name, params)
+        return list(query._get_cursor_wrapper(cursor))  # pylint: disable=protected-access
+
+    def first(self, name: str, /, **params):
+        """
+        Runs a SELECT statement and returns its first row.
+
+        :param name: The name of the statement.
+        :param params: The values of its placeholders.
+        :return: The first row, or None when there is none.
+        """
+        rows = self.select(name, **params)
+        return rows[0] if rows else None
+
+    def execute(self, name: str, /, **params):
+        """
+        Runs an UPDATE or DELETE statement.
+
+        :param name: The name of the statement.
+        :param params: The values of its placeholders.
+        :return: The number of rows affected.
+        """
+        db, _, cursor = self._run(name, params)
+        return db.rows_affected(cursor)
+
+    def sql(self, name: str, /, **params):
+        """
+        Returns the SQL and parameters of a call, without running it.
+
+        :param name: The name of the statement.
+        :param params: The values of its placeholders.
+        :return: The SQL and the list of its parameters.
+        """
+        _, _, sql, values = self._bind(name, params)
+        return sql, values
+
+    def stats(self):
+        """
+        Returns, per statement, the calls that reused its compiled SQL (`hits`)
+        and the times it was compiled (`compiles`, once per database).
+        """
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._stats.items()}
+
+
+statements = StatementCache()
@@ -8,24 +8,52 @@ lifecycle, and includes routes.
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from helpers.api_key_auth import get_api_key
+from helpers.admission import admission_limiters
+from helpers.row_counts import row_counts
+from helpers.startup import FAST_STARTUP, warm_up
 from starlette.responses import RedirectResponse
-from database import database as connection
+from database import database as connection, init_database
 from routes.employee_route import employee_route
 from routes.project_route import project_route
 from routes.task_route import task_route
+from routes.batch_route import batch_route
+from routes.job_route import job_route
+from routes.import_route import import_route
+from routes.metrics_route import metrics_route
+from services.job_service import job_runner
+from services.purge_service import project_purger
+from services.archive_service import task_archiver
+from services.status_buffer import status_buffer
 
 @asynccontextmanager
 async def manage_lifespan(_app: FastAPI):
     """
     Manage the lifespan of the FastAPI application.
 
-    Ensures the database connection is opened and closed properly.
+    Ensures the database connection is opened and closed properly, that
+    the tables, indexes and row counters the application relies on exist,
+    and runs the background job workers, the project purger, the task
+    archiver and the status write buffer. With FAST_STARTUP=1, it also warms
+    up the OpenAPI document, the database connections and the request models
+    before the first request.
     """
     if connection.is_closed():
         connection.connect()
+    init_database()
+    row_counts.init()
+    if FAST_STARTUP:
+        await warm_up(_app)
+    job_runner.start()
+    project_purger.start()
+    task_archiver.start()
+    status_buffer.start()
     try:
         yield
     finally:
+        status_buffer.stop()
+        task_archiver.stop()
+        project_purger.stop()
+        job_runner.stop()
         if not connection.is_closed():
             connection.close()
 
@@ -52,12 +80,32 @@ async def read_root():
 app.include_router(employee_route,
                    prefix="/employees",
                    tags=["Employees"],
-                   dependencies=[Depends(get_api_key)])
+                   dependencies=[Depends(get_api_key),
+                                 Depends(admission_limiters["employees"])])
 app.include_router(project_route,
                    prefix="/projects",
                    tags=["Projects"],
-                   dependencies=[Depends(get_api_key)])
+                   dependencies=[Depends(get_api_key),
+                                 Depends(admission_limiters["projects"])])
 app.include_router(task_route,
                    prefix="/tasks",
                    tags=["Tasks"],
+                   dependencies=[Depends(get_api_key),
+                                 Depends(admission_limiters["tasks"])])
+app.include_router(batch_route,
+                   prefix="/batch",
+                   tags=["Batch"],
+                   dependencies=[Depends(get_api_key),
+                                 Depends(admission_limiters["batch"])])
+app.include_router(job_route,
+                   prefix="/jobs",
+                   tags=["Jobs"],
+                   dependencies=[Depends(get_api_key)])
+app.include_router(import_route,
+                   prefix="/imports",
+                   tags=["Imports"],
+                   dependencies=[Depends(get_api_key)])
+app.include_router(metrics_route,
+                   prefix="/metrics",
+                   tags=["Metrics"],
                    dependencies=[Depends(get_api_key)])
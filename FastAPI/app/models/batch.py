@@ -0,0 +1,42 @@
+"""
+Module that defines the Batch data model using Pydantic. This model
+represents an ordered list of write operations run in one transaction.
+"""
+
+from typing import List, Optional, Union
+
+# Import BaseModel from Pydantic to create the data model
+from pydantic import BaseModel
+
+
+class BatchOperation(BaseModel):
+    """
+    Batch operation data model: one call to a service method.
+
+    Attributes:
+    ----------
+    op : str
+        The operation, as "<entity>.<action>" (e.g. "projects.create").
+    id : int or str, optional
+        The ID of the row the operation targets; required except for "create".
+    body : dict
+        The data of the operation, as sent to the matching single route.
+    ref : str, optional
+        Name later operations use to reference the ID of this one ("$<ref>").
+    """
+    op: str
+    id: Optional[Union[int, str]] = None
+    body: dict = {}
+    ref: Optional[str] = None
+
+
+class Batch(BaseModel):
+    """
+    Batch data model that validates a batch submission.
+
+    Attributes:
+    ----------
+    operations : List[BatchOperation]
+        The operations to run, in order.
+    """
+    operations: List[BatchOperation]
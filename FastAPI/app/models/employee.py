@@ -6,6 +6,7 @@ such as id, name, email, phone, and post. This model is used for
 data validation and serialization within the application.
 """
 
+from typing import Optional
 from pydantic import BaseModel
 
 class Employee(BaseModel):
@@ -23,3 +24,19 @@ class Employee(BaseModel):
     email: str
     phone: str
     post: str
+
+class EmployeeUpdate(BaseModel):
+    """
+    A Pydantic model for a partial employee update; only the fields sent are changed.
+
+    Attributes:
+        name (str, optional): The name of the employee.
+        email (str, optional): The email address of the employee.
+        phone (str, optional): The phone number of the employee.
+        post (str, optional): The job position or title of the employee.
+    """
+
+    name: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    post: Optional[str] = None
@@ -0,0 +1,22 @@
+"""
+Module that defines the Job data model using Pydantic. This model
+represents a request to run a long operation in the background.
+"""
+
+# Import BaseModel from Pydantic to create the data model
+from pydantic import BaseModel
+
+
+class Job(BaseModel):
+    """
+    Job data model that validates background job submissions.
+
+    Attributes:
+    ----------
+    kind : str
+        Name of the job to run (e.g. "tasks.update_status").
+    params : dict
+        Parameters passed to the job, specific to each kind.
+    """
+    kind: str
+    params: dict = {}
@@ -6,6 +6,7 @@ start date, and end date.
 
 # Import the date class to handle dates
 from datetime import date
+from typing import Optional
 # Import BaseModel from Pydantic to create the data model
 from pydantic import BaseModel
 
@@ -30,3 +31,25 @@ class Project(BaseModel):
     description: str
     init_date: date
     finish_date: date
+
+
+class ProjectUpdate(BaseModel):
+    """
+    Data model of a partial project update; only the fields sent are changed.
+
+    Attributes:
+    ----------
+    name : str, optional
+        Name of the project.
+    description : str, optional
+        Brief description of the project.
+    init_date : date, optional
+        Start date of the project.
+    finish_date : date, optional
+        End date of the project.
+    """
+
+    name: Optional[str] = None
+    description: Optional[str] = None
+    init_date: Optional[date] = None
+    finish_date: Optional[date] = None
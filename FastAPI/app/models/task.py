@@ -6,6 +6,7 @@ a title, description, deadline, and status.
 
 # Import the date class to handle dates
 from datetime import date
+from typing import Optional
 
 # Import BaseModel from Pydantic to create the data model
 from pydantic import BaseModel
@@ -36,3 +37,42 @@ class Task(BaseModel):
     description: str
     deadline: date
     status: bool = False  # Default status is False (pending task)
+
+
+class TaskUpdate(BaseModel):
+    """
+    Data model of a partial task update; only the fields sent are changed.
+
+    Attributes:
+    ----------
+    project_id : int, optional
+        Identifier of the project associated with the task.
+    employee_id : int, optional
+        Identifier of the employee assigned to the task.
+    title : str, optional
+        Title of the task.
+    description : str, optional
+        Detailed description of the task.
+    deadline : date, optional
+        Deadline for completing the task.
+    status : bool, optional
+        Status of the task.
+    """
+    project_id: Optional[int] = None
+    employee_id: Optional[int] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    deadline: Optional[date] = None
+    status: Optional[bool] = None
+
+
+class TaskStatus(BaseModel):
+    """
+    Data model of a status-only task update.
+
+    Attributes:
+    ----------
+    status : bool
+        New status of the task.
+    """
+    status: bool
@@ -0,0 +1,45 @@
+"""
+This module defines the API route to run several operations in one request.
+
+Routes provided:
+- POST /batch: Run an ordered list of operations on employees, projects and
+  tasks in one transaction, all or nothing.
+"""
+
+# Import APIRouter from FastAPI to create routes
+from fastapi import APIRouter, Body
+
+# Import the Batch data model from Pydantic
+from models.batch import Batch
+
+from services.batch_service import BatchService
+
+# Create an instance of APIRouter for the batch route
+batch_route = APIRouter()
+
+@batch_route.post("/")
+def run_batch(batch: Batch = Body(...)):
+    """
+    Runs an ordered list of operations in one transaction.
+
+    Each operation is `{"op": "<entity>.<action>", "id": ..., "body": {...},
+    "ref": "..."}`, with the entity among employees, projects and tasks and
+    the action among get, create, update, patch and delete; `body` is what
+    the single route takes. An operation can use the ID of an earlier one,
+    named by its `ref`, as "$<ref>" in `id` or in a `*_id` field of `body`.
+
+    If an operation fails, nothing of the batch is kept and the error gives
+    the position of the failed operation.
+
+    Parameters:
+    -----------
+    batch : Batch
+        The operations to run, in order.
+
+    Returns:
+    --------
+    dict:
+        `results`: per operation, its position, `ref`, the ID of the row it
+        created or targeted, and the result of the matching single route.
+    """
+    return BatchService.run_batch(batch)
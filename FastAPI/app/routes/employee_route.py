@@ -2,28 +2,76 @@
 This module defines the API routes for employee management.
 
 Routes provided:
-- GET /employees: Retrieve a list of all employees.
+- GET /employees: Retrieve a list of all employees (or only the ones in `?ids=1,2,3`),
+  with their number in `X-Total-Count` when asked with `?count=exact`.
+- GET /employees/by-email/{email}: Retrieve the employee using an email address,
+  whatever its case.
 - GET /employees/{employee_id}: Retrieve a specific employee by ID.
 - POST /employees: Create a new employee record.
 - PUT /employees/{employee_id}: Update an existing employee record by ID.
+- PATCH /employees/{employee_id}: Update only the given fields of an employee record.
 - DELETE /employees/{employee_id}: Delete an employee record by ID.
 """
 
-from fastapi import APIRouter, Body
-from models.employee import Employee
+from fastapi import APIRouter, Body, Query
+from helpers.batch_lookup import parse_ids
+from helpers.row_counts import COUNT_PATTERN, add_total_count
+from helpers.single_flight import coalesced_json, SINGLE_FLIGHT_LIST_TIMEOUT
+from models.employee import Employee, EmployeeUpdate
 from services.employee_service import EmployeeService
 
 employee_route = APIRouter()
 
 @employee_route.get("/")
-def get_employees():
+def get_employees(
+    ids: str = Query(None, description="Comma-separated employee IDs"),
+    count: str = Query("none", pattern=COUNT_PATTERN, description="exact, estimate or none"),
+):
     """
-    Retrieve a list of all employees.
+    Retrieve a list of all employees, or only the requested ones.
+
+    Args:
+        ids (str, optional): Comma-separated list of employee IDs to fetch in one query.
+        count (str, optional): "exact" or "estimate" to get the number of
+            employees in the `X-Total-Count` header (always exact, from a
+            counter); "none" by default.
 
     Returns:
         List[Employee]: A list of all employee records in the database.
+        dict: When `ids` is given, the employees found in request order (`results`)
+            and the IDs that do not exist (`not_found`).
+    """
+    if ids is not None:
+        employee_ids = parse_ids(ids)
+        return coalesced_json(
+            ("employees", tuple(employee_ids)),
+            lambda: EmployeeService.get_employees_by_ids(employee_ids),
+        )
+    response = coalesced_json(
+        ("employees",), EmployeeService.get_employees, SINGLE_FLIGHT_LIST_TIMEOUT
+    )
+    add_total_count(response, count, EmployeeService.count_employees)
+    return response
+
+@employee_route.get("/by-email/{email}")
+def get_employee_by_email(email: str):
     """
-    return EmployeeService.get_employees()
+    Retrieve the employee using an email address, whatever its case.
+
+    Args:
+        email (str): The email address, e.g. the one of an SSO login.
+
+    Returns:
+        Employee: The employee record using that address.
+
+    Raises:
+        HTTPException: 404 error if no employee uses the address, 409 error
+            if several do (see scripts/report_duplicate_emails.py).
+    """
+    return coalesced_json(
+        ("employees", "email", email.lower()),
+        lambda: EmployeeService.get_employee_by_email(email),
+    )
 
 @employee_route.get("/{employee_id}")
 def get_employee(employee_id: int):
@@ -39,7 +87,9 @@ def get_employee(employee_id: int):
     Raises:
         HTTPException: 404 error if the employee with the given ID is not found.
     """
-    return EmployeeService.get_employee(employee_id)
+    return coalesced_json(
+        ("employees", employee_id), lambda: EmployeeService.get_employee(employee_id)
+    )
 
 @employee_route.post("/")
 def create_employee(employee: Employee = Body(...)):
@@ -71,6 +121,26 @@ def update_employee(employee_id: int, employee: Employee = Body(...)):
     """
     return EmployeeService.update_employee(employee_id,employee)
 
+@employee_route.patch("/{employee_id}")
+def patch_employee(employee_id: int, employee: EmployeeUpdate = Body(...)):
+    """
+    Update only the given fields of an employee record.
+
+    Only the columns whose value changes are written; when nothing differs,
+    the database is not written at all.
+
+    Args:
+        employee_id (int): The ID of the employee to update.
+        employee (EmployeeUpdate): The fields to change.
+
+    Returns:
+        Employee: The employee record, with its new values.
+
+    Raises:
+        HTTPException: 404 error if the employee with the given ID is not found.
+    """
+    return EmployeeService.patch_employee(employee_id, employee)
+
 @employee_route.delete("/{employee_id}")
 def delete_employee(employee_id: int):
     """
@@ -0,0 +1,70 @@
+"""
+This module defines the API routes to bulk import data from CSV files.
+
+Routes provided:
+- POST /imports: Upload employees, projects and/or tasks CSV files; the
+  import runs as a background job (see GET /jobs/{job_id}).
+- GET /imports/{job_id}/errors: Download the rows rejected by an import.
+"""
+
+# Import APIRouter from FastAPI to create routes
+from fastapi import APIRouter, File, UploadFile
+from fastapi.responses import FileResponse
+
+from services.import_service import ImportService
+
+# Create an instance of APIRouter for import routes
+import_route = APIRouter()
+
+@import_route.post("/", status_code=202)
+def import_csv(
+    employees: UploadFile = File(None),
+    projects: UploadFile = File(None),
+    tasks: UploadFile = File(None),
+):
+    """
+    Uploads CSV files and queues their import.
+
+    Expected columns:
+    - employees: ref, name, email, phone, post
+    - projects: ref, name, description, init_date, finish_date
+    - tasks: project_ref, employee_ref, title, description, deadline, status
+
+    `ref` is an optional identifier, local to the upload, that tasks use in
+    `project_ref` / `employee_ref`. A numeric reference not found among the
+    uploaded rows is taken as the ID of an existing project or employee.
+
+    Parameters:
+    -----------
+    employees, projects, tasks : UploadFile
+        The CSV files to import; at least one is required.
+
+    Returns:
+    --------
+    dict:
+        The import job; poll `GET /jobs/{job_id}` to follow its progress.
+    """
+    return ImportService.import_files(
+        {"employees": employees, "projects": projects, "tasks": tasks}
+    )
+
+@import_route.get("/{job_id}/errors")
+def get_import_errors(job_id: int):
+    """
+    Downloads the error report of an import.
+
+    Parameters:
+    -----------
+    job_id : int
+        The ID of the import job.
+
+    Returns:
+    --------
+    FileResponse:
+        A CSV file with the entity, line and error of every rejected row.
+    """
+    return FileResponse(
+        ImportService.get_error_report(job_id),
+        media_type="text/csv",
+        filename=f"import-{job_id}-errors.csv",
+    )
@@ -0,0 +1,70 @@
+"""
+This module defines the API routes to run long operations as background jobs.
+
+Routes provided:
+- POST /jobs: Submit a job; the request returns as soon as the job is queued.
+- GET /jobs/{job_id}: Retrieve the status, progress and result of a job.
+- POST /jobs/{job_id}/cancel: Request the cancellation of a job.
+"""
+
+# Import APIRouter from FastAPI to create routes
+from fastapi import APIRouter, Body
+
+# Import the Job data model from Pydantic
+from models.job import Job
+
+from services.job_service import JobService
+
+# Create an instance of APIRouter for job routes
+job_route = APIRouter()
+
+@job_route.post("/", status_code=202)
+def submit_job(job: Job = Body(...)):
+    """
+    Submits a job to run in the background.
+
+    Parameters:
+    -----------
+    job : Job
+        The kind of job to run (e.g. "tasks.update_status") and its parameters.
+
+    Returns:
+    --------
+    dict:
+        The queued job; poll `GET /jobs/{job_id}` to follow its progress.
+    """
+    return JobService.submit_job(job)
+
+@job_route.get("/{job_id}")
+def get_job(job_id: int):
+    """
+    Retrieves the status, progress and result of a job.
+
+    Parameters:
+    -----------
+    job_id : int
+        The ID of the job.
+
+    Returns:
+    --------
+    dict:
+        The job with its status, progress, total and result.
+    """
+    return JobService.get_job(job_id)
+
+@job_route.post("/{job_id}/cancel")
+def cancel_job(job_id: int):
+    """
+    Requests the cancellation of a queued or running job.
+
+    Parameters:
+    -----------
+    job_id : int
+        The ID of the job to cancel.
+
+    Returns:
+    --------
+    dict:
+        The job after the cancellation request.
+    """
+    return JobService.cancel_job(job_id)
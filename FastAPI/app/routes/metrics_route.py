@@ -0,0 +1,62 @@
+"""
+This module defines the API route exposing the internal metrics of the service.
+
+Routes provided:
+- GET /metrics: Retrieve the counters of the admission limiters, the request
+  coalescing layer, the precompiled statements, the project purger, the task
+  archiver, the task status write buffer, the startup warm-up and the employee
+  email lookups.
+"""
+
+# Import APIRouter from FastAPI to create routes
+from fastapi import APIRouter
+
+from database import email_index_status
+from helpers.admission import admission_limiters
+from helpers.single_flight import read_flight
+from helpers.startup import startup_stats
+from helpers.statement_cache import statements
+from services.purge_service import project_purger
+from services.archive_service import task_archiver
+from services.employee_service import employee_emails
+from services.status_buffer import status_buffer
+
+# Create an instance of APIRouter for the metrics route
+metrics_route = APIRouter()
+
+@metrics_route.get("/")
+def get_metrics():
+    """
+    Retrieves the internal metrics of the service.
+
+    Returns:
+    --------
+    dict:
+        `admission`: per route group, the limits, the requests running and
+        waiting (`queue_depth`), and the admitted and rejected totals.
+        `single_flight`: reads requested, executed against the database,
+        coalesced into another identical read, and follower timeouts.
+        `statements`: per precompiled statement, the calls that reused its
+        SQL (`hits`) and its compilations, one per database.
+        `purger`: projects and tasks purged, the project being purged and
+        the deleted projects waiting to be purged.
+        `archive`: rows in the active and archive task tables, tasks archived
+        and restored, and the outcome and duration of the last archival run.
+        `status_buffer`: status changes submitted and coalesced, flushes,
+        rows written and flush durations.
+        `startup`: whether the fast startup mode is on and the duration of
+        its warm-up steps.
+        `employee_emails`: hits, misses, invalidations and size of the cache
+        of the employee IDs by email, whether the email index is unique and
+        the number of addresses used by several employees.
+    """
+    return {
+        "admission": {group: limiter.stats() for group, limiter in admission_limiters.items()},
+        "single_flight": read_flight.stats(),
+        "statements": statements.stats(),
+        "purger": project_purger.stats(),
+        "archive": task_archiver.stats(),
+        "status_buffer": status_buffer.stats(),
+        "startup": startup_stats,
+        "employee_emails": dict(employee_emails.stats(), **email_index_status),
+    }
@@ -4,29 +4,102 @@ It allows fetching, creating, updating, and deleting projects in the database.
 """
 
 # Import APIRouter from FastAPI to create routes
-from fastapi import APIRouter, Body
+from fastapi import APIRouter, Body, Header, Query, Request
+from fastapi.responses import StreamingResponse
 
 # Import the Project data model from Pydantic
-from models.project import Project
+from models.project import Project, ProjectUpdate
 
 from services.project_service import ProjectService
+from services.archive_service import ArchiveService
+
+from helpers.batch_lookup import parse_ids
+from helpers.row_counts import COUNT_PATTERN, add_total_count
+from helpers.change_feed import change_feed
+from helpers.single_flight import coalesced_json, SINGLE_FLIGHT_LIST_TIMEOUT
 
 # Create an instance of APIRouter for project routes
 project_route = APIRouter()
 
 @project_route.get("/")
-def get_all_projects():
+def get_all_projects(
+    ids: str = Query(None, description="Comma-separated project IDs"),
+    after: int = Query(0, ge=0, description="Only return the projects with a greater ID"),
+    limit: int = Query(None, ge=1, description="Maximum number of projects to return"),
+    count: str = Query("none", pattern=COUNT_PATTERN, description="exact, estimate or none"),
+):
     """
-    Retrieves all the projects stored in the database.
+    Retrieves all the projects stored in the database, or only the requested ones.
+
+    The projects are ordered by ID; pass the ID of the last project received
+    as `after` to get the next page. With `count`, the `X-Total-Count` header
+    gives the number of projects of the whole list, whatever the page.
+
+    Parameters:
+    -----------
+    ids : str, optional
+        Comma-separated list of project IDs (e.g. `1,2,3`) to fetch in one query.
+    after : int, optional
+        Only return the projects with a greater ID.
+    limit : int, optional
+        Maximum number of projects to return (all by default).
+    count : str, optional
+        "exact" or "estimate" to get the total in `X-Total-Count`; it is
+        always exact, read from the project counters. "none" by default.
 
     Returns:
     --------
     list:
         A list of all projects.
     dict:
-        In case of error, returns a dictionary with the error message.
+        When `ids` is given, the projects found in request order (`results`)
+        and the IDs that do not exist (`not_found`).
+    """
+    if ids is not None:
+        project_ids = parse_ids(ids)
+        return coalesced_json(
+            ("projects", tuple(project_ids)),
+            lambda: ProjectService.get_projects_by_ids(project_ids),
+        )
+    response = coalesced_json(
+        ("projects", after, limit),
+        lambda: ProjectService.get_all_projects(after, limit),
+        SINGLE_FLIGHT_LIST_TIMEOUT,
+    )
+    add_total_count(response, count, ProjectService.count_projects)
+    return response
+
+@project_route.get("/changes")
+async def get_project_changes(
+    request: Request,
+    project_id: int = Query(None),
+    last_event_id: str = Header(None),
+):
+    """
+    Streams the changes made to projects as Server-Sent Events.
+
+    Each event carries the action ("created", "updated", "deleted"...) and the
+    project data. Reconnecting with the `Last-Event-ID` header resumes the stream
+    after the last event received; a "reset" event means some changes were lost
+    and the client must reload the projects.
+
+    Parameters:
+    -----------
+    project_id : int, optional
+        Only stream the changes of this project.
+    last_event_id : str, optional
+        The ID of the last event received, sent as the `Last-Event-ID` header.
+
+    Returns:
+    --------
+    StreamingResponse:
+        A `text/event-stream` response that stays open until the client leaves.
     """
-    return ProjectService.get_all_projects()
+    return StreamingResponse(
+        change_feed.stream(request, "projects", last_event_id, project_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @project_route.get("/{project_id}")
 def get_project(project_id: int):
@@ -45,7 +118,25 @@ def get_project(project_id: int):
     dict:
         In case of error, returns a dictionary with the error message.
     """
-    return ProjectService.get_project(project_id)
+    return coalesced_json(("projects", project_id), lambda: ProjectService.get_project(project_id))
+
+@project_route.get("/{project_id}/purge")
+def get_project_purge(project_id: int):
+    """
+    Retrieves the progress of the background purge of a deleted project.
+
+    Parameters:
+    -----------
+    project_id : int
+        The ID of the deleted project.
+
+    Returns:
+    --------
+    dict:
+        The purge status ("pending", "purging" or "purged"), the number of
+        tasks already purged and the number of tasks left.
+    """
+    return ProjectService.get_purge_progress(project_id)
 
 @project_route.post("/")
 def create_project(project: Project = Body(...)):
@@ -87,6 +178,45 @@ def update_project(project_id: int, project: Project = Body(...)):
     """
     return ProjectService.update_project(project_id,project)
 
+@project_route.post("/{project_id}/tasks/restore")
+def restore_project_tasks(project_id: int):
+    """
+    Moves every archived task of a project back to the active tasks.
+
+    Parameters:
+    -----------
+    project_id : int
+        The ID of the project.
+
+    Returns:
+    --------
+    dict:
+        The project ID and the number of tasks restored.
+    """
+    return ArchiveService.restore_project_tasks(project_id)
+
+@project_route.patch("/{project_id}")
+def patch_project(project_id: int, project: ProjectUpdate = Body(...)):
+    """
+    Updates only the given fields of a project.
+
+    Only the columns whose value changes are written; when nothing differs,
+    the database is not written at all.
+
+    Parameters:
+    -----------
+    project_id : int
+        The ID of the project to update.
+    project : ProjectUpdate
+        The fields to change, provided in the request body.
+
+    Returns:
+    --------
+    Project:
+        The project, with its new values.
+    """
+    return ProjectService.patch_project(project_id, project)
+
 @project_route.delete("/{project_id}")
 def delete_project(project_id: int):
     """
@@ -4,32 +4,149 @@ It allows fetching, creating, updating, and deleting tasks in the database.
 """
 
 # Import APIRouter from FastAPI to create routes
-from fastapi import APIRouter, Body
+from fastapi import APIRouter, Body, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
 
 # Import the Task data model from Pydantic
-from models.task import Task
+from models.task import Task, TaskStatus, TaskUpdate
 
 from services.task_service import TaskService
+from services.status_buffer import TaskStatusService, STATUS_DURABILITY
+from services.archive_service import ArchiveService
+
+from helpers.batch_lookup import parse_ids
+from helpers.row_counts import COUNT_PATTERN, add_total_count
+from helpers.change_feed import change_feed
+from helpers.single_flight import coalesced_json, SINGLE_FLIGHT_LIST_TIMEOUT
 
 # Create an instance of APIRouter for task routes
 task_route = APIRouter()
 
 @task_route.get("/")
-def get_all_tasks():
+def get_all_tasks(
+    ids: str = Query(None, description="Comma-separated task IDs"),
+    include_archived: bool = Query(False),
+    after: int = Query(0, ge=0, description="Only return the tasks with a greater ID"),
+    limit: int = Query(None, ge=1, description="Maximum number of tasks to return"),
+    count: str = Query("none", pattern=COUNT_PATTERN, description="exact, estimate or none"),
+):
     """
-    Retrieves all the tasks stored in the database.
+    Retrieves all the tasks stored in the database, or only the requested ones.
+
+    The tasks are ordered by ID; pass the ID of the last task received as
+    `after` to get the next page. With `count`, the `X-Total-Count` header
+    gives the number of tasks of the whole list, whatever the page.
+
+    Parameters:
+    -----------
+    ids : str, optional
+        Comma-separated list of task IDs (e.g. `1,2,3`) to fetch in one query.
+    include_archived : bool, optional
+        Whether to also return the archived tasks (with their `archived_at`).
+    after : int, optional
+        Only return the tasks with a greater ID.
+    limit : int, optional
+        Maximum number of tasks to return (all by default).
+    count : str, optional
+        "exact" or "estimate" to get the total in `X-Total-Count`; it is
+        always exact, read from the task counters. "none" by default.
 
     Returns:
     --------
     list:
         A list of all tasks.
     dict:
-        In case of error, returns a dictionary with the error message.
+        When `ids` is given, the tasks found in request order (`results`)
+        and the IDs that do not exist (`not_found`).
+    """
+    if ids is not None:
+        task_ids = parse_ids(ids)
+        return coalesced_json(
+            ("tasks", tuple(task_ids), include_archived),
+            lambda: TaskService.get_tasks_by_ids(task_ids, include_archived),
+        )
+    response = coalesced_json(
+        ("tasks", include_archived, after, limit),
+        lambda: TaskService.get_all_tasks(include_archived, after, limit),
+        SINGLE_FLIGHT_LIST_TIMEOUT,
+    )
+    add_total_count(response, count, lambda: TaskService.count_tasks(include_archived))
+    return response
+
+@task_route.get("/search")
+def search_tasks(
+    response: Response,
+    q: str = Query(..., max_length=200),
+    page: int = Query(1, ge=1),
+    size: int = Query(20, ge=1, le=100),
+    count: str = Query("none", pattern=COUNT_PATTERN, description="exact, estimate or none"),
+):
+    """
+    Searches tasks by keyword in their title and description.
+
+    With `count`, the `X-Total-Count` header gives the number of matching
+    tasks: "exact" counts them like the search does, "estimate" only counts
+    the matches in the full-text index, which is cheaper but also includes
+    the tasks of the deleted projects not purged yet.
+
+    Parameters:
+    -----------
+    q : str
+        The keywords to search for.
+    page : int
+        The page of results to return, starting at 1.
+    size : int
+        The number of results per page (max. 100).
+    count : str, optional
+        "exact", "estimate" or "none" (default).
+
+    Returns:
+    --------
+    list:
+        The matching tasks, ranked by relevance.
+    """
+    add_total_count(
+        response,
+        count,
+        lambda: TaskService.count_matches(q),
+        lambda: TaskService.count_matches(q, estimate=True),
+    )
+    return TaskService.search_tasks(q, page, size)
+
+@task_route.get("/changes")
+async def get_task_changes(
+    request: Request,
+    project_id: int = Query(None),
+    last_event_id: str = Header(None),
+):
+    """
+    Streams the changes made to tasks as Server-Sent Events.
+
+    Each event carries the action ("created", "updated", "deleted"...) and the
+    task data. Reconnecting with the `Last-Event-ID` header resumes the stream
+    after the last event received; a "reset" event means some changes were lost
+    and the client must reload the tasks.
+
+    Parameters:
+    -----------
+    project_id : int, optional
+        Only stream the changes of this project.
+    last_event_id : str, optional
+        The ID of the last event received, sent as the `Last-Event-ID` header.
+
+    Returns:
+    --------
+    StreamingResponse:
+        A `text/event-stream` response that stays open until the client leaves.
     """
-    return TaskService.get_all_tasks()
+    return StreamingResponse(
+        change_feed.stream(request, "tasks", last_event_id, project_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @task_route.get("/{task_id}")
-def get_task(task_id: int):
+def get_task(task_id: int, include_archived: bool = Query(False)):
     """
     Retrieves a specific task by its ID.
 
@@ -37,6 +154,8 @@ def get_task(task_id: int):
     -----------
     task_id : int
         The ID of the task to retrieve.
+    include_archived : bool, optional
+        Whether to also look for the task in the archive.
 
     Returns:
     --------
@@ -45,7 +164,10 @@ def get_task(task_id: int):
     dict:
         In case of error, returns a dictionary with the error message.
     """
-    return TaskService.get_task(task_id)
+    return coalesced_json(
+        ("tasks", task_id, include_archived),
+        lambda: TaskService.get_task(task_id, include_archived),
+    )
 
 @task_route.post("/")
 def create_task(task: Task = Body(...)):
@@ -87,6 +209,73 @@ def update_task(task_id: int, task: Task = Body(...)):
     """
     return TaskService.update_task(task_id,task)
 
+@task_route.patch("/{task_id}")
+def patch_task(task_id: int, task: TaskUpdate = Body(...)):
+    """
+    Updates only the given fields of a task.
+
+    Only the columns whose value changes are written; when nothing differs,
+    the database is not written at all.
+
+    Parameters:
+    -----------
+    task_id : int
+        The ID of the task to update.
+    task : TaskUpdate
+        The fields to change, provided in the request body.
+
+    Returns:
+    --------
+    Task:
+        The task, with its new values.
+    """
+    return TaskService.patch_task(task_id, task)
+
+@task_route.patch("/{task_id}/status")
+def update_task_status(response: Response, task_id: int, task_status: TaskStatus = Body(...)):
+    """
+    Changes only the status of a task.
+
+    Changes are buffered and written in batches; depending on the configured
+    durability the response is sent once the change is committed (200) or as
+    soon as it is buffered (202).
+
+    Parameters:
+    -----------
+    task_id : int
+        The ID of the task to update.
+    task_status : TaskStatus
+        The new status, provided in the request body.
+
+    Returns:
+    --------
+    dict:
+        The change and whether it is already committed (`flushed`).
+    """
+    if STATUS_DURABILITY == "buffered":
+        response.status_code = 202
+    return TaskStatusService.update_status(task_id, task_status.status)
+
+@task_route.post("/{task_id}/restore")
+def restore_task(task_id: int, reopen: bool = Query(False)):
+    """
+    Moves an archived task back to the active tasks.
+
+    Parameters:
+    -----------
+    task_id : int
+        The ID of the archived task.
+    reopen : bool, optional
+        Whether to also mark the task as pending; otherwise a task that is
+        still archivable is archived again by the next run.
+
+    Returns:
+    --------
+    TaskModel:
+        The restored task.
+    """
+    return ArchiveService.restore_task(task_id, reopen)
+
 @task_route.delete("/{task_id}")
 def delete_task(task_id: int):
     """
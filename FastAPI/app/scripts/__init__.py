@@ -0,0 +1,5 @@
+"""
+Command line tools for development and capacity testing.
+
+Run them from the `FastAPI/app` directory, e.g. `python -m scripts.seed --help`.
+"""
@@ -0,0 +1,148 @@
+"""
+Measures the cold start of the application, with and without FAST_STARTUP.
+
+For each mode and run, in fresh processes started with the current
+environment:
+- `import`: the time to import the application (`import main`);
+- `ready`: the time from launching uvicorn to the first successful response;
+- `openapi`: the latency of the first `GET /openapi.json`;
+- `first` and `second`: the latency of the first two `GET /tasks/{id}`
+  requests served once ready, to show what the warm-up leaves to the first
+  requests.
+
+The medians of each mode are printed. The OpenAPI cache is written to a
+temporary file: the first fast start generates it, the next ones load it.
+
+Usage (from `FastAPI/app`, with the same environment as the application):
+
+    python -m scripts.bench_startup --runs 5
+"""
+
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from helpers.api_key_auth import API_KEY, API_KEY_NAME
+
+# Code timing the import of the application in a fresh interpreter
+IMPORT_PROBE = (
+    "import time; started = time.perf_counter(); import main; "
+    "print(time.perf_counter() - started)"
+)
+
+# Seconds to wait for a server to answer
+READY_TIMEOUT = 60
+
+
+def parse_args(argv=None):
+    """
+    Parses the command line options.
+
+    :param argv: The arguments to parse (defaults to `sys.argv`).
+    :return: The parsed options.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--runs", type=int, default=5, help="cold starts per mode")
+    return parser.parse_args(argv)
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def _get(port: int, path: str):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=READY_TIMEOUT)
+    try:
+        started = time.perf_counter()
+        connection.request("GET", path, headers={API_KEY_NAME: API_KEY or ""})
+        response = connection.getresponse()
+        response.read()
+        return response.status, time.perf_counter() - started
+    finally:
+        connection.close()
+
+
+def measure_import(env: dict):
+    """
+    Times `import main` in a fresh interpreter.
+
+    :param env: The environment of the process.
+    :return: The import time, in seconds.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE],
+        env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return float(output.split()[-1])
+
+
+def measure_start(env: dict):
+    """
+    Starts uvicorn and times its first responses.
+
+    :param env: The environment of the process.
+    :return: The ready, openapi, first and second timings, in seconds.
+    """
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        while True:
+            if server.poll() is not None:
+                sys.exit("The server exited during startup")
+            if time.perf_counter() - started > READY_TIMEOUT:
+                sys.exit("The server did not answer in time")
+            try:
+                status, _ = _get(port, "/tasks/1")
+            except OSError:
+                time.sleep(0.005)
+                continue
+            if status < 500:
+                break
+        ready = time.perf_counter() - started
+        _, openapi = _get(port, "/openapi.json")
+        _, first = _get(port, "/tasks/2")
+        _, second = _get(port, "/tasks/3")
+        return ready, openapi, first, second
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv=None):
+    """
+    Entry point of the startup benchmark.
+
+    :param argv: The command line arguments (defaults to `sys.argv`).
+    """
+    options = parse_args(argv)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        print(f"median of {options.runs} cold starts, in ms")
+        print(f"{'mode':<10}{'import':>9}{'ready':>9}{'openapi':>9}{'first':>9}{'second':>9}")
+        for mode in ("standard", "fast"):
+            env = dict(
+                os.environ,
+                FAST_STARTUP="1" if mode == "fast" else "0",
+                OPENAPI_CACHE=os.path.join(cache_dir, "openapi.json"),
+            )
+            timings = [
+                (measure_import(env), *measure_start(env)) for _ in range(options.runs)
+            ]
+            medians = [statistics.median(column) * 1000 for column in zip(*timings)]
+            print(f"{mode:<10}" + "".join(f"{value:>9.1f}" for value in medians))
+
+
+if __name__ == "__main__":
+    main()
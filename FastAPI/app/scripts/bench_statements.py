@@ -0,0 +1,200 @@
+"""
+Compares the precompiled statements with the query builder on the hot paths.
+
+Each case runs the same statement both ways, against the configured (seeded)
+database: the query-builder path the services used before
+(`TaskModel.get(...)`-style calls that rebuild the expression tree and its
+SQL) and the precompiled path of `helpers/statement_cache.py`. The time per
+call of each path and the speed-up are printed. With `--sql-only`, the
+statements are only turned into SQL and parameters, not run, which isolates
+the CPU cost of the query builder.
+
+The update case writes back the current values of its rows and the delete
+case targets IDs that do not exist, so the data is left unchanged. When
+sharded, the benchmark runs on the first shard.
+
+Usage (from `FastAPI/app`, after seeding the database):
+
+    python -m scripts.bench_statements --iterations 5000
+"""
+
+# Pylint does not see through peewee's @database_required on the query methods
+# pylint: disable=no-value-for-parameter
+
+import argparse
+import sys
+import time
+
+from peewee import SelectBase
+from database import (
+    database,
+    init_database,
+    shard_databases,
+    use_shard,
+    EmployeeModel,
+    ProjectModel,
+    TaskModel,
+)
+from helpers.statement_cache import statements
+from services.project_service import ProjectService
+from services.task_service import TaskService
+# Registers the employee statements
+import services.employee_service  # pylint: disable=unused-import,wrong-import-order
+
+# Rows per page of the list cases
+PAGE_SIZE = 50
+
+# Columns written back by the update case
+TASK_COLUMNS = ("project_id", "employee_id", "title", "description", "deadline", "status")
+
+
+def parse_args(argv=None):
+    """
+    Parses the command line options.
+
+    :param argv: The arguments to parse (defaults to `sys.argv`).
+    :return: The parsed options.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--iterations", type=int, default=2000, help="calls per path and case")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per path; the best is kept")
+    parser.add_argument(
+        "--sql-only", action="store_true", help="only generate the SQL, do not run it"
+    )
+    return parser.parse_args(argv)
+
+
+def _ids(model, count: int):
+    ids = [row_id for (row_id,) in model.select(model.id).order_by(model.id).limit(count).tuples()]
+    if not ids:
+        sys.exit(f"No {model.__name__} rows: seed the database first")
+    return ids
+
+
+def _task_page(after: int):
+    deleted = ProjectModel.select(ProjectModel.id).where(ProjectModel.deleted_at.is_null(False))
+    return (
+        TaskModel.select()
+        .where((TaskModel.id > after) & TaskModel.project_id.not_in(deleted))
+        .order_by(TaskModel.id)
+        .limit(PAGE_SIZE)
+    )
+
+
+def _task_update(task):
+    return TaskModel.update(
+        {getattr(TaskModel, name): task.__data__[name] for name in TASK_COLUMNS}
+    ).where(TaskModel.id == task.id)
+
+
+def cases(options):
+    """
+    Builds the benchmark cases.
+
+    :param options: The parsed command line options.
+    :return: (name, builder, precompiled) tuples; both functions take a row index.
+    """
+    count = options.iterations
+    employee_ids = _ids(EmployeeModel, count)
+    project_ids = _ids(ProjectModel, count)
+    task_ids = _ids(TaskModel, count)
+    tasks = list(TaskModel.select().where(TaskModel.id.in_(task_ids[:100])))
+
+    def pick(ids, index):
+        return ids[index % len(ids)]
+
+    if options.sql_only:
+        def run_query(query):
+            return query.sql()
+
+        def run_statement(name, **params):
+            return statements.sql(name, **params)
+    else:
+        def run_query(query):
+            return list(query) if isinstance(query, SelectBase) else query.execute()
+
+        def run_statement(name, **params):
+            if name.endswith((".update", ".delete")):
+                return statements.execute(name, **params)
+            return statements.select(name, **params)
+
+    return [
+        (
+            "employees.get",
+            lambda i: run_query(
+                EmployeeModel.select().where(EmployeeModel.id == pick(employee_ids, i)).limit(1)
+            ),
+            lambda i: run_statement("employees.get", id=pick(employee_ids, i)),
+        ),
+        (
+            "projects.get",
+            lambda i: run_query(
+                ProjectService.active_projects()
+                .where(ProjectModel.id == pick(project_ids, i))
+                .limit(1)
+            ),
+            lambda i: run_statement("projects.get", id=pick(project_ids, i)),
+        ),
+        (
+            "tasks.get",
+            lambda i: run_query(
+                TaskService.active_tasks().where(TaskModel.id == pick(task_ids, i)).limit(1)
+            ),
+            lambda i: run_statement("tasks.get", id=pick(task_ids, i)),
+        ),
+        (
+            "tasks.page",
+            lambda i: run_query(_task_page(pick(task_ids, i))),
+            lambda i: run_statement("tasks.page", after=pick(task_ids, i), limit=PAGE_SIZE),
+        ),
+        (
+            "tasks.update",
+            lambda i: run_query(_task_update(pick(tasks, i))),
+            lambda i: run_statement("tasks.update", **pick(tasks, i).__data__),
+        ),
+        (
+            "tasks.delete",
+            lambda i: run_query(TaskModel.delete().where(TaskModel.id == -1 - i)),
+            lambda i: run_statement("tasks.delete", id=-1 - i),
+        ),
+    ]
+
+
+def _time(func, options):
+    best = None
+    for _ in range(options.repeat):
+        started = time.perf_counter()
+        for index in range(options.iterations):
+            func(index)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / options.iterations * 1e6
+
+
+def main(argv=None):
+    """
+    Entry point of the benchmark.
+
+    :param argv: The command line arguments (defaults to `sys.argv`).
+    """
+    options = parse_args(argv)
+    with database.connection_context():
+        init_database()
+    with database.connection_context(), use_shard(shard_databases[0]):
+        mode = "SQL generation only" if options.sql_only else "statements run"
+        print(f"{options.iterations} calls per path, best of {options.repeat} ({mode})")
+        print(f"{'case':<15}{'builder':>12}{'precompiled':>14}{'speed-up':>10}")
+        for name, builder, precompiled in cases(options):
+            # Compile the statement and warm the caches before timing
+            builder(0)
+            precompiled(0)
+            builder_us = _time(builder, options)
+            precompiled_us = _time(precompiled, options)
+            print(
+                f"{name:<15}{builder_us:>10.1f}us{precompiled_us:>12.1f}us"
+                f"{builder_us / precompiled_us:>9.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""
+Checks the query plans of every SQL statement run by the API routes.
+
+The routes are called in-process against the configured (seeded) database,
+every statement they run is captured, and its plan is obtained with `EXPLAIN`
+(`EXPLAIN QUERY PLAN` on SQLite). A statement fails the check when it reads a
+large table with a full scan or sorts its rows without an index (filesort),
+unless the route and table are listed in `ALLOWLIST` with the reason.
+
+A report of the statements and plans of each route is printed, and the exit
+status is 1 when a check fails, so the tool can gate CI or a release.
+
+Seed the database first (the planners only avoid scans on tables with enough
+rows), e.g. from `FastAPI/app`:
+
+    python -m scripts.seed --tasks 200000
+    python -m scripts.check_query_plans --report plans.txt
+
+The rows created by the write routes are removed at the end. When sharded,
+the statements run on every shard are captured and explained on their shard.
+"""
+
+# Pylint does not see through peewee's @database_required on the query methods
+# pylint: disable=no-value-for-parameter
+
+import argparse
+import io
+import re
+import sys
+import threading
+
+from fastapi.testclient import TestClient
+from peewee import fn
+from database import (
+    database,
+    init_database,
+    is_sqlite,
+    shard_databases,
+    ArchivedTaskModel,
+    EmployeeModel,
+    ProjectModel,
+    TaskModel,
+)
+from helpers.api_key_auth import API_KEY, API_KEY_NAME
+from helpers.sharding import fan_out, on_project_shard
+from main import app
+from services.status_buffer import status_buffer
+
+# Full scans and sorts that are expected, by (route, table), with the reason
+ALLOWLIST = {
+    ("GET /employees/", "employees"): "lists every employee by design",
+    ("GET /projects/", "projects"): "lists every project by design",
+    ("GET /tasks/", "tasks"): "lists every task by design",
+    ("GET /tasks/?include_archived", "tasks"): "lists every task by design",
+    ("GET /tasks/?include_archived", "tasks_archive"): "lists every task by design",
+    ("GET /tasks/search?q", "sort"): "matches are ranked by relevance",
+    ("GET /tasks/search?q&count", "sort"): "matches are ranked by relevance",
+}
+
+# Routes called, in order. Paths and bodies may use the IDs of existing rows
+# ({task}, {project}, {employee}, {employee_email}) and of the rows created by the POST routes
+# ({new_task}, {new_project}, {new_employee}).
+SCENARIOS = (
+    ("GET", "/employees/", None),
+    ("GET", "/employees/?ids={employee},{new_employee_guess}", None),
+    ("GET", "/employees/{employee}", None),
+    ("GET", "/employees/by-email/{employee_email}", None),
+    ("POST", "/employees/", {"name": "Plan", "email": "plan@example.com",
+                             "phone": "0", "post": "Tester"}),
+    ("PUT", "/employees/{new_employee}", {"name": "Plan", "email": "plan2@example.com",
+                                          "phone": "0", "post": "Tester"}),
+    ("PATCH", "/employees/{new_employee}", {"post": "Analyst"}),
+    ("GET", "/projects/", None),
+    ("GET", "/projects/?after={project}&limit=50", None),
+    ("GET", "/projects/?ids={project},{new_project_guess}", None),
+    ("GET", "/projects/{project}", None),
+    ("POST", "/projects/", {"name": "Plan", "description": "Plan check",
+                            "init_date": "2024-01-01", "finish_date": "2024-12-31"}),
+    ("PUT", "/projects/{new_project}", {"name": "Plan", "description": "Plan check",
+                                        "init_date": "2024-01-01", "finish_date": "2025-12-31"}),
+    ("PATCH", "/projects/{new_project}", {"name": "Plan 2"}),
+    ("POST", "/projects/{project}/tasks/restore", None),
+    ("GET", "/tasks/", None),
+    ("GET", "/tasks/?include_archived=true", None),
+    ("GET", "/tasks/?after={task_page}&limit=50", None),
+    ("GET", "/tasks/?after={task_page}&limit=50&count=exact", None),
+    ("GET", "/tasks/?include_archived=true&after={task_page}&limit=50", None),
+    ("GET", "/tasks/?ids={task},{new_task_guess}", None),
+    ("GET", "/tasks/?ids={task},{new_task_guess}&include_archived=true", None),
+    ("GET", "/tasks/{task}", None),
+    ("GET", "/tasks/{new_task_guess}?include_archived=true", None),
+    ("GET", "/tasks/search?q=report", None),
+    ("GET", "/tasks/search?q=report&count=exact", None),
+    ("GET", "/tasks/search?q=report&count=estimate", None),
+    ("POST", "/tasks/", {"project_id": "{new_project}", "employee_id": "{new_employee}",
+                         "title": "Plan", "description": "Plan check",
+                         "deadline": "2024-06-01", "status": False}),
+    ("PUT", "/tasks/{new_task}", {"project_id": "{new_project}", "employee_id": "{new_employee}",
+                                  "title": "Plan", "description": "Plan check 2",
+                                  "deadline": "2024-06-02", "status": False}),
+    ("PATCH", "/tasks/{new_task}", {"deadline": "2024-07-01"}),
+    ("PATCH", "/tasks/{new_task}/status", {"status": True}),
+    ("POST", "/tasks/{new_task_guess}/restore", None),
+    ("DELETE", "/tasks/{new_task}", None),
+    ("DELETE", "/projects/{new_project}", None),
+    ("GET", "/projects/{new_project}/purge", None),
+    ("DELETE", "/employees/{new_employee}", None),
+)
+
+# The ID of the newest row is remembered after each POST route
+CREATED = {
+    "/employees/": ("new_employee", EmployeeModel),
+    "/projects/": ("new_project", ProjectModel),
+    "/tasks/": ("new_task", TaskModel),
+}
+
+# Statements that have no plan to check
+SKIPPED = re.compile(r"^\s*(INSERT\s+INTO\s+\S+\s*\([^)]*\)\s*VALUES|BEGIN|COMMIT|ROLLBACK|"
+                     r"SAVEPOINT|RELEASE|PRAGMA|SET|SHOW|CREATE|DROP|ALTER)", re.IGNORECASE)
+
+
+class StatementRecorder:
+    """
+    Captures the statements run through the database, tagged with the route
+    being called, including those run by the threadpool and the status flusher.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # The main database and the shards, each once
+        self.databases = list(dict.fromkeys([database, *shard_databases]))
+        self.route = None
+        self.statements = {}
+
+    def __enter__(self):
+        for db in self.databases:
+            db.execute_sql = self._recorder(db)
+        return self
+
+    def __exit__(self, *exc):
+        for db in self.databases:
+            del db.execute_sql  # Back to the method of the class
+
+    def _recorder(self, db):
+        execute_sql = type(db).execute_sql
+
+        def record(sql, params=None, commit=None):
+            with self._lock:
+                if self.route is not None:
+                    self.statements.setdefault(self.route, []).append(
+                        (db, sql, tuple(params or ()))
+                    )
+            return execute_sql(db, sql, params, commit)
+        return record
+
+    @staticmethod
+    def explain(db, sql: str, params: tuple):
+        """
+        Returns the plan of a statement.
+
+        :param db: The database the statement ran on.
+        :param sql: The statement.
+        :param params: Its parameters.
+        :return: The plan as a list of (table, detail) tuples.
+        """
+        if is_sqlite():
+            rows = db.execute_sql(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            return [(None, row[-1]) for row in rows]
+        cursor = db.execute_sql(f"EXPLAIN {sql}", params)
+        names = [column[0] for column in cursor.description]
+        plan = []
+        for row in cursor.fetchall():
+            row = dict(zip(names, row))
+            detail = f"type={row.get('type')} key={row.get('key')} rows={row.get('rows')}"
+            plan.append((row.get("table"), f"{detail} extra={row.get('Extra')}"))
+        return plan
+
+
+def problems(sql: str, plan: list, large_tables: set):
+    """
+    Finds the full scans of large tables and the filesorts of a plan.
+
+    :param sql: The statement, used to map the aliases of the plan to tables.
+    :param plan: The plan, as returned by `StatementRecorder.explain`.
+    :param large_tables: The tables with enough rows to matter.
+    :return: A list of (table, problem) tuples; "sort" stands for the table
+             of a filesort.
+    """
+    aliases = {alias: table for table, alias in re.findall(r'[`"](\w+)[`"] AS [`"](\w+)[`"]', sql)}
+    found = []
+    for table, detail in plan:
+        if is_sqlite():
+            scan = re.match(r"SCAN (\w+)", detail)
+            table = aliases.get(scan.group(1), scan.group(1)) if scan else None
+            if table in large_tables and "VIRTUAL TABLE" not in detail:
+                found.append((table, "full scan"))
+            if "USE TEMP B-TREE FOR ORDER BY" in detail:
+                found.append(("sort", "filesort"))
+        else:
+            table = aliases.get(table, table)
+            if table in large_tables and re.search(r"type=(ALL|index) ", detail):
+                found.append((table, "full scan"))
+            if "Using filesort" in detail:
+                found.append(("sort", "filesort"))
+    return found
+
+
+def _row_counts():
+    models = {
+        "employees": EmployeeModel,
+        "projects": ProjectModel,
+        "tasks": TaskModel,
+        "tasks_archive": ArchivedTaskModel,
+    }
+    counts = {"employees": EmployeeModel.select().count()}
+    for table, model in models.items():
+        if table != "employees":
+            counts[table] = sum(fan_out(lambda _, model=model: model.select().count()))
+    return counts
+
+
+def _fill(value, ids: dict):
+    if isinstance(value, dict):
+        return {key: _fill(item, ids) for key, item in value.items()}
+    if isinstance(value, str):
+        filled = value.format(**ids)
+        return int(filled) if filled.isdigit() and value.startswith("{") else filled
+    return value
+
+
+def _newest_id(model):
+    if model is EmployeeModel:
+        return model.select(fn.MAX(model.id)).scalar() or 0
+    return max(fan_out(lambda _: model.select(fn.MAX(model.id)).scalar() or 0))
+
+
+def _newest_task():
+    newest = fan_out(lambda _: TaskModel.select().order_by(TaskModel.id.desc()).first())
+    return max((task for task in newest if task), key=lambda task: task.id, default=None)
+
+
+def route_label(method: str, path: str):
+    """
+    Names a scenario after its method, path and query parameter names.
+
+    :return: E.g. "GET /tasks/{id}" or "GET /tasks/?ids&include_archived".
+    """
+    route, _, query = path.partition("?")
+    label = f"{method} {re.sub(r'{[a-z_]+}', '{id}', route)}"
+    if query:
+        label += "?" + "&".join(param.split("=")[0] for param in query.split("&"))
+    return label
+
+
+def run_routes(recorder: StatementRecorder, ids: dict):
+    """
+    Calls every route of `SCENARIOS` while recording its statements.
+
+    :param recorder: The recorder capturing the statements.
+    :param ids: The IDs of existing rows used in the paths and bodies.
+    :return: The HTTP status of each route.
+    """
+    client = TestClient(app)
+    headers = {API_KEY_NAME: API_KEY or ""}
+    statuses = {}
+    for method, path, body in SCENARIOS:
+        label = route_label(method, path)
+        recorder.route = label
+        response = client.request(method, _fill(path, ids), json=_fill(body, ids),
+                                  headers=headers)
+        recorder.route = None
+        statuses[label] = response.status_code
+        if method == "POST" and path in CREATED:
+            key, model = CREATED[path]
+            ids[key] = _newest_id(model)
+    return statuses
+
+
+def _cleanup(ids: dict):
+    # Rows left by the write routes (the deleted project is only soft-deleted)
+    if "new_project" in ids:
+        with on_project_shard(ids["new_project"]):
+            TaskModel.delete().where(TaskModel.id == ids.get("new_task")).execute()
+            ProjectModel.delete().where(ProjectModel.id == ids["new_project"]).execute()
+    EmployeeModel.delete().where(EmployeeModel.id == ids.get("new_employee")).execute()
+
+
+def check(recorder: StatementRecorder, statuses: dict, large_tables: set, out):
+    """
+    Explains the recorded statements and writes the report.
+
+    :return: The number of failed checks.
+    """
+    failures = 0
+    for route, statements in recorder.statements.items():
+        print(f"\n=== {route} (HTTP {statuses.get(route)})", file=out)
+        seen = set()
+        for statement in statements:
+            sql = statement[1]
+            if sql in seen or SKIPPED.match(sql):
+                continue
+            seen.add(sql)
+            plan = recorder.explain(*statement)
+            print(f"  {sql}", file=out)
+            for table, detail in plan:
+                print(f"    | {table + ': ' if table else ''}{detail}", file=out)
+            for table, problem in problems(sql, plan, large_tables):
+                reason = ALLOWLIST.get((route, table))
+                if reason:
+                    print(f"    ok   {problem} on {table} allowed: {reason}", file=out)
+                else:
+                    failures += 1
+                    print(f"    FAIL {problem} on {table}", file=out)
+    return failures
+
+
+def main(argv=None):
+    """
+    Entry point of the query plan check.
+
+    :param argv: The command line arguments (defaults to `sys.argv`).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--large-table-rows", type=int, default=10000,
+        help="row count from which a full scan of a table fails the check",
+    )
+    parser.add_argument("--report", help="also write the report to this file")
+    options = parser.parse_args(argv)
+
+    with database.connection_context():
+        init_database()
+        counts = _row_counts()
+        task = _newest_task()
+        employee = task and EmployeeModel.get_by_id(task.employee_id_id)
+    if task is None:
+        sys.exit("The database has no task, seed it first (python -m scripts.seed)")
+    large_tables = {table for table, count in counts.items() if count >= options.large_table_rows}
+    ids = {
+        "task": task.id,
+        "task_page": task.id // 2,  # A keyset page in the middle of the tasks
+        "project": task.project_id_id,
+        "employee": task.employee_id_id,
+        "employee_email": employee.email.upper(),  # Looked up whatever its case
+        # IDs the created rows should get; read before they exist, they check
+        # the "not found" paths
+        "new_task_guess": _newest_id(TaskModel) + 1,
+        "new_project_guess": _newest_id(ProjectModel) + 1,
+        "new_employee_guess": _newest_id(EmployeeModel) + 1,
+    }
+
+    status_buffer.start()
+    try:
+        with StatementRecorder() as recorder:
+            statuses = run_routes(recorder, ids)
+    finally:
+        status_buffer.stop()
+        with database.connection_context():
+            _cleanup(ids)
+
+    report = io.StringIO()
+    print(f"Row counts: {counts}; large tables: {sorted(large_tables)}", file=report)
+    with database.connection_context():
+        failures = check(recorder, statuses, large_tables, report)
+    print(f"\n{failures} failed check(s)", file=report)
+    print(report.getvalue(), end="")
+    if options.report:
+        with open(options.report, "w", encoding="utf-8") as file:
+            file.write(report.getvalue())
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
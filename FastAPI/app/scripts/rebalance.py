@@ -0,0 +1,232 @@
+"""
+Moves the projects, with their tasks and archived tasks, to their shard after
+the list of shards changed.
+
+Run it with SHARDS set to the new list of shards and `--from-shards` set to
+the databases the projects are in now: the previous SHARDS list, or the URL
+of the main database to shard an existing installation. Every project whose
+shard under the new list differs is copied there in batches, checked, then
+removed from its old database. The check only requires every task left in the
+old database to be on the new shard, so a project interrupted while being
+copied or removed is picked up again by the next run: the tool can be run
+again after an interruption.
+
+Stop the application while it runs: writes to a project being moved would
+be lost. With a jump consistent hash, adding an Nth shard only moves about
+1/N of the projects. The row counters of the shards are counted again at the
+end.
+
+Usage (from `FastAPI/app`, with the same environment as the application):
+
+    SHARDS=sqlite:///s0.db,sqlite:///s1.db,sqlite:///s2.db \\
+        python -m scripts.rebalance --from-shards sqlite:///s0.db,sqlite:///s1.db
+"""
+
+# Pylint does not see through peewee's @database_required on the query methods
+# pylint: disable=no-value-for-parameter
+
+import argparse
+import sys
+import time
+
+from database import (
+    SHARD_URLS,
+    connect_shard,
+    database,
+    init_database,
+    is_sharded,
+    shard_database,
+    shard_databases,
+    use_shard,
+    ArchivedTaskModel,
+    ProjectModel,
+    TaskModel,
+)
+from helpers.row_counts import row_counts
+from helpers.sharding import shard_for
+# Registers the counted lists of the shards
+import services.task_service  # pylint: disable=unused-import,wrong-import-order
+
+# Tables moved with each project, children first when deleting
+TASK_MODELS = (TaskModel, ArchivedTaskModel)
+
+
+def parse_args(argv=None):
+    """
+    Parses the command line options.
+
+    :param argv: The arguments to parse (defaults to `sys.argv`).
+    :return: The parsed options.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--from-shards", required=True,
+        help="comma-separated URLs of the databases holding the projects now",
+    )
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per transaction")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only report what would be moved"
+    )
+    return parser.parse_args(argv)
+
+
+def _fields(model):
+    return list(model._meta.sorted_fields)  # pylint: disable=protected-access
+
+
+def _task_count(model, project_id: int):
+    return model.select().where(model.project_id == project_id).count()
+
+
+class Rebalancer:
+    """
+    Moves the projects of the source databases to their shard.
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, options):
+        self.options = options
+        self.moved = {"projects": 0, "tasks": 0}
+
+    def run(self, sources: list):
+        """
+        Moves the misplaced projects of every source database.
+
+        :param sources: The (url, database) pairs holding the projects now.
+        """
+        for url, source in sources:
+            with use_shard(source):
+                project_ids = [
+                    project_id
+                    for (project_id,) in ProjectModel.select(ProjectModel.id)
+                    .order_by(ProjectModel.id)
+                    .tuples()
+                ]
+            for project_id in project_ids:
+                target = shard_for(project_id)
+                if target is not source:
+                    self._move(project_id, source, target)
+            print(f"{url}: {len(project_ids)} projects checked", file=sys.stderr)
+
+    def _move(self, project_id: int, source, target):
+        target_url = SHARD_URLS[shard_databases.index(target)]
+        with use_shard(source):
+            project = ProjectModel.get_by_id(project_id)
+            counts = [_task_count(model, project_id) for model in TASK_MODELS]
+        print(f"project {project_id}: {sum(counts)} tasks -> {target_url}", file=sys.stderr)
+        if self.options.dry_run:
+            self._count(sum(counts))
+            return
+
+        with use_shard(target), shard_database.atomic():
+            ProjectModel.insert(project.__data__).on_conflict_ignore().execute()
+        for model in TASK_MODELS:
+            self._copy_tasks(model, project_id, source, target)
+        # Compares the IDs rather than the counts: after an interrupted run,
+        # the old database can hold fewer tasks than the shard
+        missing = sum(
+            self._missing_tasks(model, project_id, source, target) for model in TASK_MODELS
+        )
+        if missing:
+            raise RuntimeError(
+                f"Project {project_id}: {missing} tasks not copied, left in place"
+            )
+
+        with use_shard(source):
+            for model in TASK_MODELS:
+                self._delete_tasks(model, project_id)
+            ProjectModel.delete().where(ProjectModel.id == project_id).execute()
+        self._count(sum(counts))
+
+    def _copy_tasks(self, model, project_id: int, source, target):
+        fields = _fields(model)
+        last_id = 0
+        while True:
+            with use_shard(source):
+                rows = list(
+                    model.select(*fields)
+                    .where((model.project_id == project_id) & (model.id > last_id))
+                    .order_by(model.id)
+                    .limit(self.options.batch_size)
+                    .tuples()
+                )
+            if not rows:
+                return
+            with use_shard(target), shard_database.atomic():
+                model.insert_many(rows, fields=fields).on_conflict_ignore().execute()
+            last_id = rows[-1][0]
+
+    def _missing_tasks(self, model, project_id: int, source, target):
+        missing = 0
+        last_id = 0
+        while True:
+            with use_shard(source):
+                task_ids = [
+                    task_id
+                    for (task_id,) in model.select(model.id)
+                    .where((model.project_id == project_id) & (model.id > last_id))
+                    .order_by(model.id)
+                    .limit(self.options.batch_size)
+                    .tuples()
+                ]
+            if not task_ids:
+                return missing
+            with use_shard(target):
+                found = (
+                    model.select()
+                    .where((model.project_id == project_id) & model.id.in_(task_ids))
+                    .count()
+                )
+            missing += len(task_ids) - found
+            last_id = task_ids[-1]
+
+    def _delete_tasks(self, model, project_id: int):
+        while True:
+            with shard_database.atomic():
+                task_ids = [
+                    task.id
+                    for task in model.select(model.id)
+                    .where(model.project_id == project_id)
+                    .limit(self.options.batch_size)
+                ]
+                if not task_ids:
+                    return
+                model.delete().where(model.id.in_(task_ids)).execute()
+
+    def _count(self, tasks: int):
+        self.moved["projects"] += 1
+        self.moved["tasks"] += tasks
+
+
+def main(argv=None):
+    """
+    Entry point of the rebalancing tool.
+
+    :param argv: The command line arguments (defaults to `sys.argv`).
+    """
+    options = parse_args(argv)
+    if not is_sharded():
+        sys.exit("SHARDS is not set: give the new list of shards")
+    urls = [url.strip() for url in options.from_shards.split(",") if url.strip()]
+    sources = [
+        (url, shard_databases[SHARD_URLS.index(url)] if url in SHARD_URLS else connect_shard(url))
+        for url in urls
+    ]
+
+    started = time.perf_counter()
+    with database.connection_context():
+        init_database()  # Creates the tables of the new shards
+        rebalancer = Rebalancer(options)
+        rebalancer.run(sources)
+        if not options.dry_run:
+            init_database()  # Moves the ID sequences past the IDs just moved in
+            row_counts.recount(["projects", "tasks", "tasks_archive"])
+    verb = "would move" if options.dry_run else "moved"
+    print(
+        f"{verb} {rebalancer.moved['projects']} projects and {rebalancer.moved['tasks']} tasks "
+        f"in {time.perf_counter() - started:.1f}s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
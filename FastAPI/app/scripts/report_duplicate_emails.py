@@ -0,0 +1,41 @@
+"""
+Reports the email addresses used by several employees, ignoring the case.
+
+The email of the employees is unique, but an installation that stored
+duplicates before gets a plain index instead until they are fixed (see
+`_init_email_index` in database.py). The tool lists every such address with
+the IDs of its employees, so they can be merged or corrected; the next start
+of the application then builds the unique index.
+
+The exit status is 1 when duplicates remain, so the tool can gate a release.
+
+Usage (from `FastAPI/app`, with the same environment as the application):
+
+    python -m scripts.report_duplicate_emails
+"""
+
+import argparse
+import sys
+
+from database import database, find_duplicate_emails
+
+
+def main(argv=None):
+    """
+    Entry point of the duplicate email report.
+
+    :param argv: The command line arguments (defaults to `sys.argv`).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.parse_args(argv)
+
+    with database.connection_context():
+        duplicates = find_duplicate_emails()
+    for email, employee_ids in duplicates:
+        print(f"{email}: employees {', '.join(str(employee_id) for employee_id in employee_ids)}")
+    print(f"{len(duplicates)} email address(es) used by several employees")
+    sys.exit(1 if duplicates else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+Generates a large synthetic dataset of employees, projects and tasks.
+
+The data is deterministic for a given `--seed`: every attribute is drawn from
+its own random stream, so the same options always produce the same rows,
+whatever the batch size. Rows get explicit IDs following the highest existing
+ones (or, when sharded, from the ID sequences), and are written with prepared
+bulk INSERTs in one transaction per batch and shard.
+
+While seeding, foreign key checks are turned off (the generated references are
+valid by construction) and, unless `--keep-indexes` is given, the task search
+index is dropped and rebuilt once at the end. If the tool is interrupted, the
+next application startup recreates the index. The row counters of the lists
+are counted again at the end.
+
+Usage (from `FastAPI/app`, with the same environment as the application):
+
+    python -m scripts.seed --employees 10000 --projects 50000 --tasks 10000000
+"""
+
+import argparse
+import bisect
+import itertools
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from peewee import fn
+from database import (
+    database,
+    init_database,
+    is_sharded,
+    is_sqlite,
+    shard_database,
+    shard_databases,
+    use_shard,
+    EmployeeModel,
+    ProjectModel,
+    TaskModel,
+    TASK_FULLTEXT_INDEX,
+)
+from helpers.bulk_insert import insert_values
+from helpers.row_counts import row_counts
+from helpers.sharding import group_by_shard, id_allocator
+# Register the counted lists
+import services.employee_service  # pylint: disable=unused-import,wrong-import-order
+import services.task_service  # pylint: disable=unused-import,wrong-import-order
+
+POSTS = ("Developer", "Designer", "Tester", "Analyst", "Manager", "Architect", "Support")
+VERBS = ("Review", "Build", "Fix", "Design", "Test", "Document", "Deploy", "Refactor")
+NOUNS = ("login", "report", "invoice", "dashboard", "API", "schema", "backup", "search")
+WORDS = (
+    "the client asked for changes to the flow before the release so the team "
+    "must check the data migration update the documentation and validate every "
+    "screen with the product owner while keeping the existing reports working"
+).split()
+
+
+def parse_args(argv=None):
+    """
+    Parses the command line options.
+
+    :param argv: The arguments to parse (defaults to `sys.argv`).
+    :return: The parsed options.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--employees", type=int, default=1000, help="employees to create")
+    parser.add_argument("--projects", type=int, default=1000, help="projects to create")
+    parser.add_argument("--tasks", type=int, default=100000, help="tasks to create")
+    parser.add_argument("--seed", type=int, default=42, help="random seed")
+    parser.add_argument("--batch-size", type=int, default=10000, help="rows per transaction")
+    parser.add_argument(
+        "--project-skew", type=float, default=1.0,
+        help="Zipf exponent of the number of tasks per project (0 = uniform)",
+    )
+    parser.add_argument(
+        "--employee-skew", type=float, default=0.5,
+        help="Zipf exponent of the number of tasks per employee (0 = uniform)",
+    )
+    parser.add_argument(
+        "--start-date", type=date.fromisoformat, default=date(2018, 1, 1),
+        help="earliest project start date (YYYY-MM-DD)",
+    )
+    parser.add_argument("--years", type=int, default=8, help="years over which projects start")
+    parser.add_argument(
+        "--max-duration", type=int, default=365, help="maximum project length, in days"
+    )
+    parser.add_argument(
+        "--deadline-spread", type=int, default=30,
+        help="days after the end of its project a task deadline may fall",
+    )
+    parser.add_argument(
+        "--done-ratio", type=float, default=0.6, help="share of completed tasks (0 to 1)"
+    )
+    parser.add_argument(
+        "--keep-indexes", action="store_true",
+        help="maintain the search index during the inserts instead of rebuilding it",
+    )
+    options = parser.parse_args(argv)
+    if options.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    return options
+
+
+class Seeder:
+    """
+    Generates and inserts the rows of one seeding run.
+    """
+    def __init__(self, options):
+        self.options = options
+        self.progress_at = 0.0
+        # (init_date, duration) of each generated project, used for the task deadlines
+        self.project_dates = []
+
+    def _random(self, stream: str):
+        # Separate stream per attribute, so the values never depend on the batch size
+        return random.Random(f"{self.options.seed}:{stream}")
+
+    @staticmethod
+    def _next_id(model, sequence: str = None, count: int = 0):
+        # The IDs of the sharded tables are reserved from their sequence
+        if sequence and is_sharded():
+            return id_allocator.reserve(sequence, count)
+        return (model.select(fn.MAX(model.id)).scalar() or 0) + 1
+
+    def _insert(self, label: str, fields: list, rows, project_column: int = None):
+        # project_column: position of the project ID in the rows of the sharded tables
+        model = fields[0].model
+        started = time.perf_counter()
+        done = 0
+        while True:
+            batch = list(itertools.islice(rows, self.options.batch_size))
+            if not batch:
+                break
+            if project_column is None:
+                with database.atomic():
+                    insert_values(model, fields, batch)
+            else:
+                groups = group_by_shard(batch, key=lambda row: row[project_column])
+                for shard, shard_rows in groups.items():
+                    with use_shard(shard), shard_database.atomic():
+                        insert_values(model, fields, shard_rows)
+            done += len(batch)
+            self._progress(label, done, started)
+        self._progress(label, done, started, force=True)
+
+    def _progress(self, label: str, done: int, started: float, force: bool = False):
+        now = time.perf_counter()
+        if force or now - self.progress_at >= 1:
+            self.progress_at = now
+            total = getattr(self.options, label)
+            rate = done / max(now - started, 1e-9)
+            end = "\n" if force else "\r"
+            print(f"{label}: {done}/{total} rows ({rate:,.0f} rows/s)", end=end, file=sys.stderr)
+
+    def _weights(self, stream: str, count: int, skew: float):
+        # Zipf weights given to the rows in a random order, so the largest
+        # fan-outs are spread over the ID range
+        ranks = list(range(1, count + 1))
+        self._random(stream).shuffle(ranks)
+        return list(itertools.accumulate(1 / rank ** skew for rank in ranks))
+
+    def employees(self, first_id: int):
+        """
+        Generates the employee rows.
+
+        :param first_id: The ID of the first employee.
+        :return: An iterator of (id, name, email, phone, post) tuples.
+        """
+        rng = self._random("employees")
+        for employee_id in range(first_id, first_id + self.options.employees):
+            yield (
+                employee_id,
+                f"Employee {employee_id}",
+                f"employee{employee_id}@example.com",
+                f"+57 3{rng.randrange(10 ** 9):09d}",
+                rng.choice(POSTS),
+            )
+
+    def projects(self, first_id: int):
+        """
+        Generates the project rows and remembers their dates for the tasks.
+
+        :param first_id: The ID of the first project.
+        :return: An iterator of (id, name, description, init_date, finish_date) tuples.
+        """
+        rng = self._random("projects")
+        span = self.options.years * 365
+        for project_id in range(first_id, first_id + self.options.projects):
+            init_date = self.options.start_date + timedelta(days=rng.randrange(span))
+            duration = rng.randint(30, max(30, self.options.max_duration))
+            self.project_dates.append((init_date, duration))
+            yield (
+                project_id,
+                f"Project {project_id}",
+                f"{rng.choice(VERBS)} the {rng.choice(NOUNS)} platform",
+                init_date.isoformat(),
+                (init_date + timedelta(days=duration)).isoformat(),
+            )
+
+    def tasks(self, first_id: int, first_project_id: int, first_employee_id: int):
+        """
+        Generates the task rows.
+
+        :param first_id: The ID of the first task.
+        :param first_project_id: The ID of the first generated project.
+        :param first_employee_id: The ID of the first generated employee.
+        :return: An iterator of (id, project_id, employee_id, title, description,
+                 deadline, status) tuples, produced batch by batch.
+        """
+        # pylint: disable=too-many-locals
+        options = self.options
+        project_weights = self._weights("project-fanout", options.projects, options.project_skew)
+        employee_weights = self._weights(
+            "employee-fanout", options.employees, options.employee_skew
+        )
+        project_rng = self._random("task-projects")
+        employee_rng = self._random("task-employees")
+        deadline_rng = self._random("task-deadlines")
+        status_rng = self._random("task-status")
+        text_rng = self._random("task-text")
+        text = " ".join(WORDS * 4)
+        done, pending = TaskModel.status.db_value(True), TaskModel.status.db_value(False)
+
+        def pick(rng, weights, count):
+            total = weights[-1]
+            return [bisect.bisect(weights, rng.random() * total) for _ in range(count)]
+
+        task_ids = itertools.count(first_id)
+        remaining = options.tasks
+        while remaining:
+            count = min(options.batch_size, remaining)
+            remaining -= count
+            projects = pick(project_rng, project_weights, count)
+            employees = pick(employee_rng, employee_weights, count)
+            for project, employee in zip(projects, employees):
+                init_date, duration = self.project_dates[project]
+                deadline = init_date + timedelta(
+                    days=deadline_rng.randrange(duration + options.deadline_spread + 1)
+                )
+                start = text_rng.randrange(len(text) - 200)
+                yield (
+                    next(task_ids),
+                    first_project_id + project,
+                    first_employee_id + employee,
+                    f"{text_rng.choice(VERBS)} {text_rng.choice(NOUNS)}",
+                    text[start:start + text_rng.randint(40, 200)],
+                    deadline.isoformat(),
+                    done if status_rng.random() < options.done_ratio else pending,
+                )
+
+    def run(self):
+        """
+        Creates the employees, then the projects, then the tasks.
+        """
+        options = self.options
+        first_employee_id = self._next_id(EmployeeModel)
+        first_project_id = self._next_id(ProjectModel, "projects", options.projects)
+
+        self._insert(
+            "employees",
+            [EmployeeModel.id, EmployeeModel.name, EmployeeModel.email,
+             EmployeeModel.phone, EmployeeModel.post],
+            self.employees(first_employee_id),
+        )
+        self._insert(
+            "projects",
+            [ProjectModel.id, ProjectModel.name, ProjectModel.description,
+             ProjectModel.init_date, ProjectModel.finish_date],
+            self.projects(first_project_id),
+            project_column=0,
+        )
+        if options.tasks and options.projects and options.employees:
+            self._insert(
+                "tasks",
+                [TaskModel.id, TaskModel.project_id, TaskModel.employee_id, TaskModel.title,
+                 TaskModel.description, TaskModel.deadline, TaskModel.status],
+                self.tasks(
+                    self._next_id(TaskModel, "tasks", options.tasks),
+                    first_project_id,
+                    first_employee_id,
+                ),
+                project_column=1,
+            )
+
+
+def _drop_search_index(shard):
+    # init_database() recreates (and on SQLite, refills) the index afterwards
+    if is_sqlite():
+        for trigger in ("tasks_fts_ai", "tasks_fts_ad", "tasks_fts_au"):
+            shard.execute_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+        shard.execute_sql("DROP TABLE IF EXISTS tasks_fts")
+    elif TASK_FULLTEXT_INDEX in {index.name for index in shard.get_indexes("tasks")}:
+        shard.execute_sql(f"DROP INDEX {TASK_FULLTEXT_INDEX} ON tasks")
+
+
+def _set_foreign_key_checks(enabled: bool):
+    for db in dict.fromkeys([database, *shard_databases]):
+        if is_sqlite():
+            db.execute_sql(f"PRAGMA foreign_keys = {int(enabled)}")
+            db.execute_sql(f"PRAGMA synchronous = {'NORMAL' if enabled else 'OFF'}")
+        else:
+            db.execute_sql(f"SET foreign_key_checks = {int(enabled)}")
+            db.execute_sql(f"SET unique_checks = {int(enabled)}")
+
+
+def main(argv=None):
+    """
+    Entry point of the seeding tool.
+
+    :param argv: The command line arguments (defaults to `sys.argv`).
+    """
+    options = parse_args(argv)
+    if min(options.employees, options.projects, options.tasks) < 0:
+        sys.exit("Row counts cannot be negative")
+    if options.tasks and not (options.employees and options.projects):
+        sys.exit("Tasks need at least one employee and one project")
+
+    started = time.perf_counter()
+    with database.connection_context():
+        init_database()
+        if not options.keep_indexes:
+            for shard in shard_databases:
+                _drop_search_index(shard)
+        _set_foreign_key_checks(False)
+        try:
+            Seeder(options).run()
+        finally:
+            _set_foreign_key_checks(True)
+            row_counts.recount()
+            if not options.keep_indexes:
+                index_started = time.perf_counter()
+                init_database()
+                print(
+                    f"search index rebuilt in {time.perf_counter() - index_started:.1f}s",
+                    file=sys.stderr,
+                )
+    print(f"done in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
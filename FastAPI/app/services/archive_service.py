@@ -0,0 +1,322 @@
+"""
+This module provides the archival of the completed tasks of finished projects.
+
+The 'tasks' table only keeps the tasks that still matter day to day. On a
+schedule (every `ARCHIVE_INTERVAL` seconds), the archiver moves the completed
+tasks of the projects that finished more than `ARCHIVE_AFTER_DAYS` days ago to
+the 'tasks_archive' table. Tasks are moved in batches of `ARCHIVE_BATCH_SIZE`,
+each copied and deleted in its own short transaction, so the hot table stays
+about the same size however many tasks pile up over the years.
+
+Reads only look at the 'tasks' table unless they pass `?include_archived=true`.
+Archived tasks are read-only: they have to be restored before being changed.
+When sharded, each shard archives the tasks of its own projects. Each move
+also moves the rows between the task and archived task counters, in its
+transaction (see helpers/row_counts.py). Once a batch is committed, an
+"archived" event is published on the change feed for each of its tasks.
+"""
+
+# Pylint does not see through peewee's @database_required on the query methods
+# pylint: disable=no-value-for-parameter
+
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from peewee import Value
+from fastapi import HTTPException
+from database import (
+    shard_database,
+    shard_databases,
+    use_shard,
+    ArchivedTaskModel,
+    ProjectModel,
+    TaskModel,
+)
+from helpers.background_thread import BackgroundThread
+from helpers.change_feed import change_feed
+from helpers.row_counts import row_counts
+from helpers.sharding import on_project_shard
+from services.project_service import ProjectService
+from services.task_service import TaskService
+
+# Seconds between two archival runs
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "3600"))
+
+# Days a project must have been finished before its completed tasks are archived
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+
+# Number of tasks moved per transaction
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+
+# Seconds to pause between two batches, which caps the write rate
+ARCHIVE_BATCH_DELAY = float(os.getenv("ARCHIVE_BATCH_DELAY", "0.1"))
+
+# Columns shared by the 'tasks' and 'tasks_archive' tables
+TASK_COLUMNS = ("id", "project_id", "employee_id", "title", "description", "deadline", "status")
+
+
+def _columns(model):
+    return [getattr(model, name) for name in TASK_COLUMNS]
+
+
+def _archivable(cutoff: date):
+    # Completed tasks of an active project finished before the cutoff
+    return (
+        (TaskModel.status == TaskModel.status.db_value(True))
+        & (ProjectModel.finish_date < cutoff)
+        & ProjectModel.deleted_at.is_null()
+    )
+
+
+def _restore(condition):
+    # Moves the archived tasks matching the condition back to 'tasks'
+    TaskModel.insert_from(
+        ArchivedTaskModel.select(*_columns(ArchivedTaskModel)).where(condition),
+        _columns(TaskModel),
+    ).execute()
+    restored = ArchivedTaskModel.delete().where(condition).execute()
+    row_counts.adjust("tasks_archive", -restored)
+    row_counts.adjust("tasks", restored)
+
+
+class TaskArchiver(BackgroundThread):
+    """
+    Background thread that moves the archivable tasks to the archive table.
+
+    Methods:
+        start()
+            Starts the archiver thread.
+
+        stop(timeout: float)
+            Stops the archiver after the current batch.
+
+        wake()
+            Starts an archival run right away instead of waiting for the schedule.
+
+        stats()
+            Returns the row counts of both tables and the archival totals.
+    """
+    thread_name = "task-archiver"
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._stats = {
+            "runs": 0,
+            "failed_runs": 0,
+            "tasks_archived": 0,
+            "tasks_restored": 0,
+            "last_run_at": None,
+            "last_run_ms": 0.0,
+            "last_run_archived": 0,
+        }
+
+    def _work(self):
+        while not self._stopping.is_set():
+            self._run()
+            self._wakeup.wait(ARCHIVE_INTERVAL)
+            self._wakeup.clear()
+
+    def _run(self):
+        started = time.perf_counter()
+        cutoff = date.today() - timedelta(days=ARCHIVE_AFTER_DAYS)
+        archived = 0
+        try:
+            for shard in shard_databases:
+                with use_shard(shard), shard_database.connection_context():
+                    while not self._stopping.is_set():
+                        moved = self._archive_batch(cutoff)
+                        if not moved:
+                            break
+                        # Once committed, so that readers drop the tasks
+                        # from their default views
+                        for task_id, project_id in moved:
+                            change_feed.publish(
+                                "tasks",
+                                "archived",
+                                {"id": task_id, "project_id": project_id},
+                                [project_id],
+                            )
+                        archived += len(moved)
+                        with self._lock:
+                            self._stats["tasks_archived"] += len(moved)
+                        self._stopping.wait(ARCHIVE_BATCH_DELAY)
+        except Exception:  # pylint: disable=broad-exception-caught
+            with self._lock:
+                self._stats["failed_runs"] += 1
+            return
+
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["last_run_at"] = datetime.now()
+            self._stats["last_run_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            self._stats["last_run_archived"] = archived
+
+    @staticmethod
+    def _archive_batch(cutoff: date):
+        with shard_database.atomic():
+            # Task IDs are never reused (see MonotonicAutoField), so the IDs of
+            # the archived tasks cannot collide with new tasks
+            task_ids = [
+                task.id
+                for task in TaskService.active_tasks(TaskModel.id)
+                .where(_archivable(cutoff))
+                .limit(ARCHIVE_BATCH_SIZE)
+            ]
+            if not task_ids:
+                return []
+            # The condition is checked again while copying, in case a task was
+            # reopened in the meantime, and only the copied rows are deleted
+            ArchivedTaskModel.insert_from(
+                TaskService.active_tasks(*_columns(TaskModel), Value(datetime.now()))
+                .where(TaskModel.id.in_(task_ids) & _archivable(cutoff)),
+                _columns(ArchivedTaskModel) + [ArchivedTaskModel.archived_at],
+            ).execute()
+            moved = list(
+                ArchivedTaskModel.select(ArchivedTaskModel.id, ArchivedTaskModel.project_id)
+                .where(ArchivedTaskModel.id.in_(task_ids))
+                .tuples()
+            )
+            deleted = (
+                TaskModel.delete()
+                .where(TaskModel.id.in_([task_id for task_id, _ in moved]))
+                .execute()
+            )
+            row_counts.adjust("tasks", -deleted)
+            row_counts.adjust("tasks_archive", deleted)
+            return moved
+
+    def count_restored(self, count: int):
+        """
+        Adds restored tasks to the totals.
+
+        :param count: The number of tasks moved back to the 'tasks' table.
+        """
+        with self._lock:
+            self._stats["tasks_restored"] += count
+
+    def stats(self):
+        """
+        Returns the row counts of both tables and the archival totals.
+
+        :return: The number of rows in 'tasks' (`hot_rows`) and 'tasks_archive'
+                 (`archived_rows`), the tasks archived and restored since
+                 startup, and the outcome and duration of the last run.
+        """
+        # From the maintained counters: counting the tables would scan them
+        hot_rows = row_counts.total("tasks")
+        archived_rows = row_counts.total("tasks_archive")
+        with self._lock:
+            return dict(self._stats, hot_rows=hot_rows, archived_rows=archived_rows)
+
+
+task_archiver = TaskArchiver()
+
+
+class ArchiveService:
+    """
+    Service class for bringing archived tasks back to the 'tasks' table.
+
+    A restored task that is still completed and belongs to a project finished
+    long enough ago is archived again by the next run, unless it is reopened
+    or the finish date of its project is pushed back.
+
+    Methods:
+        restore_task(task_id: int, reopen: bool)
+            Moves an archived task back to the 'tasks' table.
+
+        restore_project_tasks(project_id: int)
+            Moves every archived task of a project back to the 'tasks' table.
+
+    Raises:
+        HTTPException
+            If the task or project is not found, or the task ID is already in use.
+    """
+    @staticmethod
+    def restore_task(task_id: int, reopen: bool = False):
+        """
+        Moves an archived task back to the 'tasks' table.
+
+        Parameters:
+        -----------
+        task_id : int
+            The ID of the archived task.
+        reopen : bool
+            Whether to also mark the task as pending, which keeps it out of
+            the next archival runs.
+
+        Returns:
+        --------
+        TaskModel:
+            The restored task.
+        """
+        shard, _ = TaskService.locate_task(task_id, archived=True)
+        if shard is None:
+            raise HTTPException(status_code=404, detail="Archived task not found")
+        with use_shard(shard):
+            with shard_database.atomic():
+                archived = (
+                    TaskService.archived_tasks(ArchivedTaskModel.id)
+                    .where(ArchivedTaskModel.id == task_id)
+                    .exists()
+                )
+                if not archived:
+                    raise HTTPException(status_code=404, detail="Archived task not found")
+                if TaskModel.select().where(TaskModel.id == task_id).exists():
+                    raise HTTPException(status_code=409, detail="Task ID already in use")
+                _restore(ArchivedTaskModel.id == task_id)
+                if reopen:
+                    TaskModel.update(status=False).where(TaskModel.id == task_id).execute()
+            task = TaskModel.get_by_id(task_id)
+
+        task_archiver.count_restored(1)
+        change_feed.publish("tasks", "restored", task.__data__, [task.project_id_id])
+        return task
+
+    @staticmethod
+    def restore_project_tasks(project_id: int):
+        """
+        Moves every archived task of a project back to the 'tasks' table.
+
+        The tasks are moved in batches, each in its own transaction.
+
+        Parameters:
+        -----------
+        project_id : int
+            The ID of the project.
+
+        Returns:
+        --------
+        dict:
+            The project ID and the number of tasks restored.
+        """
+        ProjectService.get_project(project_id)
+        restored = 0
+        with on_project_shard(project_id):
+            while True:
+                with shard_database.atomic():
+                    task_ids = [
+                        task.id
+                        for task in ArchivedTaskModel.select(ArchivedTaskModel.id)
+                        .where(
+                            (ArchivedTaskModel.project_id == project_id)
+                            & ArchivedTaskModel.id.not_in(TaskModel.select(TaskModel.id))
+                        )
+                        .limit(ARCHIVE_BATCH_SIZE)
+                    ]
+                    if not task_ids:
+                        break
+                    _restore(ArchivedTaskModel.id.in_(task_ids))
+                restored += len(task_ids)
+
+        if restored:
+            task_archiver.count_restored(restored)
+            change_feed.publish(
+                "tasks",
+                "restored",
+                {"project_id": project_id, "count": restored},
+                [project_id],
+            )
+        return {"project_id": project_id, "restored": restored}
@@ -0,0 +1,183 @@
+"""
+This module runs the batches of operations of `POST /batch`.
+
+A batch is an ordered list of calls to the service methods behind the single
+routes (create, update, patch, delete or get an employee, a project or a
+task), so a client saving a whole form pays one round trip instead of one per
+row. The operations run in one transaction: the first one that fails rolls
+back every write of the batch, and the error tells which operation failed.
+
+An operation can name its result with `ref`; the `id` and the `*_id` body
+fields of the following operations reference it as "$<ref>", e.g. a task
+created in the project created just before it.
+"""
+
+import os
+from collections import Counter
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from helpers.change_feed import change_feed
+from helpers.sharding import all_shards_atomic, id_allocator
+from models.batch import Batch, BatchOperation
+from models.employee import Employee, EmployeeUpdate
+from models.project import Project, ProjectUpdate
+from models.task import Task, TaskUpdate
+from services.employee_service import EmployeeService
+from services.project_service import ProjectService
+from services.task_service import TaskService
+
+# Maximum number of operations in a batch
+BATCH_MAX_OPERATIONS = int(os.getenv("BATCH_MAX_OPERATIONS", "100"))
+
+# Service method and body model of each operation. "create" methods receive
+# the body, "get" and "delete" the ID, "update" and "patch" both.
+BATCH_OPERATIONS = {
+    "employees.get": (EmployeeService.get_employee, None),
+    "employees.create": (EmployeeService.create_employee, Employee),
+    "employees.update": (EmployeeService.update_employee, Employee),
+    "employees.patch": (EmployeeService.patch_employee, EmployeeUpdate),
+    "employees.delete": (EmployeeService.delete_employee, None),
+    "projects.get": (ProjectService.get_project, None),
+    "projects.create": (ProjectService.insert_project, Project),
+    "projects.update": (ProjectService.update_project, Project),
+    "projects.patch": (ProjectService.patch_project, ProjectUpdate),
+    "projects.delete": (ProjectService.delete_project, None),
+    "tasks.get": (TaskService.get_task, None),
+    "tasks.create": (TaskService.insert_task, Task),
+    "tasks.update": (TaskService.update_task, Task),
+    "tasks.patch": (TaskService.patch_task, TaskUpdate),
+    "tasks.delete": (TaskService.delete_task, None),
+}
+
+# ID sequence used by the operations creating rows of the sharded tables
+BATCH_SEQUENCES = {"projects.create": "projects", "tasks.create": "tasks"}
+
+
+class BatchService:
+    """
+    Service class running batches of operations in one transaction.
+
+    Methods:
+        run_batch(batch: Batch)
+            Validates and runs the operations of a batch, all or nothing.
+    """
+    # pylint: disable=too-few-public-methods
+    @staticmethod
+    def run_batch(batch: Batch):
+        """
+        Runs the operations of a batch, in order, in one transaction.
+
+        The change feed events of the batch are only sent once it committed.
+
+        Parameters:
+        -----------
+        batch : Batch
+            The operations to run.
+
+        Returns:
+        --------
+        dict:
+            `results`: per operation, its position, `ref`, the ID of the row
+            it created or targeted, and what the single route would return.
+
+        Raises:
+        -------
+        HTTPException:
+            400 error if the batch is invalid; otherwise the error of the
+            first operation that failed, with its position, after the
+            rollback of the whole batch.
+        """
+        operations = batch.operations
+        BatchService._check(operations)
+
+        results = []
+        refs = {}
+        sequences = Counter(
+            BATCH_SEQUENCES[operation.op]
+            for operation in operations
+            if operation.op in BATCH_SEQUENCES
+        )
+        with change_feed.deferred():
+            # IDs are reserved outside the transaction, which may roll back
+            with id_allocator.reserved(sequences), all_shards_atomic():
+                for index, operation in enumerate(operations):
+                    results.append(BatchService._run(index, operation, refs))
+        return {"results": results}
+
+    @staticmethod
+    def _check(operations: list):
+        if not operations:
+            raise HTTPException(status_code=400, detail="The batch has no operation")
+        if len(operations) > BATCH_MAX_OPERATIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"A batch holds at most {BATCH_MAX_OPERATIONS} operations",
+            )
+        refs = set()
+        for index, operation in enumerate(operations):
+            if operation.op not in BATCH_OPERATIONS:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Operation {index}: unknown operation '{operation.op}'",
+                )
+            if operation.ref is not None:
+                if operation.ref in refs:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Operation {index}: duplicate ref '{operation.ref}'",
+                    )
+                refs.add(operation.ref)
+
+    @staticmethod
+    def _run(index: int, operation: BatchOperation, refs: dict):
+        method, body_model = BATCH_OPERATIONS[operation.op]
+        action = operation.op.split(".")[1]
+        try:
+            args = []
+            if action != "create":
+                args.append(BatchService._target_id(operation, refs))
+            if body_model is not None:
+                body = {
+                    name: BatchService._resolve(value, refs) if name.endswith("_id") else value
+                    for name, value in operation.body.items()
+                }
+                args.append(body_model.model_validate(body))
+            result = method(*args)
+        except ValidationError as exc:
+            raise HTTPException(
+                status_code=422,
+                detail={
+                    "index": index,
+                    "op": operation.op,
+                    "detail": exc.errors(include_url=False, include_context=False),
+                },
+            ) from exc
+        except HTTPException as exc:
+            raise HTTPException(
+                status_code=exc.status_code,
+                detail={"index": index, "op": operation.op, "detail": exc.detail},
+            ) from exc
+
+        row_id = result.id if action == "create" else args[0]
+        if operation.ref is not None:
+            refs[operation.ref] = row_id
+        return {"index": index, "ref": operation.ref, "id": row_id, "result": result}
+
+    @staticmethod
+    def _target_id(operation: BatchOperation, refs: dict):
+        target_id = BatchService._resolve(operation.id, refs)
+        if not isinstance(target_id, int):
+            raise HTTPException(
+                status_code=400, detail="The id must be an integer or a \"$<ref>\" reference"
+            )
+        return target_id
+
+    @staticmethod
+    def _resolve(value, refs: dict):
+        # "$<ref>" stands for the ID of an earlier operation
+        if isinstance(value, str) and value.startswith("$"):
+            if value[1:] not in refs:
+                raise HTTPException(status_code=400, detail=f"Unknown reference '{value}'")
+            return refs[value[1:]]
+        return value
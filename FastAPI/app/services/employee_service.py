@@ -1,12 +1,43 @@
 """
 This module provides a service class for managing employee-related operations,
 including retrieving, creating, updating, and deleting employee records from the database.
+
+The by-ID reads, updates and deletes run as precompiled statements (see
+helpers/statement_cache.py). Creates and deletes keep the employee counter
+up to date (see helpers/row_counts.py).
+
+Email addresses are unique whatever their case. The lookup by email, run on
+every SSO login, is one indexed point query: on the unique index of the
+lower-cased address, or on the primary key when the ID of the address is
+cached (see helpers/lookup_cache.py).
 """
 
-from peewee import DoesNotExist, IntegrityError
+import os
+
+from peewee import DoesNotExist, IntegrityError, fn
 from fastapi import Body, HTTPException
-from models.employee import Employee
-from database import EmployeeModel
+from models.employee import Employee, EmployeeUpdate
+from database import (
+    EMPLOYEE_EMAIL_INDEX,
+    ArchivedTaskModel,
+    EmployeeModel,
+    TaskModel,
+    database,
+    is_sharded,
+    shard_database,
+)
+from helpers.batch_lookup import get_by_ids
+from helpers.lookup_cache import LookupCache
+from helpers.partial_update import apply_changes, changed_fields
+from helpers.row_counts import row_counts
+from helpers.sharding import fan_out
+from helpers.statement_cache import Param, statements
+
+# Number of email addresses whose employee ID is cached
+EMAIL_CACHE_SIZE = int(os.getenv("EMAIL_CACHE_SIZE", "10000"))
+
+# Employee ID by lower-cased email address
+employee_emails = LookupCache(EMAIL_CACHE_SIZE)
 
 
 class EmployeeService:
@@ -23,12 +54,24 @@ class EmployeeService:
         
         get_employee(employee_id: int)
             Retrieve a specific employee by their ID.
+
+        get_employees_by_ids(employee_ids: list)
+            Retrieve several employees by their IDs in a single query.
+
+        get_employee_by_email(email: str)
+            Retrieve the employee using an email address, whatever its case.
+
+        count_employees()
+            Return the number of employees.
         
         create_employee(employee: Employee)
             Create a new employee record.
         
         update_employee(employee_id: int, employee_data: Dict[str, str])
             Update an existing employee record by their ID.
+
+        patch_employee(employee_id: int, employee: EmployeeUpdate)
+            Update only the given fields of an employee record.
         
         delete_employee(employee_id: int)
             Delete an employee record by their ID.
@@ -62,11 +105,68 @@ class EmployeeService:
         Raises:
             HTTPException: 404 error if the employee with the given ID is not found.
         """
-        try:
-            employee = EmployeeModel.get(EmployeeModel.id == employee_id)
-            return employee
-        except DoesNotExist as exc:
-            raise HTTPException(status_code=404, detail="Employee not found") from exc
+        employee = statements.first("employees.get", id=employee_id)
+        if employee is None:
+            raise HTTPException(status_code=404, detail="Employee not found")
+        return employee
+
+    @staticmethod
+    def get_employees_by_ids(employee_ids: list):
+        """
+        Retrieve several employees by their IDs.
+
+        Args:
+            employee_ids (list): The IDs of the employees to retrieve.
+
+        Returns:
+            dict: The employees found, in request order, and the IDs that were not found.
+        """
+        return get_by_ids(EmployeeModel, employee_ids)
+
+    @staticmethod
+    def get_employee_by_email(email: str):
+        """
+        Retrieve the employee using an email address, ignoring its case.
+
+        Args:
+            email (str): The email address.
+
+        Returns:
+            Employee: The employee record using that address.
+
+        Raises:
+            HTTPException: 404 error if no employee uses the address, 409 error
+                if several do (only until the duplicates reported at startup
+                are fixed).
+        """
+        key = email.lower()
+        employee_id = employee_emails.get(key)
+        if employee_id is not None:
+            employee = statements.first("employees.get", id=employee_id)
+            # Another process may have changed the address or deleted the employee
+            if employee is not None and employee.email.lower() == key:
+                return employee
+            employee_emails.invalidate(employee_id)
+
+        employees = statements.select("employees.by_email", email=email)
+        if not employees:
+            raise HTTPException(status_code=404, detail="Employee not found")
+        if len(employees) > 1:
+            raise HTTPException(
+                status_code=409, detail="Several employees use this email address"
+            )
+        employee_emails.put(key, employees[0].id)
+        return employees[0]
+
+    @staticmethod
+    def count_employees():
+        """
+        Return the number of employees, from their counter.
+
+        Returns:
+            int: The number of employee records.
+        """
+        return row_counts.total("employees")
 
     @staticmethod
     def create_employee(employee: Employee = Body(...)):
@@ -78,18 +178,25 @@ class EmployeeService:
 
         Returns:
             Employee: The newly created employee record.
+
+        Raises:
+            HTTPException: 409 error if another employee uses the email address.
         """
+        EmployeeService._check_email(employee.email)
         try:
-            created_employee = EmployeeModel.create(
-                name=employee.name,
-                email=employee.email,
-                phone=employee.phone,
-                post=employee.post
-            )
+            with database.atomic():
+                created_employee = EmployeeModel.create(
+                    name=employee.name,
+                    email=employee.email,
+                    phone=employee.phone,
+                    post=employee.post
+                )
+                row_counts.adjust("employees", 1)
             return created_employee
         except DoesNotExist as exc:
             raise HTTPException(status_code=400, detail=str(exc)) from exc
         except IntegrityError as exc:
+            EmployeeService._raise_email_conflict(exc)
             raise HTTPException(
             status_code=500, detail="An error occurred while creating the employee"
         ) from exc
@@ -107,18 +214,60 @@ class EmployeeService:
             Employee: The updated employee record.
 
         Raises:
-            HTTPException: 404 error if the employee with the given ID is not found.
+            HTTPException: 404 error if the employee with the given ID is not found,
+                409 error if another employee uses the new email address.
         """
+        e_employee = statements.first("employees.get", id=employee_id)
+        if e_employee is None:
+            raise HTTPException(status_code=404, detail="Employee not found")
+        if employee.email.lower() != e_employee.email.lower():
+            EmployeeService._check_email(employee.email, employee_id)
+        e_employee.__data__.update(employee.model_dump())
         try:
-            e_employee = EmployeeModel.get(EmployeeModel.id == employee_id)
-            e_employee.name = employee.name
-            e_employee.email = employee.email
-            e_employee.phone = employee.phone
-            e_employee.post = employee.post
-            e_employee.save()
-            return e_employee
-        except DoesNotExist as exc:  # Catching general exception if DoesNotExist is not available
-            raise HTTPException(status_code=404, detail="Employee not found") from exc
+            statements.execute("employees.update", **e_employee.__data__)
+        except IntegrityError as exc:
+            EmployeeService._raise_email_conflict(exc)
+            raise
+        employee_emails.invalidate(employee_id)
+        return e_employee
+
+    @staticmethod
+    def patch_employee(employee_id: int, employee: EmployeeUpdate = Body(...)):
+        """
+        Update only the fields of an employee that are sent and actually change.
+
+        The UPDATE statement only contains the changed columns, and nothing is
+        written at all when every value sent matches the stored one.
+
+        Args:
+            employee_id (int): The ID of the employee to update.
+            employee (EmployeeUpdate): The fields to change.
+
+        Returns:
+            Employee: The employee record, with its new values.
+
+        Raises:
+            HTTPException: 404 error if the employee with the given ID is not found,
+                409 error if another employee uses the new email address.
+        """
+        e_employee = statements.first("employees.get", id=employee_id)
+        if e_employee is None:
+            raise HTTPException(status_code=404, detail="Employee not found")
+
+        changes = changed_fields(e_employee, employee.model_dump(exclude_unset=True))
+        if "email" in changes and changes["email"].lower() != e_employee.email.lower():
+            EmployeeService._check_email(changes["email"], employee_id)
+        if changes:
+            try:
+                apply_changes(e_employee, changes)
+            except IntegrityError as exc:
+                EmployeeService._raise_email_conflict(exc)
+                raise HTTPException(
+                status_code=400, detail="An error occurred while updating the employee"
+            ) from exc
+            if "email" in changes:
+                employee_emails.invalidate(employee_id)
+        return e_employee
 
     @staticmethod
     def delete_employee(employee_id: int):
@@ -135,7 +284,71 @@ class EmployeeService:
             HTTPException: 404 error if the employee with the given ID is not found.
         """
         try:
-            EmployeeModel.delete().where(EmployeeModel.id == employee_id).execute()
+            with database.atomic():
+                fan_out(lambda _: EmployeeService._delete_tasks(employee_id))
+                deleted = statements.execute("employees.delete", id=employee_id)
+                row_counts.adjust("employees", -deleted)
+            employee_emails.invalidate(employee_id)
             return {"status": "Employee deleted"}
         except DoesNotExist as exc:  # Catching general exception if DoesNotExist is not available
             raise HTTPException(status_code=404, detail="Employee not found") from exc
+
+    @staticmethod
+    def _check_email(email: str, employee_id: int = None):
+        # Gives a clear error before the unique index refuses the write
+        for other in statements.select("employees.by_email", email=email):
+            if other.id != employee_id:
+                raise HTTPException(status_code=409, detail="Email already in use")
+
+    @staticmethod
+    def _raise_email_conflict(exc: IntegrityError):
+        # A concurrent write of the same address passes _check_email too, and
+        # only the unique index refuses it
+        if EMPLOYEE_EMAIL_INDEX in str(exc):
+            raise HTTPException(status_code=409, detail="Email already in use") from exc
+
+    @staticmethod
+    def _delete_tasks(employee_id: int):
+        # The tasks of the employee leave the lists with it, through the
+        # foreign keys or, when sharded, explicitly in every shard
+        with shard_database.atomic():
+            for name, model in (("tasks", TaskModel), ("tasks_archive", ArchivedTaskModel)):
+                row_counts.adjust(
+                    name, -row_counts.query(name).where(model.employee_id == employee_id).count()
+                )
+                if is_sharded():
+                    # No foreign key cascades from the main database to the shards
+                    model.delete().where(model.employee_id == employee_id).execute()
+
+
+@row_counts.register("employees", sharded=False)
+def _count_employees():
+    return EmployeeModel.select()
+
+
+@statements.register("employees.get", EmployeeModel)
+def _get_employee():
+    return EmployeeModel.select().where(EmployeeModel.id == Param("id")).limit(1)
+
+
+@statements.register("employees.by_email", EmployeeModel)
+def _get_employee_by_email():
+    # Matches the expression of the email index; two rows tell a duplicate
+    return (
+        EmployeeModel.select()
+        .where(fn.LOWER(EmployeeModel.email) == fn.LOWER(Param("email")))
+        .limit(2)
+    )
+
+
+@statements.register("employees.update", EmployeeModel)
+def _update_employee():
+    fields = (EmployeeModel.name, EmployeeModel.email, EmployeeModel.phone, EmployeeModel.post)
+    return EmployeeModel.update({field: Param(field.name, field) for field in fields}).where(
+        EmployeeModel.id == Param("id")
+    )
+
+
+@statements.register("employees.delete", EmployeeModel)
+def _delete_employee():
+    return EmployeeModel.delete().where(EmployeeModel.id == Param("id"))
@@ -0,0 +1,353 @@
+"""
+This module provides the CSV import pipeline used to onboard customers in bulk.
+
+Uploaded files are spooled to disk and imported by a background job that:
+- reads each CSV incrementally, so memory stays bounded whatever the file size;
+- validates the rows in batches with the `Employee`, `Project` and `Task` models;
+- resolves the `project_ref` / `employee_ref` columns of the tasks through an
+  in-memory map of the `ref` values of the employees and projects just imported
+  (a numeric value not in the map is taken as the ID of an existing row);
+- inserts each batch in a single transaction (one per shard when sharded,
+  with the IDs of the projects and tasks taken from the ID sequences), which
+  also adds the rows to the row counters and, on SQLite, indexes the tasks
+  for the search in one statement rather than row by row;
+- writes the rejected rows to an error report that can be downloaded afterwards.
+"""
+
+import csv
+import os
+import shutil
+import tempfile
+import uuid
+
+from fastapi import HTTPException, UploadFile
+from pydantic import ValidationError
+from peewee import IntegrityError
+from database import (
+    database,
+    deferred_task_search,
+    shard_database,
+    use_shard,
+    EmployeeModel,
+    ProjectModel,
+    TaskModel,
+)
+from helpers.batch_lookup import get_by_ids
+from helpers.bulk_insert import insert_rows
+from helpers.row_counts import row_counts
+from helpers.sharding import group_by_shard, id_allocator
+from models.employee import Employee
+from models.job import Job
+from models.project import Project
+from models.task import Task
+from services.job_service import JobContext, JobService, job_kind
+from services.project_service import ProjectService
+
+# Directory where uploads and error reports are kept
+IMPORT_DIR = os.getenv("IMPORT_DIR", os.path.join(tempfile.gettempdir(), "imports"))
+
+# Number of rows validated and inserted per transaction
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+ERRORS_FILE = "errors.csv"
+
+# Import order, Pydantic model and Peewee model of each entity
+ENTITIES = (
+    ("employees", Employee, EmployeeModel),
+    ("projects", Project, ProjectModel),
+    ("tasks", Task, TaskModel),
+)
+
+# Task columns holding a reference and the entity they point to
+REFERENCES = {
+    "project_ref": ("project_id", "projects"),
+    "employee_ref": ("employee_id", "employees"),
+}
+
+
+class CsvImporter:
+    """
+    Imports the CSV files of one upload, entity by entity.
+
+    Attributes:
+        ids (dict): For each entity, the database ID of every imported `ref`.
+        imported (dict): Number of rows inserted per entity.
+        rejected (int): Number of rows written to the error report.
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, ctx: JobContext, errors):
+        self.ctx = ctx
+        self.errors = errors
+        self.ids = {"employees": {}, "projects": {}}
+        self.imported = {}
+        self.rejected = 0
+
+    def run(self, directory: str):
+        """
+        Imports the files found in the upload directory, parents first.
+
+        :param directory: The directory holding `employees.csv`, `projects.csv`
+                          and/or `tasks.csv`.
+        :return: The number of imported rows per entity and of rejected rows.
+        """
+        for entity, schema, model in ENTITIES:
+            path = os.path.join(directory, f"{entity}.csv")
+            if not os.path.exists(path):
+                continue
+            self.imported[entity] = 0
+            with open(path, newline="", encoding="utf-8-sig") as file:
+                batch = []
+                # Line 1 is the header, so data starts at line 2
+                for line, row in enumerate(csv.DictReader(file), start=2):
+                    batch.append((line, row))
+                    if len(batch) >= IMPORT_BATCH_SIZE:
+                        self._import_batch(entity, schema, model, batch)
+                        batch = []
+                if batch:
+                    self._import_batch(entity, schema, model, batch)
+        return {"imported": self.imported, "rejected": self.rejected}
+
+    def _reject(self, entity: str, line: int, error: str):
+        self.errors.writerow([entity, line, error])
+        self.rejected += 1
+
+    def _import_batch(self, entity: str, schema, model, batch: list):
+        valid = []
+        # Rows with unknown references are rejected too, but still count as done
+        steps = len(batch)
+        if entity == "tasks":
+            batch = self._resolve_references(batch)
+        for line, row in batch:
+            try:
+                data = schema.model_validate(row).model_dump()
+            except ValidationError as exc:
+                errors = "; ".join(
+                    f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in exc.errors()
+                )
+                self._reject(entity, line, errors)
+                continue
+            valid.append((line, (row.get("ref") or "").strip(), data))
+
+        if entity == "employees":
+            self._insert_batch(entity, model, valid, database)
+        else:
+            for shard, rows in self._group_by_shard(entity, valid).items():
+                with use_shard(shard):
+                    self._insert_batch(entity, model, rows, shard_database)
+        self.ctx.advance(steps)
+
+    def _insert_batch(self, entity: str, model, valid: list, db):
+        try:
+            with db.atomic():
+                refs = self._insert(entity, model, valid)
+                row_counts.adjust(entity, len(valid))
+            self._inserted(entity, len(valid), refs)
+        except IntegrityError:
+            # Retry row by row to isolate the rows the database refuses
+            for item in valid:
+                try:
+                    with db.atomic():
+                        refs = self._insert(entity, model, [item])
+                        row_counts.adjust(entity, 1)
+                    self._inserted(entity, 1, refs)
+                except IntegrityError as exc:
+                    self._reject(entity, item[0], str(exc))
+
+    @staticmethod
+    def _group_by_shard(entity: str, valid: list):
+        # When sharded, projects and tasks get their ID up front, which tells
+        # (for the projects) the shard to write them to
+        for _, _, data in valid:
+            row_id = id_allocator.next_id(entity)
+            if row_id is not None:
+                data["id"] = row_id
+        if entity == "projects":
+            return group_by_shard(valid, key=lambda item: item[2].get("id", 0))
+        return group_by_shard(valid, key=lambda item: item[2]["project_id"])
+
+    @staticmethod
+    def _insert(entity: str, model, rows: list):
+        refs = {}
+        if entity == "tasks":
+            if rows:
+                task_ids = [data["id"] for _, _, data in rows if "id" in data]
+                with deferred_task_search(task_ids):
+                    insert_rows(model, [data for _, _, data in rows])
+            return refs
+        # Rows carrying a ref need their ID back, so they are inserted one by
+        # one (still within the batch transaction); the rest in one statement.
+        plain = [data for _, ref, data in rows if not ref or "id" in data]
+        if plain:
+            model.insert_many(plain).execute()
+        for _, ref, data in rows:
+            if ref:
+                refs[ref] = data["id"] if "id" in data else model.insert(**data).execute()
+        return refs
+
+    def _inserted(self, entity: str, count: int, refs: dict):
+        # Only called once the transaction is committed, so a rolled back
+        # batch never leaves IDs that do not exist in the map
+        self.imported[entity] += count
+        if refs:
+            self.ids[entity].update(refs)
+
+    def _resolve_references(self, batch: list):
+        resolved = []
+        existing = {"projects": set(), "employees": set()}
+        for _, row in batch:
+            for column, (field, target) in REFERENCES.items():
+                ref = (row.get(column) or row.get(field) or "").strip()
+                if ref not in self.ids[target] and ref.isdigit():
+                    existing[target].add(int(ref))
+        if existing["projects"]:
+            found = ProjectService.get_projects_by_ids(list(existing["projects"]))
+            existing["projects"] = {row.id for row in found["results"]}
+        if existing["employees"]:
+            found = get_by_ids(
+                EmployeeModel, list(existing["employees"]), EmployeeModel.select(EmployeeModel.id)
+            )
+            existing["employees"] = {row.id for row in found["results"]}
+
+        for line, row in batch:
+            row = dict(row)
+            missing = []
+            for column, (field, target) in REFERENCES.items():
+                ref = (row.pop(column, None) or row.get(field) or "").strip()
+                if ref in self.ids[target]:
+                    row[field] = self.ids[target][ref]
+                elif ref.isdigit() and int(ref) in existing[target]:
+                    row[field] = int(ref)
+                else:
+                    missing.append(f"{column}: unknown reference '{ref}'")
+            if missing:
+                self._reject("tasks", line, "; ".join(missing))
+            else:
+                resolved.append((line, row))
+        return resolved
+
+
+def in_import_dir(directory: str):
+    """
+    Tells whether a directory is an upload directory of `IMPORT_DIR`.
+
+    :param directory: The directory named by the params of an import job.
+    :return: True when it resolves to a subdirectory of `IMPORT_DIR`.
+    """
+    root = os.path.realpath(IMPORT_DIR)
+    path = os.path.realpath(directory)
+    return os.path.dirname(path) == root
+
+
+@job_kind("imports.csv", internal=True)
+def import_csv(ctx: JobContext, directory: str, rows: int = 0):
+    """
+    Imports the CSV files of an upload directory.
+
+    `rows`, the number of data lines counted while spooling, is the total of
+    the job; it is corrected at the end when some lines were not rows (blank
+    lines, line breaks within quoted values).
+    """
+    if not in_import_dir(directory):
+        raise ValueError("The import directory is not an upload directory")
+    ctx.set_total(rows)
+    with open(os.path.join(directory, ERRORS_FILE), "w", newline="", encoding="utf-8") as file:
+        errors = csv.writer(file)
+        errors.writerow(["entity", "line", "error"])
+        try:
+            result = CsvImporter(ctx, errors).run(directory)
+            if ctx.progress != rows:
+                ctx.set_total(ctx.progress)
+            return result
+        finally:
+            for entity, _, _ in ENTITIES:
+                path = os.path.join(directory, f"{entity}.csv")
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+class ImportService:
+    """
+    Service class for handling CSV imports.
+
+    Methods:
+        import_files(files: dict)
+            Stores the uploaded CSV files and queues their import.
+
+        get_error_report(job_id: int)
+            Returns the path of the error report of an import.
+
+    Raises:
+        HTTPException
+            If no file is uploaded, or the import or its report is not found.
+    """
+    @staticmethod
+    def import_files(files: dict):
+        """
+        Stores the uploaded CSV files and queues their import as a background job.
+
+        Parameters:
+        -----------
+        files : dict
+            The uploaded files (UploadFile or None) by entity name.
+
+        Returns:
+        --------
+        dict:
+            The queued import job.
+        """
+        uploads = {entity: file for entity, file in files.items() if file is not None}
+        if not uploads:
+            raise HTTPException(status_code=400, detail="No CSV file uploaded")
+
+        directory = os.path.join(IMPORT_DIR, uuid.uuid4().hex)
+        os.makedirs(directory)
+        rows = sum(
+            ImportService._spool(upload, os.path.join(directory, f"{entity}.csv"))
+            for entity, upload in uploads.items()
+        )
+        try:
+            return JobService.submit_job(
+                Job(kind="imports.csv", params={"directory": directory, "rows": rows}),
+                internal=True,
+            )
+        except HTTPException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+    @staticmethod
+    def get_error_report(job_id: int):
+        """
+        Returns the path of the error report of an import.
+
+        Parameters:
+        -----------
+        job_id : int
+            The ID of the import job.
+
+        Returns:
+        --------
+        str:
+            The path of the CSV listing the rejected rows.
+        """
+        job = JobService.get_job(job_id)
+        if job["kind"] != "imports.csv" or not in_import_dir(job["params"]["directory"]):
+            raise HTTPException(status_code=404, detail="Import not found")
+        path = os.path.join(job["params"]["directory"], ERRORS_FILE)
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail="Error report not available yet")
+        return path
+
+    @staticmethod
+    def _spool(upload: UploadFile, path: str):
+        # Copy in fixed-size chunks so large uploads never sit in memory, and
+        # count the data lines on the way (the total of the import job)
+        lines = 0
+        last = b"\n"
+        with open(path, "wb") as file:
+            while chunk := upload.file.read(1024 * 1024):
+                file.write(chunk)
+                lines += chunk.count(b"\n")
+                last = chunk[-1:]
+        if last != b"\n":
+            lines += 1  # No line break after the last line
+        return max(lines - 1, 0)  # Without the header
@@ -0,0 +1,481 @@
+"""
+This module provides an in-process job subsystem to run long operations
+(mass status changes, project-wide reassignments, imports...) outside of
+the request threads.
+
+Jobs are persisted in the 'jobs' table and executed by a bounded pool of
+worker threads fed by a bounded queue, and by the table itself, which the
+instances of the application share. Each job kind is a function registered
+with `@job_kind(...)`; it receives a `JobContext` to report its progress and
+to stop when a client cancels it. Kinds registered as internal are only
+submitted by the services (e.g. the imports), never through `POST /jobs`.
+"""
+
+import inspect
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from database import database, JobModel, TaskModel
+from helpers.sharding import on_project_shard
+from models.job import Job
+from models.task import Task
+from services.task_service import TaskService
+from services.project_service import ProjectService
+
+# Number of worker threads and maximum number of jobs waiting for a worker
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+
+# Seconds an idle worker waits before looking for queued jobs in the table
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+
+# Seconds between two heartbeats of the running jobs, and without heartbeat
+# after which a job is taken as lost with its instance
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_OWNER_TIMEOUT = float(os.getenv("JOB_OWNER_TIMEOUT", "60"))
+
+# Identifies this instance of the application as the owner of its jobs
+INSTANCE_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+# Registered job kinds, by name
+JOB_KINDS = {}
+
+# Names of the job kinds that clients cannot submit
+INTERNAL_JOB_KINDS = set()
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a running job when a client requested its cancellation.
+    """
+
+
+def job_kind(name: str, internal: bool = False):
+    """
+    Registers a function as a job kind.
+
+    The function is called as `func(ctx, **params)` and its return value,
+    which must be JSON serializable, is stored as the result of the job.
+
+    :param name: The name clients use to submit the job.
+    :param internal: Whether only the services may submit it, e.g. because
+                     its params name server paths.
+    :return: A decorator that registers the function.
+    """
+    def register(func):
+        JOB_KINDS[name] = func
+        if internal:
+            INTERNAL_JOB_KINDS.add(name)
+        return func
+    return register
+
+
+class JobContext:
+    """
+    Handle given to a running job to report progress and detect cancellation.
+
+    Progress is kept in memory and written to the 'jobs' table at most every
+    `FLUSH_INTERVAL` seconds, together with a check of the cancel flag, so
+    that jobs with many small steps do not double the write load.
+    """
+    FLUSH_INTERVAL = 0.5
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self.progress = 0
+        self._last_flush = time.monotonic()
+
+    def set_total(self, total: int):
+        """
+        Records the total number of steps of the job.
+
+        :param total: The number of steps the job will run.
+        """
+        JobModel.update(total=total).where(JobModel.id == self.job_id).execute()
+
+    def advance(self, steps: int = 1):
+        """
+        Marks steps as done and periodically checks for cancellation.
+
+        :param steps: The number of steps completed since the last call.
+        :raises JobCancelled: If a client cancelled the job.
+        """
+        self.progress += steps
+        if time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the current progress and checks the cancel flag.
+
+        :raises JobCancelled: If a client cancelled the job.
+        """
+        self._last_flush = time.monotonic()
+        JobModel.update(progress=self.progress).where(JobModel.id == self.job_id).execute()
+        cancel_requested = (
+            JobModel.select(JobModel.cancel_requested)
+            .where(JobModel.id == self.job_id)
+            .scalar()
+        )
+        if cancel_requested:
+            raise JobCancelled()
+
+
+class JobRunner:
+    """
+    Bounded pool of worker threads that executes the queued jobs.
+
+    Several instances of the application share the 'jobs' table. A worker
+    claims a job by moving it from "queued" to "running" under the ID of its
+    instance, so each job runs once, and a heartbeat thread refreshes the
+    `heartbeat_at` of the jobs its instance runs. A running job whose
+    heartbeat is older than `JOB_OWNER_TIMEOUT` belongs to an instance that
+    stopped: any instance marks it as failed.
+
+    Jobs submitted to this instance are handed to its workers through an
+    in-memory queue; once it is empty, the workers take the oldest queued job
+    from the table, which also picks up the jobs left queued by a restart or
+    by a full queue elsewhere.
+
+    Methods:
+        start()
+            Recovers the jobs of stopped instances and starts the workers.
+
+        stop(timeout: float)
+            Stops the workers once they finish their current job.
+
+        enqueue(job_id: int)
+            Hands a job to the workers, raising `queue.Full` when saturated.
+    """
+    def __init__(self, workers: int, queue_size: int):
+        self._workers = workers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """
+        Starts the worker threads and the heartbeat thread.
+
+        Jobs left running by instances that stopped are marked as failed.
+        """
+        self._stopping.clear()
+        self._recover()
+
+        targets = [(self._work, f"job-worker-{number}") for number in range(self._workers)]
+        for target, name in targets + [(self._beat, "job-heartbeat")]:
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Asks the workers to stop and waits for them.
+
+        Jobs still queued stay "queued" and are picked up by another instance
+        or on the next start.
+
+        :param timeout: Maximum time to wait for each worker, in seconds.
+        """
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def enqueue(self, job_id: int):
+        """
+        Hands a job to the workers without blocking.
+
+        :param job_id: The ID of the job to run.
+        :raises queue.Full: If the queue is at capacity.
+        """
+        self._queue.put_nowait(job_id)
+
+    def _work(self):
+        idle = False
+        while not self._stopping.is_set():
+            # Only waits once no job is left, in the queue or in the table
+            try:
+                job_id = self._queue.get(timeout=JOB_POLL_INTERVAL if idle else 0)
+            except queue.Empty:
+                job_id = None
+            with database.connection_context():
+                ran = self._run_next() if job_id is None else self._run(job_id)
+            idle = not ran
+
+    def _beat(self):
+        while not self._stopping.wait(JOB_HEARTBEAT_INTERVAL):
+            with database.connection_context():
+                JobModel.update(heartbeat_at=datetime.now()).where(
+                    (JobModel.owner == INSTANCE_ID) & (JobModel.status == "running")
+                ).execute()
+                self._recover()
+
+    @staticmethod
+    def _recover():
+        # Jobs whose owner stopped reporting; the jobs of older versions,
+        # without heartbeat, count as such
+        cutoff = datetime.now() - timedelta(seconds=JOB_OWNER_TIMEOUT)
+        JobModel.update(
+            status="failed", error="Interrupted: its instance stopped", finished_at=datetime.now()
+        ).where(
+            (JobModel.status == "running")
+            & (JobModel.heartbeat_at.is_null() | (JobModel.heartbeat_at < cutoff))
+        ).execute()
+
+    def _run_next(self):
+        # The oldest queued jobs; another worker may claim them first
+        candidates = (
+            JobModel.select(JobModel.id)
+            .where(JobModel.status == "queued")
+            .order_by(JobModel.id)
+            .limit(self._workers + 1)
+        )
+        return any(self._run(job.id) for job in list(candidates))
+
+    @staticmethod
+    def _run(job_id: int):
+        job = JobModel.get_or_none(JobModel.id == job_id)
+        if job is None or job.status != "queued":
+            return False  # Cancelled or already handled
+
+        now = datetime.now()
+        claimed = JobModel.update(
+            status="running", started_at=now, owner=INSTANCE_ID, heartbeat_at=now
+        ).where((JobModel.id == job_id) & (JobModel.status == "queued")).execute()
+        if not claimed:
+            return False  # Cancelled or claimed elsewhere since it was read
+        ctx = JobContext(job_id)
+        fields = {}
+        try:
+            result = JOB_KINDS[job.kind](ctx, **json.loads(job.params))
+            ctx.flush()
+            fields = {"status": "succeeded", "result": json.dumps(result, default=str)}
+        except JobCancelled:
+            fields = {"status": "cancelled"}
+        except HTTPException as exc:
+            fields = {"status": "failed", "error": str(exc.detail)}
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            fields = {"status": "failed", "error": str(exc) or type(exc).__name__}
+
+        # Unless another instance took it for lost meanwhile
+        JobModel.update(progress=ctx.progress, finished_at=datetime.now(), **fields).where(
+            (JobModel.id == job_id)
+            & (JobModel.status == "running")
+            & (JobModel.owner == INSTANCE_ID)
+        ).execute()
+        return True
+
+
+job_runner = JobRunner(JOB_WORKERS, JOB_QUEUE_SIZE)
+
+
+class JobService:
+    """
+    Service class for handling business logic related to background jobs.
+
+    Methods:
+        submit_job(job: Job, internal: bool)
+            Persists a job and queues it for the workers.
+
+        get_job(job_id: int)
+            Retrieves the status and progress of a job.
+
+        cancel_job(job_id: int)
+            Requests the cancellation of a queued or running job.
+
+    Raises:
+        HTTPException
+            If a job is not found, is invalid, or the queue is full.
+    """
+    @staticmethod
+    def submit_job(job: Job, internal: bool = False):
+        """
+        Persists a job and queues it for the workers.
+
+        Parameters:
+        -----------
+        job : Job
+            The kind of job to run and its parameters.
+        internal : bool
+            Whether a service submits it, which allows the internal job kinds.
+
+        Returns:
+        --------
+        dict:
+            The newly created job, in "queued" status.
+        """
+        func = JOB_KINDS.get(job.kind)
+        if func is None or (job.kind in INTERNAL_JOB_KINDS and not internal):
+            raise HTTPException(status_code=400, detail=f"Unknown job kind: {job.kind}")
+        try:
+            inspect.signature(func).bind(None, **job.params)
+        except TypeError as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid params: {exc}") from exc
+
+        created = JobModel.create(kind=job.kind, params=json.dumps(job.params))
+        try:
+            job_runner.enqueue(created.id)
+        except queue.Full as exc:
+            created.delete_instance()
+            raise HTTPException(
+                status_code=503,
+                detail="The job queue is full, try again later",
+                headers={"Retry-After": "5"},
+            ) from exc
+        return JobService._serialize(created)
+
+    @staticmethod
+    def get_job(job_id: int):
+        """
+        Retrieves the status and progress of a job.
+
+        Parameters:
+        -----------
+        job_id : int
+            The ID of the job.
+
+        Returns:
+        --------
+        dict:
+            The job, with its decoded params and result.
+        """
+        job = JobModel.get_or_none(JobModel.id == job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return JobService._serialize(job)
+
+    @staticmethod
+    def cancel_job(job_id: int):
+        """
+        Requests the cancellation of a job.
+
+        A queued job is cancelled right away; a running job stops at its next
+        progress check.
+
+        Parameters:
+        -----------
+        job_id : int
+            The ID of the job to cancel.
+
+        Returns:
+        --------
+        dict:
+            The job after the cancellation request.
+        """
+        JobService.get_job(job_id)
+        # Each update only applies to the status it expects, so a worker
+        # picking the job up in between makes the second one apply instead
+        cancelled = JobModel.update(
+            status="cancelled", cancel_requested=True, finished_at=datetime.now()
+        ).where((JobModel.id == job_id) & (JobModel.status == "queued")).execute()
+        if not cancelled:
+            cancelled = JobModel.update(cancel_requested=True).where(
+                (JobModel.id == job_id) & (JobModel.status == "running")
+            ).execute()
+        job = JobService.get_job(job_id)
+        if not cancelled:
+            raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+        return job
+
+    @staticmethod
+    def _serialize(job: JobModel):
+        data = dict(job.__data__)
+        data["params"] = json.loads(job.params)
+        data["result"] = json.loads(job.result) if job.result else None
+        return data
+
+
+def run_steps(ctx: JobContext, items: list, step):
+    """
+    Runs `step(item)` for every item, reporting progress after each one.
+
+    Errors of a single step (unknown ID, invalid data...) are collected
+    instead of failing the whole job.
+
+    :param ctx: The context of the running job.
+    :param items: The items to process.
+    :param step: The function to call for each item, usually a service method.
+    :return: The number of successful steps and the errors of the failed ones.
+    """
+    ctx.set_total(len(items))
+    errors = []
+    for item in items:
+        try:
+            step(item)
+        except HTTPException as exc:
+            errors.append({"item": item, "detail": exc.detail})
+        except ValueError as exc:
+            errors.append({"item": item, "detail": str(exc)})
+        ctx.advance()
+    return {"done": len(items) - len(errors), "errors": errors}
+
+
+def _task_with(task_id: int, **changes):
+    row = TaskService.get_task(task_id)
+    return Task.model_validate({**row.__data__, **changes})
+
+
+@job_kind("tasks.create")
+def create_tasks(ctx: JobContext, tasks: list):
+    """
+    Creates many tasks with `TaskService.create_task`.
+    """
+    return run_steps(ctx, tasks, lambda data: TaskService.create_task(Task.model_validate(data)))
+
+
+@job_kind("tasks.update_status")
+def update_tasks_status(ctx: JobContext, task_ids: list, status: bool):
+    """
+    Changes the status of many tasks with `TaskService.update_task`.
+    """
+    return run_steps(
+        ctx,
+        task_ids,
+        lambda task_id: TaskService.update_task(task_id, _task_with(task_id, status=status)),
+    )
+
+
+@job_kind("tasks.delete")
+def delete_tasks(ctx: JobContext, task_ids: list):
+    """
+    Deletes many tasks with `TaskService.delete_task`.
+    """
+    return run_steps(ctx, task_ids, TaskService.delete_task)
+
+
+@job_kind("projects.reassign_tasks")
+def reassign_project_tasks(ctx: JobContext, project_id: int, employee_id: int):
+    """
+    Assigns every task of a project to another employee.
+    """
+    ProjectService.get_project(project_id)  # 404 if the project does not exist
+    with on_project_shard(project_id):
+        task_ids = [
+            task.id
+            for task in TaskModel.select(TaskModel.id)
+            .where(TaskModel.project_id == project_id)
+            .order_by(TaskModel.id)
+        ]
+    return run_steps(
+        ctx,
+        task_ids,
+        lambda task_id: TaskService.update_task(
+            task_id, _task_with(task_id, employee_id=employee_id)
+        ),
+    )
+
+
+@job_kind("projects.delete")
+def delete_projects(ctx: JobContext, project_ids: list):
+    """
+    Deletes many projects with `ProjectService.delete_project`.
+    """
+    return run_steps(ctx, project_ids, ProjectService.delete_project)
@@ -4,15 +4,41 @@ Module to handle project-related business logic for managing projects.
 This module defines the `ProjectService` class, which provides methods
 for creating, retrieving, updating, and deleting projects from the database.
 It interacts with the ProjectModel to persist and manage project data.
+
+Deleting a project only sets its `deleted_at` column: deleted projects and
+their tasks disappear from every read right away, and the rows are removed
+later, in small batches, by the purger (see services/purge_service.py).
+
+Each project lives in the shard picked by its ID (see helpers/sharding.py);
+listing the projects reads every shard and merges the rows by ID.
+
+The by-ID reads, updates and deletes and the pages of the list run as
+precompiled statements (see helpers/statement_cache.py). Creates and deletes
+keep the project and task counters up to date (see helpers/row_counts.py).
 """
+from datetime import datetime
+
 from peewee import DoesNotExist, IntegrityError  # type: ignore
 
 from fastapi import Body, HTTPException
 
-from models.project import Project
+from models.project import Project, ProjectUpdate
 
 # Import the ProjectModel database model
-from database import ProjectModel
+from database import ArchivedTaskModel, ProjectModel, TaskModel, shard_database
+from helpers.batch_lookup import get_by_ids, merge_found
+from helpers.change_feed import change_feed
+from helpers.partial_update import apply_changes, changed_fields
+from helpers.row_counts import row_counts
+from helpers.statement_cache import Param, statements
+from helpers.sharding import (
+    fan_out,
+    group_by_shard,
+    id_allocator,
+    merge_sorted,
+    on_project_shard,
+)
+from services.purge_service import project_purger
 
 
 class ProjectService:
@@ -26,17 +52,35 @@ class ProjectService:
         create_project(project: Project)
             Creates a new project in the database.
 
+        insert_project(project: Project)
+            Creates a new project and returns the stored row.
+
         update_project(project_id: int, project: Project)
             Updates an existing project with the given ID in the database.
 
+        patch_project(project_id: int, project: ProjectUpdate)
+            Updates only the given fields of a project.
+
         delete_project(project_id: int)
-            Deletes a project from the database by its ID.
+            Soft-deletes a project by its ID; its rows are purged in the background.
 
         get_project(project_id: int)
             Retrieves a project by its ID from the database.
 
-        get_all_projects()
-            Retrieves all projects from the database.
+        get_projects_by_ids(project_ids: list)
+            Retrieves several projects by their IDs in a single query.
+
+        get_all_projects(after: int, limit: int)
+            Retrieves the projects from the database, ordered by ID.
+
+        count_projects()
+            Returns the number of projects that are not deleted.
+
+        get_purge_progress(project_id: int)
+            Retrieves the progress of the background purge of a deleted project.
+
+        active_projects()
+            Base query of the projects that are not deleted.
 
     Raises:
         ValueError
@@ -49,19 +93,30 @@ class ProjectService:
             If there's an HTTP-related error during the operation (e.g., project not found).
     """
     @staticmethod
-    def get_all_projects():
+    def get_all_projects(after: int = 0, limit: int = None):
         """
-        Retrieves all the projects stored in the database.
+        Retrieves the projects stored in the database, ordered by ID.
+
+        Parameters:
+        -----------
+        after : int
+            Only return the projects with a greater ID (keyset pagination).
+        limit : int
+            The maximum number of projects to return (all by default).
 
         Returns:
         --------
         list:
-            A list of all projects.
+            A list of the projects.
         dict:
             In case of error, returns a dictionary with the error message.
         """
-        projects = list(ProjectModel.select())  # Select all projects
-        return projects
+        def shard_projects(_shard):
+            if limit:
+                return statements.select("projects.page", after=after, limit=limit)
+            return list(_page(after))
+
+        return merge_sorted(fan_out(shard_projects), key=lambda row: row.id, limit=limit)
 
     @staticmethod
     def get_project(project_id: int):
@@ -80,11 +135,50 @@ class ProjectService:
         dict:
             In case of error, returns a dictionary with the error message.
         """
-        try:
-            project = ProjectModel.get(ProjectModel.id == project_id)  # Get project by ID
-            return project
-        except DoesNotExist as exc:
-            raise HTTPException(status_code=404, detail="Project not found") from exc
+        # Get project by ID
+        with on_project_shard(project_id):
+            project = statements.first("projects.get", id=project_id)
+        if project is None:
+            raise HTTPException(status_code=404, detail="Project not found")
+        return project
+
+    @staticmethod
+    def get_projects_by_ids(project_ids: list):
+        """
+        Retrieves several projects by their IDs.
+
+        Parameters:
+        -----------
+        project_ids : list
+            The IDs of the projects to retrieve.
+
+        Returns:
+        --------
+        dict:
+            The projects found, in request order, and the IDs that were not found.
+        """
+        groups = group_by_shard(project_ids)
+        return merge_found(
+            project_ids,
+            fan_out(
+                lambda shard: get_by_ids(
+                    ProjectModel, groups[shard], ProjectService.active_projects()
+                ),
+                groups,
+            ),
+        )
+
+    @staticmethod
+    def count_projects():
+        """
+        Returns the number of projects that are not deleted, from their counters.
+
+        Returns:
+        --------
+        int:
+            The number of projects.
+        """
+        return row_counts.total("projects")
 
     @staticmethod
     def create_project(project: Project = Body(...)):
@@ -103,14 +197,40 @@ class ProjectService:
         dict:
             In case of error, returns a dictionary with the error message.
         """
+        ProjectService.insert_project(project)
+        return project
+
+    @staticmethod
+    def insert_project(project: Project):
+        """
+        Stores a new project in the database.
+
+        Parameters:
+        -----------
+        project : Project
+            The project to create.
+
+        Returns:
+        --------
+        ProjectModel:
+            The created row, with its ID.
+        """
         try:
-            ProjectModel.create(
-                name=project.name,
-                description=project.description,
-                init_date=project.init_date,
-                finish_date=project.finish_date
+            # None when not sharded: the database assigns the ID
+            project_id = id_allocator.next_id("projects")
+            with on_project_shard(project_id or 0), shard_database.atomic():
+                created_project = ProjectModel.create(
+                    id=project_id,
+                    name=project.name,
+                    description=project.description,
+                    init_date=project.init_date,
+                    finish_date=project.finish_date
+                )
+                row_counts.adjust("projects", 1)
+            change_feed.publish(
+                "projects", "created", created_project.__data__, [created_project.id]
             )
-            return project
+            return created_project
         except DoesNotExist as exc:
             raise HTTPException(status_code=400, detail=str(exc)) from exc
         except IntegrityError as exc:
@@ -137,23 +257,58 @@ class ProjectService:
         dict:
             In case of error, returns a dictionary with the error message.
         """
-        try:
-            e_project = ProjectModel.get(ProjectModel.id == project_id)  # Get existing project
+        with on_project_shard(project_id):
+            # Get existing project
+            e_project = statements.first("projects.get", id=project_id)
+            if e_project is None:
+                raise HTTPException(status_code=404, detail="Project not exists")
 
-            e_project.name = project.name
-            e_project.description = project.description
-            e_project.init_date = project.init_date
-            e_project.finish_date = project.finish_date
+            e_project.__data__.update(project.model_dump())
+            statements.execute("projects.update", **e_project.__data__)  # Save changes
+        change_feed.publish("projects", "updated", e_project.__data__, [project_id])
+        return "Project updated successfully"
 
-            e_project.save()  # Save changes
-            return "Project updated successfully"
-        except DoesNotExist as exc:
-            raise HTTPException(status_code=404, detail="Project not exists") from exc
+    @staticmethod
+    def patch_project(project_id: int, project: ProjectUpdate = Body(...)):
+        """
+        Updates only the fields of a project that are sent and actually change.
+
+        The UPDATE statement only contains the changed columns, and nothing is
+        written at all when every value sent matches the stored one.
+
+        Parameters:
+        -----------
+        project_id : int
+            The ID of the project to update.
+        project : ProjectUpdate
+            The fields to change, provided in the request body.
+
+        Returns:
+        --------
+        ProjectModel:
+            The project, with its new values.
+        """
+        with on_project_shard(project_id):
+            e_project = statements.first("projects.get", id=project_id)
+            if e_project is None:
+                raise HTTPException(status_code=404, detail="Project not exists")
+
+            changes = changed_fields(e_project, project.model_dump(exclude_unset=True))
+            if changes:
+                apply_changes(e_project, changes)
+        if changes:
+            change_feed.publish("projects", "updated", e_project.__data__, [project_id])
+        return e_project
 
     @staticmethod
     def delete_project(project_id: int):
         """
-        Deletes a project from the database by its ID.
+        Deletes a project by its ID.
+
+        The project is only marked as deleted, which hides it and its tasks
+        from every read; the purger then removes its tasks in small batches
+        and finally the project itself, so no long cascading delete blocks
+        the other writers. Follow it with `GET /projects/{project_id}/purge`.
 
         Parameters:
         -----------
@@ -167,10 +322,99 @@ class ProjectService:
         dict:
             In case of error, returns a dictionary with the error message.
         """
-        try:
-            project = ProjectModel.get(ProjectModel.id == project_id)  # Get project by ID
+        with on_project_shard(project_id), shard_database.atomic():
+            deleted = statements.execute(
+                "projects.delete", id=project_id, deleted_at=datetime.now()
+            )
+            if deleted:
+                row_counts.adjust("projects", -1)
+                # Its tasks leave the lists with it
+                for name, model in (("tasks", TaskModel), ("tasks_archive", ArchivedTaskModel)):
+                    row_counts.adjust(
+                        name, -model.select().where(model.project_id == project_id).count()
+                    )
+        if not deleted:
+            raise HTTPException(status_code=404, detail="Project not found")
+        project_purger.wake()
+
+        change_feed.publish("projects", "deleted", {"id": project_id}, [project_id])
+        # Its tasks are hidden from now on and purged in the background
+        change_feed.publish(
+            "tasks", "project_deleted", {"project_id": project_id}, [project_id]
+        )
+        return "Project deleted successfully"
+
+    @staticmethod
+    def get_purge_progress(project_id: int):
+        """
+        Retrieves the progress of the background purge of a deleted project.
+
+        Parameters:
+        -----------
+        project_id : int
+            The ID of the deleted project.
+
+        Returns:
+        --------
+        dict:
+            The purge status, the number of tasks purged and left.
+        """
+        return project_purger.get_progress(project_id)
+
+    @staticmethod
+    def active_projects():
+        """
+        Builds the base query of the projects that are not deleted, in the
+        current shard.
+
+        Returns:
+        --------
+        SelectQuery:
+            A query over the projects whose `deleted_at` is not set.
+        """
+        return ProjectModel.select().where(ProjectModel.deleted_at.is_null())
+
+
+def _page(after, limit=None):
+    query = (
+        ProjectService.active_projects()
+        .where(ProjectModel.id > after)
+        .order_by(ProjectModel.id)
+    )
+    return query.limit(limit) if limit else query
+
+
+@row_counts.register("projects")
+def _count_projects():
+    return ProjectService.active_projects()
+
+
+@statements.register("projects.get", ProjectModel)
+def _get_project():
+    return ProjectService.active_projects().where(ProjectModel.id == Param("id")).limit(1)
+
+
+@statements.register("projects.page", ProjectModel)
+def _projects_page():
+    return _page(Param("after"), Param("limit"))
+
+
+@statements.register("projects.update", ProjectModel)
+def _update_project():
+    fields = (
+        ProjectModel.name,
+        ProjectModel.description,
+        ProjectModel.init_date,
+        ProjectModel.finish_date,
+    )
+    return ProjectModel.update({field: Param(field.name, field) for field in fields}).where(
+        ProjectModel.id == Param("id")
+    )
+
 
-            project.delete_instance()  # Delete project
-            return "Project deleted successfully"
-        except DoesNotExist as exc:  # Catching general exception if DoesNotExist is not available
-            raise HTTPException(status_code=404, detail="Project not found") from exc
+@statements.register("projects.delete", ProjectModel)
+def _delete_project():
+    # Soft delete: the purger removes the rows later
+    return ProjectModel.update(
+        {ProjectModel.deleted_at: Param("deleted_at", ProjectModel.deleted_at)}
+    ).where((ProjectModel.id == Param("id")) & ProjectModel.deleted_at.is_null())
@@ -0,0 +1,182 @@
+"""
+This module provides the background purger that removes deleted projects.
+
+`ProjectService.delete_project` only marks a project as deleted. The purger
+then deletes its tasks in small batches, each in its own short transaction
+and separated by a pause, so that removing a project with hundreds of
+thousands of tasks never holds locks long enough to stall the other writers.
+The archived tasks of the project are purged the same way, and the project
+row itself is deleted last. When sharded, each shard is scanned in turn.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from fastapi import HTTPException
+from database import (
+    shard_database,
+    shard_databases,
+    use_shard,
+    ArchivedTaskModel,
+    ProjectModel,
+    TaskModel,
+)
+from helpers.background_thread import BackgroundThread
+from helpers.sharding import fan_out, on_project_shard
+
+# Number of tasks deleted per transaction
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "1000"))
+
+# Seconds to pause between two batches, which caps the delete rate
+PURGE_BATCH_DELAY = float(os.getenv("PURGE_BATCH_DELAY", "0.1"))
+
+# Seconds between two scans for deleted projects when there is nothing to do
+PURGE_POLL_INTERVAL = float(os.getenv("PURGE_POLL_INTERVAL", "5"))
+
+# Number of finished purges remembered for the progress endpoint
+PURGE_HISTORY_SIZE = 1000
+
+
+class ProjectPurger(BackgroundThread):
+    """
+    Background thread that purges the projects marked as deleted.
+
+    Deleted projects left over by a previous process are picked up by the
+    first scan, and `stop()` lets the batch in progress commit.
+
+    Methods:
+        start()
+            Starts the purger thread.
+
+        stop(timeout: float)
+            Stops the purger after the current batch.
+
+        wake()
+            Starts the next scan right away instead of waiting for the poll interval.
+
+        get_progress(project_id: int)
+            Returns the purge progress of a deleted project.
+
+        stats()
+            Returns the totals of the purger.
+    """
+    thread_name = "project-purger"
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._current = None
+        self._purged_tasks = {}
+        self._finished = OrderedDict()
+        self._totals = {"projects_purged": 0, "tasks_purged": 0}
+
+    def _work(self):
+        while not self._stopping.is_set():
+            purged = False
+            for shard in shard_databases:
+                with use_shard(shard), shard_database.connection_context():
+                    project = (
+                        ProjectModel.select(ProjectModel.id)
+                        .where(ProjectModel.deleted_at.is_null(False))
+                        .order_by(ProjectModel.deleted_at)
+                        .first()
+                    )
+                    if project is not None:
+                        self._purge(project.id)
+                        purged = True
+            if purged:
+                continue
+            self._wakeup.wait(PURGE_POLL_INTERVAL)
+            self._wakeup.clear()
+
+    def _purge(self, project_id: int):
+        with self._lock:
+            self._current = project_id
+            self._purged_tasks.setdefault(project_id, 0)
+
+        for model in (TaskModel, ArchivedTaskModel):
+            if not self._purge_tasks(model, project_id):
+                return  # Stopping; the purge resumes on the next start
+
+        ProjectModel.delete().where(ProjectModel.id == project_id).execute()
+        with self._lock:
+            self._current = None
+            self._finished[project_id] = self._purged_tasks.pop(project_id)
+            if len(self._finished) > PURGE_HISTORY_SIZE:
+                self._finished.popitem(last=False)
+            self._totals["projects_purged"] += 1
+
+    def _purge_tasks(self, model, project_id: int):
+        # Returns False when interrupted by stop() before all tasks are deleted
+        while not self._stopping.is_set():
+            task_ids = [
+                task.id
+                for task in model.select(model.id)
+                .where(model.project_id == project_id)
+                .limit(PURGE_BATCH_SIZE)
+            ]
+            if not task_ids:
+                return True
+            with shard_database.atomic():
+                model.delete().where(model.id.in_(task_ids)).execute()
+            with self._lock:
+                self._purged_tasks[project_id] += len(task_ids)
+                self._totals["tasks_purged"] += len(task_ids)
+            self._stopping.wait(PURGE_BATCH_DELAY)
+        return False
+
+    def get_progress(self, project_id: int):
+        """
+        Returns the purge progress of a deleted project.
+
+        :param project_id: The ID of the deleted project.
+        :return: The status ("pending", "purging" or "purged"), the number of
+                 tasks already purged and, while the project still exists,
+                 the number of tasks left.
+        :raises HTTPException: 404 if the project is not being purged.
+        """
+        with on_project_shard(project_id):
+            project = ProjectModel.get_or_none(ProjectModel.id == project_id)
+            remaining = sum(
+                model.select().where(model.project_id == project_id).count()
+                for model in (TaskModel, ArchivedTaskModel)
+            )
+        with self._lock:
+            if project is None:
+                if project_id not in self._finished:
+                    raise HTTPException(status_code=404, detail="Purge not found")
+                return {
+                    "project_id": project_id,
+                    "status": "purged",
+                    "purged_tasks": self._finished[project_id],
+                    "remaining_tasks": 0,
+                }
+            purged = self._purged_tasks.get(project_id, 0)
+            status = "purging" if self._current == project_id else "pending"
+
+        if project.deleted_at is None:
+            raise HTTPException(status_code=404, detail="Project is not deleted")
+        return {
+            "project_id": project_id,
+            "status": status,
+            "deleted_at": project.deleted_at,
+            "purged_tasks": purged,
+            "remaining_tasks": remaining,
+        }
+
+    def stats(self):
+        """
+        Returns the totals of the purger.
+
+        :return: The number of projects and tasks purged since startup, the
+                 project being purged and the number of deleted projects waiting.
+        """
+        pending = sum(fan_out(
+            lambda _: ProjectModel.select().where(ProjectModel.deleted_at.is_null(False)).count()
+        ))
+        with self._lock:
+            return dict(self._totals, current_project=self._current, pending_projects=pending)
+
+
+project_purger = ProjectPurger()
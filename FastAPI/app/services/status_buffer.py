@@ -0,0 +1,228 @@
+"""
+This module provides the write-coalescing buffer behind `PATCH /tasks/{task_id}/status`.
+
+Status changes are collected in memory and written by a background thread
+every `STATUS_FLUSH_INTERVAL_MS` milliseconds, or as soon as
+`STATUS_FLUSH_MAX_ENTRIES` tasks are waiting, as a single UPDATE per
+transaction. When the same task changes several times before a flush, only
+the last status is written.
+
+`STATUS_DURABILITY` chooses when the client gets its answer:
+- "flushed" (default): once the change is committed;
+- "buffered": as soon as the change is in the buffer, at the risk of losing
+  the last few milliseconds of changes if the process dies.
+"""
+
+import os
+import threading
+import time
+
+from peewee import Case
+from fastapi import HTTPException
+from database import database, shard_database, TaskModel
+from helpers.background_thread import BackgroundThread
+from helpers.change_feed import change_feed
+from helpers.sharding import fan_out
+from services.task_service import TaskService
+
+STATUS_FLUSH_INTERVAL_MS = int(os.getenv("STATUS_FLUSH_INTERVAL_MS", "50"))
+STATUS_FLUSH_MAX_ENTRIES = int(os.getenv("STATUS_FLUSH_MAX_ENTRIES", "500"))
+STATUS_DURABILITY = os.getenv("STATUS_DURABILITY", "flushed").lower()
+
+# Seconds a request waits for its flush in "flushed" mode
+STATUS_FLUSH_TIMEOUT = float(os.getenv("STATUS_FLUSH_TIMEOUT", "5"))
+
+
+class _Flush:
+    """
+    The outcome of one flush, awaited by the requests whose changes it writes.
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+        self.missing = set()
+
+
+class StatusWriteBuffer(BackgroundThread):
+    """
+    In-memory buffer of task status changes, flushed in batches.
+
+    Methods:
+        start()
+            Starts the flusher thread.
+
+        stop(timeout: float)
+            Flushes what is left and stops the flusher thread.
+
+        submit(task_id: int, status: bool)
+            Buffers a status change and returns the flush that will write it.
+
+        stats()
+            Returns the flush metrics.
+    """
+    thread_name = "status-flusher"
+
+    def __init__(self, interval_ms: int, max_entries: int):
+        super().__init__()
+        self.interval = interval_ms / 1000
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flush = _Flush()
+        self._stats = {
+            "submitted": 0,
+            "coalesced": 0,
+            "flushes": 0,
+            "rows_written": 0,
+            "failed_flushes": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "last_batch_size": 0,
+        }
+
+    def submit(self, task_id: int, status: bool):
+        """
+        Buffers a status change; a later change of the same task replaces it.
+
+        :param task_id: The ID of the task.
+        :param status: The new status of the task.
+        :return: The flush that will write the change; wait on its `done` event
+                 to know when it is committed.
+        """
+        with self._lock:
+            self._stats["submitted"] += 1
+            if task_id in self._pending:
+                self._stats["coalesced"] += 1
+            self._pending[task_id] = status
+            flush = self._flush
+            if len(self._pending) >= self.max_entries:
+                self._wakeup.set()
+        return flush
+
+    def _work(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self._flush_pending()
+        self._flush_pending()
+
+    def _flush_pending(self):
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            flush, self._flush = self._flush, _Flush()
+
+        started = time.perf_counter()
+        try:
+            with database.connection_context():
+                rows = self._write(pending)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            flush.error = exc
+            with self._lock:
+                self._stats["failed_flushes"] += 1
+            flush.done.set()
+            return
+
+        flush.missing = set(pending) - set(rows)
+        flush.done.set()
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats["flushes"] += 1
+            self._stats["rows_written"] += len(rows)
+            self._stats["last_flush_ms"] = round(elapsed, 3)
+            self._stats["max_flush_ms"] = round(max(self._stats["max_flush_ms"], elapsed), 3)
+            self._stats["last_batch_size"] = len(pending)
+
+        for task_id, project_id in rows.items():
+            change_feed.publish(
+                "tasks",
+                "status_changed",
+                {"id": task_id, "project_id": project_id, "status": pending[task_id]},
+                [project_id],
+            )
+
+    @staticmethod
+    def _write(pending: dict):
+        # The tasks are spread over the shards: each shard updates the ones it holds
+        rows = {}
+        for shard_rows in fan_out(lambda _: StatusWriteBuffer._write_shard(pending)):
+            rows.update(shard_rows)
+        return rows
+
+    @staticmethod
+    def _write_shard(pending: dict):
+        with shard_database.atomic():
+            # Only tasks that exist and whose project is not deleted are updated
+            rows = {
+                task.id: task.project_id_id
+                for task in TaskService.active_tasks(TaskModel.id, TaskModel.project_id)
+                .where(TaskModel.id.in_(list(pending)))
+            }
+            if rows:
+                status = Case(
+                    TaskModel.id,
+                    [(task_id, TaskModel.status.db_value(pending[task_id])) for task_id in rows],
+                )
+                TaskModel.update(status=status).where(TaskModel.id.in_(list(rows))).execute()
+        return rows
+
+    def stats(self):
+        """
+        Returns the flush metrics.
+
+        :return: The number of changes submitted and coalesced, flushes,
+                 rows written, failed flushes, flush durations and the
+                 number of changes waiting.
+        """
+        with self._lock:
+            return dict(self._stats, pending=len(self._pending), durability=STATUS_DURABILITY)
+
+
+status_buffer = StatusWriteBuffer(STATUS_FLUSH_INTERVAL_MS, STATUS_FLUSH_MAX_ENTRIES)
+
+
+class TaskStatusService:
+    """
+    Service class for the lightweight, coalesced task status updates.
+
+    Methods:
+        update_status(task_id: int, status: bool)
+            Buffers a status change and, in "flushed" mode, waits for its commit.
+
+    Raises:
+        HTTPException
+            If the task is not found or the change could not be written.
+    """
+    # pylint: disable=too-few-public-methods
+    @staticmethod
+    def update_status(task_id: int, status: bool):
+        """
+        Changes the status of a task through the write buffer.
+
+        Parameters:
+        -----------
+        task_id : int
+            The ID of the task.
+        status : bool
+            The new status of the task.
+
+        Returns:
+        --------
+        dict:
+            The change, and whether it is already committed (`flushed`).
+        """
+        flush = status_buffer.submit(task_id, status)
+        if STATUS_DURABILITY == "buffered":
+            return {"id": task_id, "status": status, "flushed": False}
+
+        if not flush.done.wait(STATUS_FLUSH_TIMEOUT):
+            raise HTTPException(status_code=504, detail="Timed out waiting for the status write")
+        if flush.error is not None:
+            raise HTTPException(
+                status_code=500, detail="An error occurred while updating the task status"
+            ) from flush.error
+        if task_id in flush.missing:
+            raise HTTPException(status_code=404, detail="Task not found")
+        return {"id": task_id, "status": status, "flushed": True}
@@ -2,11 +2,46 @@
 This module provides services to manage tasks in the database.
 
 It includes functionalities for retrieving, creating, updating, and deleting tasks.
+Tasks of deleted projects are hidden from every read until the purger removes them.
+Reads only look at the 'tasks' table unless they ask for the archived tasks too
+(see services/archive_service.py).
+
+Tasks live in the shard of their project (see helpers/sharding.py). As the
+routes only know the ID of a task, a task is looked up on every shard at once,
+and moving it to a project of another shard moves the row between shards.
+
+The by-ID lookups, updates and deletes and the pages of the list run as
+precompiled statements (see helpers/statement_cache.py). Creates, deletes
+and moves keep the task counters up to date (see helpers/row_counts.py).
 """
-from peewee import DoesNotExist, IntegrityError
+from peewee import IntegrityError
 from fastapi import Body, HTTPException
-from models.task import Task
-from database import TaskModel
+from models.task import Task, TaskUpdate
+from database import (
+    ArchivedTaskModel,
+    EmployeeModel,
+    ProjectModel,
+    TaskModel,
+    TaskSearchModel,
+    is_sharded,
+    is_sqlite,
+    shard_database,
+    use_shard,
+)
+from helpers.batch_lookup import get_by_ids, merge_found
+from helpers.change_feed import change_feed
+from helpers.partial_update import apply_changes, changed_fields
+from helpers.row_counts import row_counts
+from helpers.statement_cache import Param, statements
+from helpers.sharding import (
+    fan_out,
+    first_found,
+    id_allocator,
+    merge_sorted,
+    on_project_shard,
+    shard_for,
+)
+from services.project_service import ProjectService
 
 class TaskService:
     """
@@ -16,42 +51,100 @@ class TaskService:
     getting a specific task by ID, creating, updating, and deleting tasks in the database.
     
     Methods:
-        get_all_tasks()
-            Retrieves all the tasks from the database.
+        get_all_tasks(include_archived: bool, after: int, limit: int)
+            Retrieves the tasks from the database, ordered by ID.
             
-        get_task(task_id: int)
+        get_task(task_id: int, include_archived: bool)
             Retrieves a specific task by its ID.
+
+        get_tasks_by_ids(task_ids: list, include_archived: bool)
+            Retrieves several tasks by their IDs in a single query.
+
+        count_tasks(include_archived: bool)
+            Returns the number of tasks.
+
+        search_tasks(q: str, page: int, size: int)
+            Full-text search over the title and description of the tasks.
+
+        count_matches(q: str, estimate: bool)
+            Returns the number of tasks matching a search.
             
         create_task(task: Task)
             Creates a new task and stores it in the database.
+
+        insert_task(task: Task)
+            Creates a new task and returns the stored row.
             
         update_task(task_id: int, task: Task)
             Updates an existing task in the database.
+
+        patch_task(task_id: int, task: TaskUpdate)
+            Updates only the given fields of a task.
             
         delete_task(task_id: int)
             Deletes a task from the database by its ID.
 
+        active_tasks(*fields)
+            Base query of the tasks whose project is not deleted.
+
+        archived_tasks(*fields)
+            Base query of the archived tasks whose project is not deleted.
+
+        check_project(project_id: int)
+            Ensures a project exists and is not deleted.
+
+        check_employee(employee_id: int)
+            Ensures an employee exists, when the database cannot check it.
+
+        locate_task(task_id: int, archived: bool)
+            Finds the shard holding a task.
+
     Raises:
         HTTPException
             If a task is not found or if there is an error during any operation.
     """
     @staticmethod
-    def get_all_tasks():
+    def get_all_tasks(include_archived: bool = False, after: int = 0, limit: int = None):
         """
-        Retrieves all the tasks stored in the database.
+        Retrieves the tasks stored in the database, ordered by ID.
+
+        Parameters:
+        -----------
+        include_archived : bool
+            Whether to also return the archived tasks.
+        after : int
+            Only return the tasks with a greater ID (keyset pagination).
+        limit : int
+            The maximum number of tasks to return (all by default).
 
         Returns:
         --------
         list:
-            A list of all tasks.
+            A list of the tasks.
         dict:
             In case of error, returns a dictionary with the error message.
         """
-        tasks = list(TaskModel.select())  # Select all tasks
-        return tasks
+        def by_id(row):
+            return row.id
+
+        pages = [(TaskModel, "tasks.page")]
+        if include_archived:
+            pages.append((ArchivedTaskModel, "tasks_archive.page"))
+
+        def shard_tasks(_shard):
+            tasks = []
+            for model, statement in pages:
+                if limit:
+                    tasks.append(statements.select(statement, after=after, limit=limit))
+                else:
+                    # Reading every row costs far more than building the query
+                    tasks.append(list(_page(model, after)))
+            return merge_sorted(tasks, key=by_id, limit=limit)
+
+        return merge_sorted(fan_out(shard_tasks), key=by_id, limit=limit)
 
     @staticmethod
-    def get_task(task_id: int):
+    def get_task(task_id: int, include_archived: bool = False):
         """
         Retrieves a specific task by its ID.
 
@@ -59,6 +152,8 @@ class TaskService:
         -----------
         task_id : int
             The ID of the task to retrieve.
+        include_archived : bool
+            Whether to also look for the task in the archive.
 
         Returns:
         --------
@@ -67,11 +162,141 @@ class TaskService:
         dict:
             In case of error, returns a dictionary with the error message.
         """
-        try:
-            task = TaskModel.get(TaskModel.id == task_id)  # Get task by ID
-            return task
-        except DoesNotExist as exc:
-            raise HTTPException(status_code=404, detail="Task not found") from exc
+        _, task = TaskService.locate_task(task_id)  # Get task by ID
+        if task is None and include_archived:
+            _, task = TaskService.locate_task(task_id, archived=True)
+        if task is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        return task
+
+    @staticmethod
+    def get_tasks_by_ids(task_ids: list, include_archived: bool = False):
+        """
+        Retrieves several tasks by their IDs.
+
+        Parameters:
+        -----------
+        task_ids : list
+            The IDs of the tasks to retrieve.
+        include_archived : bool
+            Whether to also look for the tasks in the archive.
+
+        Returns:
+        --------
+        dict:
+            The tasks found, in request order, and the IDs that were not found.
+        """
+        found = merge_found(
+            task_ids,
+            fan_out(lambda _: get_by_ids(TaskModel, task_ids, TaskService.active_tasks())),
+        )
+        if not include_archived or not found["not_found"]:
+            return found
+
+        # Only the IDs missing from the hot table are looked up in the archive
+        not_found = found["not_found"]
+        return merge_found(
+            task_ids,
+            [found] + fan_out(
+                lambda _: get_by_ids(ArchivedTaskModel, not_found, TaskService.archived_tasks())
+            ),
+        )
+
+    @staticmethod
+    def count_tasks(include_archived: bool = False):
+        """
+        Returns the number of tasks whose project is not deleted, from their
+        counters.
+
+        Parameters:
+        -----------
+        include_archived : bool
+            Whether to also count the archived tasks.
+
+        Returns:
+        --------
+        int:
+            The number of tasks.
+        """
+        total = row_counts.total("tasks")
+        if include_archived:
+            total += row_counts.total("tasks_archive")
+        return total
+
+    @staticmethod
+    def search_tasks(q: str, page: int = 1, size: int = 20):
+        """
+        Searches tasks by keyword in their title and description.
+
+        Uses the MySQL FULLTEXT index (natural language mode) or the SQLite
+        FTS5 index, and returns the best matches first. When sharded, every
+        shard returns its best matches up to the requested page, which are
+        merged by score.
+
+        Parameters:
+        -----------
+        q : str
+            The keywords to search for.
+        page : int
+            The page of results to return, starting at 1.
+        size : int
+            The number of results per page.
+
+        Returns:
+        --------
+        list:
+            The matching tasks of the requested page, each with its relevance `score`.
+        """
+        if not q.strip():
+            return []
+
+        def shard_matches(_shard):
+            query, rank = _matches(q)
+            if is_sqlite():
+                query = query.order_by(rank)  # Lower is better in FTS5
+            else:
+                query = query.order_by(rank.desc())
+            if not is_sharded():
+                return list(query.paginate(page, size))
+            return list(query.limit(page * size))
+
+        matches = fan_out(shard_matches)
+        if not is_sharded():
+            return matches[0]
+        return merge_sorted(
+            matches,
+            key=lambda task: task.score,
+            reverse=not is_sqlite(),
+            offset=(page - 1) * size,
+            limit=size,
+        )
+
+    @staticmethod
+    def count_matches(q: str, estimate: bool = False):
+        """
+        Returns the number of tasks matching a search.
+
+        The exact count joins every match to its task and project, like the
+        search. The estimate only counts the matches in the full-text index,
+        which includes the tasks of the deleted projects not purged yet.
+
+        Parameters:
+        -----------
+        q : str
+            The keywords to search for.
+        estimate : bool
+            Whether an estimate is enough.
+
+        Returns:
+        --------
+        int:
+            The number of matching tasks.
+        """
+        if not q.strip():
+            return 0
+        if estimate:
+            return sum(fan_out(lambda _: _index_matches(q).count()))
+        return sum(fan_out(lambda _: _matches(q)[0].count()))
 
     @staticmethod
     def create_task(task: Task = Body(...)):
@@ -90,16 +315,40 @@ class TaskService:
         dict:
             In case of error, returns a dictionary with the error message.
         """
+        TaskService.insert_task(task)
+        return task
+
+    @staticmethod
+    def insert_task(task: Task):
+        """
+        Checks the references of a new task and stores it in the database.
+
+        Parameters:
+        -----------
+        task : Task
+            The task to create.
+
+        Returns:
+        --------
+        TaskModel:
+            The created row, with its ID.
+        """
+        TaskService.check_project(task.project_id)
+        TaskService.check_employee(task.employee_id)
         try:
-            TaskModel.create(
-                project_id=task.project_id,
-                employee_id=task.employee_id,
-                title=task.title,
-                description=task.description,
-                deadline=task.deadline,
-                status=task.status
-            )
-            return task
+            with on_project_shard(task.project_id), shard_database.atomic():
+                created_task = TaskModel.create(
+                    id=id_allocator.next_id("tasks"),
+                    project_id=task.project_id,
+                    employee_id=task.employee_id,
+                    title=task.title,
+                    description=task.description,
+                    deadline=task.deadline,
+                    status=task.status
+                )
+                row_counts.adjust("tasks", 1)
+            change_feed.publish("tasks", "created", created_task.__data__, [task.project_id])
+            return created_task
         except ValueError as exc:
             raise HTTPException(status_code=400, detail=str(exc)) from exc
         except IntegrityError as exc:
@@ -126,20 +375,71 @@ class TaskService:
         dict:
             In case of error, returns a dictionary with the error message.
         """
-        try:
-            e_task = TaskModel.get(TaskModel.id == task_id)  # Get existing task
+        # Get existing task
+        shard, e_task = TaskService.locate_task(task_id)
+        if e_task is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        TaskService.check_project(task.project_id)
+        TaskService.check_employee(task.employee_id)
+        previous_project_id = e_task.project_id_id
+
+        if shard_for(task.project_id) is not shard:
+            TaskService._move_task(shard, e_task, task.model_dump())
+        else:
+            with use_shard(shard):
+                e_task.__data__.update(task.model_dump())
+                statements.execute("tasks.update", **e_task.__data__)  # Save changes
+        change_feed.publish(
+            "tasks", "updated", e_task.__data__, [previous_project_id, task.project_id]
+        )
+        return "Task updated successfully"
+
+    @staticmethod
+    def patch_task(task_id: int, task: TaskUpdate = Body(...)):
+        """
+        Updates only the fields of a task that are sent and actually change.
+
+        The UPDATE statement only contains the changed columns, and nothing is
+        written at all when every value sent matches the stored one.
+
+        Parameters:
+        -----------
+        task_id : int
+            The ID of the task to update.
+        task : TaskUpdate
+            The fields to change, provided in the request body.
 
-            e_task.project_id = task.project_id
-            e_task.employee_id = task.employee_id
-            e_task.title = task.title
-            e_task.description = task.description
-            e_task.deadline = task.deadline
-            e_task.status = task.status
+        Returns:
+        --------
+        TaskModel:
+            The task, with its new values.
+        """
+        shard, e_task = TaskService.locate_task(task_id)
+        if e_task is None:
+            raise HTTPException(status_code=404, detail="Task not found")
 
-            e_task.save()  # Save changes
-            return "Task updated successfully"
-        except DoesNotExist as exc:  # Catching general exception if DoesNotExist is not available
-            raise HTTPException(status_code=404, detail="Task not found") from exc
+        changes = changed_fields(e_task, task.model_dump(exclude_unset=True))
+        if not changes:
+            return e_task
+        if "project_id" in changes:
+            TaskService.check_project(changes["project_id"])
+        if "employee_id" in changes:
+            TaskService.check_employee(changes["employee_id"])
+        previous_project_id = e_task.project_id_id
+        try:
+            if shard_for(changes.get("project_id", previous_project_id)) is not shard:
+                TaskService._move_task(shard, e_task, changes)
+            else:
+                with use_shard(shard):
+                    apply_changes(e_task, changes)
+        except IntegrityError as exc:
+            raise HTTPException(
+            status_code=400, detail="An error occurred while updating the task"
+        ) from exc
+        change_feed.publish(
+            "tasks", "updated", e_task.__data__, [previous_project_id, e_task.project_id_id]
+        )
+        return e_task
 
     @staticmethod
     def delete_task(task_id: int):
@@ -158,10 +458,239 @@ class TaskService:
         dict:
             In case of error, returns a dictionary with the error message.
         """
-        try:
-            task = TaskModel.get(TaskModel.id == task_id)  # Get task by ID
+        shard, task = TaskService.locate_task(task_id)  # Get task by ID
+        if task is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+
+        with use_shard(shard), shard_database.atomic():
+            deleted = statements.execute("tasks.delete", id=task.id)  # Delete task
+            row_counts.adjust("tasks", -deleted)
+        change_feed.publish(
+            "tasks",
+            "deleted",
+            {"id": task.id, "project_id": task.project_id_id},
+            [task.project_id_id],
+        )
+        return "Task deleted successfully"
+
+    @staticmethod
+    def _move_task(source, e_task: TaskModel, changes: dict):
+        # The row is written to the shard of its new project before being
+        # removed from the old one: if the delete fails, the task is left in
+        # both shards rather than lost.
+        data = dict(e_task.__data__, **changes)
+        with on_project_shard(data["project_id"]), shard_database.atomic():
+            TaskModel.create(**data)
+            row_counts.adjust("tasks", 1)
+        with use_shard(source), shard_database.atomic():
+            deleted = TaskModel.delete().where(TaskModel.id == e_task.id).execute()
+            row_counts.adjust("tasks", -deleted)
+        for name, value in changes.items():
+            field = getattr(TaskModel, name)
+            e_task.__data__[name] = field.python_value(field.db_value(value))
+
+    @staticmethod
+    def active_tasks(*fields):
+        """
+        Builds the base query of the tasks whose project is not deleted, in
+        the current shard.
+
+        Parameters:
+        -----------
+        *fields :
+            The columns to select (defaults to the whole task).
+
+        Returns:
+        --------
+        SelectQuery:
+            A query over the tasks of the active projects.
+        """
+        return (
+            TaskModel.select(*(fields or (TaskModel,)))
+            .join(ProjectModel, on=TaskModel.project_id == ProjectModel.id)
+            .where(ProjectModel.deleted_at.is_null())
+        )
+
+    @staticmethod
+    def archived_tasks(*fields):
+        """
+        Builds the base query of the archived tasks whose project is not
+        deleted, in the current shard.
+
+        Parameters:
+        -----------
+        *fields :
+            The columns to select (defaults to the whole archived task).
+
+        Returns:
+        --------
+        SelectQuery:
+            A query over the archived tasks of the active projects.
+        """
+        return (
+            ArchivedTaskModel.select(*(fields or (ArchivedTaskModel,)))
+            .join(ProjectModel, on=ArchivedTaskModel.project_id == ProjectModel.id)
+            .where(ProjectModel.deleted_at.is_null())
+        )
+
+    @staticmethod
+    def check_project(project_id: int):
+        """
+        Ensures a task is attached to an existing, non-deleted project.
+
+        Parameters:
+        -----------
+        project_id : int
+            The ID of the project of the task.
+
+        Raises:
+        -------
+        HTTPException:
+            400 error if the project does not exist or was deleted.
+        """
+        with on_project_shard(project_id):
+            exists = (
+                ProjectService.active_projects().where(ProjectModel.id == project_id).exists()
+            )
+        if not exists:
+            raise HTTPException(status_code=400, detail="Project not found")
+
+    @staticmethod
+    def check_employee(employee_id: int):
+        """
+        Ensures a task is assigned to an existing employee.
+
+        Only needed when sharded: the employees live in the main database, so
+        the shards have no foreign key to check it.
+
+        Parameters:
+        -----------
+        employee_id : int
+            The ID of the employee of the task.
+
+        Raises:
+        -------
+        HTTPException:
+            400 error if the employee does not exist.
+        """
+        if is_sharded() and EmployeeModel.get_or_none(EmployeeModel.id == employee_id) is None:
+            raise HTTPException(status_code=400, detail="Employee not found")
+
+    @staticmethod
+    def locate_task(task_id: int, archived: bool = False):
+        """
+        Finds the shard holding a task, looking at every shard at once.
+
+        Parameters:
+        -----------
+        task_id : int
+            The ID of the task.
+        archived : bool
+            Whether to look for the task in the archive instead.
+
+        Returns:
+        --------
+        tuple:
+            The shard and the task of an active project, or (None, None).
+        """
+        if archived:
+            return first_found(
+                lambda _: TaskService.archived_tasks()
+                .where(ArchivedTaskModel.id == task_id)
+                .first()
+            )
+        return first_found(lambda _: statements.first("tasks.get", id=task_id))
+
+
+def _matches(q: str):
+    # Tasks matching a search in the current shard, with their relevance
+    if is_sqlite():
+        rank = TaskSearchModel.bm25()
+        query = (
+            TaskService.active_tasks(TaskModel, rank.alias("score"))
+            .switch(TaskModel)
+            .join(TaskSearchModel, on=TaskSearchModel.rowid == TaskModel.id)
+            .where(TaskSearchModel.match(_fts_terms(q)))
+        )
+        return query, rank
+    # Not loaded at startup when running on SQLite
+    from playhouse.mysql_ext import Match  # pylint: disable=import-outside-toplevel
+
+    rank = Match((TaskModel.title, TaskModel.description), q)
+    return TaskService.active_tasks(TaskModel, rank.alias("score")).where(rank), rank
+
+
+def _index_matches(q: str):
+    # Matches of a search in the full-text index alone, without the join
+    # that drops the tasks of the deleted projects
+    if is_sqlite():
+        return TaskSearchModel.select(TaskSearchModel.rowid).where(
+            TaskSearchModel.match(_fts_terms(q))
+        )
+    from playhouse.mysql_ext import Match  # pylint: disable=import-outside-toplevel
+
+    return TaskModel.select(TaskModel.id).where(
+        Match((TaskModel.title, TaskModel.description), q)
+    )
+
+
+def _fts_terms(q: str):
+    # Quote every term so user input cannot be parsed as FTS5 syntax
+    return " ".join('"' + term.replace('"', '""') + '"' for term in q.split())
+
+
+def _page(model, after, limit=None):
+    # Filtering out the few deleted projects, rather than joining the
+    # active ones, lets the pages walk the primary key without a sort
+    deleted = ProjectModel.select(ProjectModel.id).where(ProjectModel.deleted_at.is_null(False))
+    query = (
+        model.select()
+        .where((model.id > after) & model.project_id.not_in(deleted))
+        .order_by(model.id)
+    )
+    return query.limit(limit) if limit else query
+
+
+@row_counts.register("tasks")
+def _count_tasks():
+    return TaskService.active_tasks()
+
+
+@row_counts.register("tasks_archive")
+def _count_archived_tasks():
+    return TaskService.archived_tasks()
+
+
+@statements.register("tasks.get", TaskModel)
+def _get_task():
+    return TaskService.active_tasks().where(TaskModel.id == Param("id")).limit(1)
+
+
+@statements.register("tasks.page", TaskModel)
+def _tasks_page():
+    return _page(TaskModel, Param("after"), Param("limit"))
+
+
+@statements.register("tasks_archive.page", ArchivedTaskModel)
+def _archived_tasks_page():
+    return _page(ArchivedTaskModel, Param("after"), Param("limit"))
+
+
+@statements.register("tasks.update", TaskModel)
+def _update_task():
+    fields = (
+        TaskModel.project_id,
+        TaskModel.employee_id,
+        TaskModel.title,
+        TaskModel.description,
+        TaskModel.deadline,
+        TaskModel.status,
+    )
+    return TaskModel.update({field: Param(field.name, field) for field in fields}).where(
+        TaskModel.id == Param("id")
+    )
+
 
-            task.delete_instance()  # Delete task
-            return "Task deleted successfully"
-        except DoesNotExist as exc:  # Catching general exception if DoesNotExist is not available
-            raise HTTPException(status_code=404, detail="Task not found") from exc
+@statements.register("tasks.delete", TaskModel)
+def _delete_task():
+    return TaskModel.delete().where(TaskModel.id == Param("id"))